@@ -0,0 +1,100 @@
+"""Micro-benchmarks: ClassMatcher vs. the alternation regex it replaced, and the
+single-pass ClassMatcher.scan vs. a replace-then-findall second pass.
+
+Run with:
+
+    python benchmarks/bench_matcher.py
+"""
+
+import random
+import re
+import timeit
+
+from pegasus_cli.migrate_css import ANY_PG_CLASS_PATTERN, ClassMatcher
+
+MAP_SIZES = (50, 500, 5000)
+WORDS = ("flex", "items-center", "text-sm", "px-4", "btn", "card", "gap-2", "mt-2")
+
+
+def build_regex(names):
+    """The alternation regex build_pattern used to compile."""
+    names = sorted(names, key=len, reverse=True)
+    return re.compile(r"(" + "|".join(re.escape(n) for n in names) + r")(?![a-z0-9-])")
+
+
+def make_names(count):
+    return [f"pg-component-{i}" for i in range(count // 2)] + [
+        f"pg-component-{i}-variant" for i in range(count - count // 2)
+    ]
+
+
+def make_content(names, lines=5000, seed=0):
+    rng = random.Random(seed)
+    candidates = names + ["pg-not-mapped", "pg-component"]
+    out = []
+    for _ in range(lines):
+        classes = rng.sample(WORDS, 3)
+        if rng.random() < 0.3:
+            classes.append(rng.choice(candidates))
+        out.append(f'<div class="{" ".join(classes)}">content</div>\n')
+    return "".join(out)
+
+
+def bench(size, number=5):
+    """Return (regex ms, matcher ms) per substitution for a map of size entries."""
+    names = make_names(size)
+    content = make_content(names)
+    regex = build_regex(names)
+    matcher = ClassMatcher(names)
+
+    def regex_sub():
+        return regex.sub(lambda m: m.group(1).upper(), content)
+
+    def matcher_sub():
+        return matcher.sub(str.upper, content)
+
+    assert regex_sub() == matcher_sub()
+    regex_time = timeit.timeit(regex_sub, number=number) / number
+    matcher_time = timeit.timeit(matcher_sub, number=number) / number
+    return regex_time * 1000, matcher_time * 1000
+
+
+def bench_scan(size, number=5):
+    """Return (two-pass ms, scan ms) to find replacements and unmapped classes."""
+    names = make_names(size)
+    content = make_content(names)
+    matcher = ClassMatcher(names)
+
+    def two_pass():
+        new_content = matcher.sub(str.upper, content)
+        unmapped = ANY_PG_CLASS_PATTERN.findall(new_content)
+        return {n for n in unmapped if n not in matcher.names}
+
+    def single_pass():
+        return matcher.scan(content)[1]
+
+    assert two_pass() == single_pass()
+    two_pass_time = timeit.timeit(two_pass, number=number) / number
+    scan_time = timeit.timeit(single_pass, number=number) / number
+    return two_pass_time * 1000, scan_time * 1000
+
+
+def _print_table(title, columns, bench_fn):
+    print(title)
+    print(f"{'entries':>8} {columns[0]:>14} {columns[1]:>14} {'speedup':>9}")
+    for size in MAP_SIZES:
+        before_ms, after_ms = bench_fn(size)
+        print(
+            f"{size:>8} {before_ms:>14.2f} {after_ms:>14.2f} "
+            f"{before_ms / after_ms:>8.1f}x"
+        )
+    print()
+
+
+def main():
+    _print_table("Replacement", ("regex (ms)", "matcher (ms)"), bench)
+    _print_table("Replacement + unmapped", ("two-pass (ms)", "scan (ms)"), bench_scan)
+
+
+if __name__ == "__main__":
+    main()
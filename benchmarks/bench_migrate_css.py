@@ -0,0 +1,218 @@
+"""Benchmark migrate-css against a synthetic Pegasus-like project.
+
+Generates a project tree with a tailwind.css class map and templates/JS files
+containing a configurable density of pg- classes, then times each stage of
+migrate-css and the full command end to end. Results are written as JSON, so they
+can be compared across releases.
+
+Run with, e.g.:
+
+    python benchmarks/bench_migrate_css.py --files 2000 --file-size 8192 \\
+        --density 0.05 --map-size 300 --output results.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from pegasus_cli.migrate_css import (
+    DEFAULT_CSS_FILE,
+    build_pattern,
+    find_files,
+    migrate_file,
+    parse_tailwind_css,
+)
+
+FILE_KINDS = (
+    ("templates/{app}/{name}.html", '<div class="{classes}">{text}</div>\n'),
+    (
+        "apps/{app}/templates/{app}/{name}.html",
+        '<span class="{classes}">{text}</span>\n',
+    ),
+    ("assets/javascript/{app}/{name}.js", 'el.className = "{classes}"; // {text}\n'),
+    ("assets/javascript/{app}/{name}.jsx", '<div className="{classes}">{text}</div>\n'),
+)
+PLAIN_CLASSES = ("flex", "items-center", "gap-2", "text-sm", "px-4", "py-2", "rounded")
+WORDS = ("lorem", "ipsum", "dolor", "sit", "amet", "consectetur", "adipiscing")
+
+
+def generate_project(
+    root: Path,
+    files: int = 1000,
+    file_size: int = 4096,
+    density: float = 0.05,
+    map_size: int = 200,
+    seed: int = 0,
+) -> dict:
+    """Write a synthetic project under root and return a description of it.
+
+    density is the fraction of class attributes containing a pg- class. One in ten
+    of those uses a class with no mapping, so the unmigrated report is exercised too.
+    """
+    rng = random.Random(seed)
+    names = [f"pg-component-{i}" for i in range(map_size)]
+    css_file = root / DEFAULT_CSS_FILE
+    css_file.parent.mkdir(parents=True, exist_ok=True)
+    css_file.write_text(
+        "".join(
+            f".{name} {{\n  @apply {rng.choice(PLAIN_CLASSES)} btn-{i};\n}}\n\n"
+            for i, name in enumerate(names)
+        )
+    )
+
+    total_bytes = 0
+    for i in range(files):
+        pattern, line_template = FILE_KINDS[i % len(FILE_KINDS)]
+        path = root / pattern.format(app=f"app{i % 20}", name=f"file{i}")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        lines = []
+        size = 0
+        while size < file_size:
+            classes = rng.sample(PLAIN_CLASSES, 3)
+            if rng.random() < density:
+                if rng.random() < 0.1:
+                    classes.append(f"pg-unmapped-{rng.randrange(10)}")
+                else:
+                    classes.append(rng.choice(names))
+            line = line_template.format(
+                classes=" ".join(classes), text=" ".join(rng.sample(WORDS, 4))
+            )
+            lines.append(line)
+            size += len(line)
+        content = "".join(lines)
+        path.write_text(content)
+        total_bytes += len(content.encode())
+
+    return {
+        "files": files,
+        "file_size": file_size,
+        "density": density,
+        "map_size": map_size,
+        "seed": seed,
+        "total_bytes": total_bytes,
+    }
+
+
+def _timed(fn, *args, **kwargs):
+    """Run fn, returning (result, seconds, peak traced memory in bytes)."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def _throughput(seconds: float, files: int, total_bytes: int) -> dict:
+    return {
+        "seconds": round(seconds, 6),
+        "files_per_second": round(files / seconds, 1) if seconds else None,
+        "mb_per_second": round(total_bytes / seconds / 1e6, 2) if seconds else None,
+    }
+
+
+def run_benchmarks(root: Path, project: dict, jobs: int | None = None) -> dict:
+    css_file = root / DEFAULT_CSS_FILE
+    results = {}
+
+    css_class_map, seconds, peak = _timed(parse_tailwind_css, css_file)
+    results["parse_tailwind_css"] = {"seconds": round(seconds, 6), "peak_bytes": peak}
+
+    matcher, seconds, peak = _timed(build_pattern, css_class_map)
+    results["build_pattern"] = {"seconds": round(seconds, 6), "peak_bytes": peak}
+
+    dirs = tuple(root / d for d in ("templates", "assets/javascript", "apps"))
+    files, seconds, peak = _timed(find_files, dirs)
+    results["find_files"] = {
+        "seconds": round(seconds, 6),
+        "peak_bytes": peak,
+        "files": len(files),
+    }
+
+    def migrate_all():
+        return [migrate_file(f, matcher, css_class_map, dry_run=True) for f in files]
+
+    migrated, seconds, peak = _timed(migrate_all)
+    results["migrate_file"] = {
+        **_throughput(seconds, len(files), project["total_bytes"]),
+        "peak_bytes": peak,
+        "replacements": sum(len(replacements) for replacements, _ in migrated),
+    }
+
+    command = [
+        sys.executable,
+        "-m",
+        "pegasus_cli",
+        "migrate-css",
+        "--dry-run",
+        "--no-manifest",
+        "--report",
+        "summary",
+    ]
+    if jobs:
+        command += ["--jobs", str(jobs)]
+    start = time.perf_counter()
+    subprocess.run(command, cwd=root, check=True, capture_output=True)
+    seconds = time.perf_counter() - start
+    results["end_to_end"] = {
+        **_throughput(seconds, len(files), project["total_bytes"]),
+        "jobs": jobs,
+        "peak_rss_bytes": _children_peak_rss(),
+    }
+    return results
+
+
+def _children_peak_rss() -> int | None:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=1000)
+    parser.add_argument("--file-size", type=int, default=4096, help="Bytes per file")
+    parser.add_argument(
+        "--density", type=float, default=0.05, help="Fraction of lines with pg- classes"
+    )
+    parser.add_argument("--map-size", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--jobs", type=int, default=None, help="--jobs for the command")
+    parser.add_argument("--output", type=Path, help="Write JSON here instead of stdout")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        project = generate_project(
+            root, args.files, args.file_size, args.density, args.map_size, args.seed
+        )
+        results = {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "project": project,
+            "results": run_benchmarks(root, project, args.jobs),
+        }
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        args.output.write_text(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
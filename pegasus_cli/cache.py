@@ -0,0 +1,111 @@
+"""A small on-disk cache under ~/.pegasus/cache for derived data."""
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+
+CACHE_DIR = Path.home() / ".pegasus" / "cache"
+
+
+def content_key(*parts: bytes | str) -> str:
+    """Return a hex digest identifying parts, for use as a cache key."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode() if isinstance(part, str) else part)
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def cache_path(namespace: str, key: str, suffix: str = ".json") -> Path:
+    return CACHE_DIR / namespace / f"{key}{suffix}"
+
+
+def read_json(namespace: str, key: str):
+    """Return the data cached under key, or None if it's missing or unreadable."""
+    try:
+        with open(cache_path(namespace, key), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_json(namespace: str, key: str, data):
+    """Cache data under key. Failures are ignored, since the cache is optional."""
+    path = cache_path(namespace, key)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    except OSError:
+        pass
+
+
+def read_bytes(namespace: str, key: str, suffix: str):
+    """Return the bytes cached under key, or None if they're missing.
+
+    The file's mtime is updated so that prune() evicts the least recently used
+    entries first.
+    """
+    path = cache_path(namespace, key, suffix)
+    try:
+        data = path.read_bytes()
+    except OSError:
+        return None
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return data
+
+
+def write_bytes(namespace: str, key: str, suffix: str, data: bytes):
+    """Cache data under key. Failures are ignored, since the cache is optional."""
+    path = cache_path(namespace, key, suffix)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    except OSError:
+        pass
+
+
+def prune(namespace: str, max_size: int):
+    """Delete the least recently used entries in namespace until the rest fit in
+    max_size bytes."""
+    entries = []
+    total = 0
+    try:
+        with os.scandir(CACHE_DIR / namespace) as it:
+            for entry in it:
+                if entry.name.endswith(".tmp"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+                total += stat.st_size
+    except OSError:
+        return
+    entries.sort()
+    for _, size, path in entries:
+        if total <= max_size:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
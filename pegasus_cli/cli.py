@@ -1,5 +1,6 @@
 import click
 
+from .css_index import css_index
 from .migrate_css import migrate_css
 from .projects import auth, projects
 from .startapp import startapp
@@ -15,3 +16,4 @@ cli.add_command(startapp)
 cli.add_command(auth)
 cli.add_command(projects)
 cli.add_command(migrate_css)
+cli.add_command(css_index)
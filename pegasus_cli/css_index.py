@@ -0,0 +1,387 @@
+"""An on-disk index of where CSS classes are used, and the css-index command."""
+import fnmatch
+import json
+import os
+import time
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+
+import click
+
+from .migrate_css import (
+    DEFAULT_CSS_FILE,
+    DEFAULT_SEARCH_DIRS,
+    EXCLUDES,
+    ClassMatcher,
+    StatRecord,
+    css_class_map_fingerprint,
+    decode,
+    find_files,
+    load_rulesets,
+    read_candidate,
+)
+
+DEFAULT_INDEX_FILE = ".pegasus/css-index"
+
+
+class ClassIndex(StatRecord):
+    """On-disk inverted index from class names to the lines that use them.
+
+    ``classes`` maps each class name to {path: [line numbers]}, and ``files`` maps
+    each indexed path to its size, mtime and the classes it uses, so that changed
+    files can be found by stat alone and their old entries removed. Prefixed classes
+    with no mapping are indexed too, and listed in ``unmapped``. As with the
+    migrate-css manifest, the index is tied to a fingerprint of the class map and is
+    rebuilt from scratch when the map changes.
+
+    The file holds a JSON header line, a JSON line with ``files``, and then one
+    ``<class name>\t<JSON paths>`` line per class, so a query only parses the lines
+    of the classes it asks for.
+    """
+
+    # Bumped whenever the layout or what is indexed changes
+    VERSION = 3
+
+    def __init__(self, path: Path, fingerprint: str | None):
+        super().__init__(path)
+        self.fingerprint = fingerprint
+        self.files: dict[str, dict] = {}
+        self.classes: dict[str, dict[str, list[int]]] = {}
+        self.unmapped: set[str] = set()
+
+    @classmethod
+    def load(
+        cls,
+        path: Path,
+        fingerprint: str | None = None,
+        patterns: list[str] | None = None,
+        unmapped_only: bool = False,
+    ) -> "ClassIndex":
+        """Load the index at path, or return an empty one if it is missing,
+        unreadable or was built from a different class map.
+
+        If fingerprint is None the index is loaded whatever map it was built from,
+        which is all that's needed to query it. If patterns is given, only the
+        classes matching one of them (and with unmapped_only, only unmapped ones)
+        are loaded, and ``files`` is left empty, so the index can be queried but
+        mustn't be saved.
+        """
+        index = cls(path, fingerprint)
+        try:
+            with open(path, encoding="utf-8") as f:
+                header = json.loads(f.readline())
+                if (
+                    not isinstance(header, dict)
+                    or header.get("version") != cls.VERSION
+                    or (
+                        fingerprint is not None
+                        and header.get("fingerprint") != fingerprint
+                    )
+                ):
+                    return index
+                index.fingerprint = header.get("fingerprint")
+                index.unmapped = set(header.get("unmapped", []))
+                index.saved_at_ns = header.get("saved_at_ns", 0)
+                files_line = f.readline()
+                if patterns is None:
+                    index.files = json.loads(files_line)
+                    matches = None
+                else:
+                    matches = pattern_matcher(patterns)
+                for line in f:
+                    name, _, paths = line.partition("\t")
+                    if unmapped_only and name not in index.unmapped:
+                        continue
+                    if matches is None or matches(name):
+                        index.classes[name] = json.loads(paths)
+        except (OSError, ValueError):
+            return cls(path, fingerprint)
+        return index
+
+    def save(self):
+        """Write the index atomically."""
+        header = {
+            "version": self.VERSION,
+            "fingerprint": self.fingerprint,
+            "saved_at_ns": time.time_ns(),
+            "unmapped": sorted(self.unmapped),
+        }
+        lines = [json.dumps(header, sort_keys=True), json.dumps(self.files)]
+        # Class names can't contain whitespace, so a tab ends the name
+        lines.extend(
+            f"{name}\t{json.dumps(self.classes[name], sort_keys=True)}"
+            for name in sorted(self.classes)
+        )
+        self.write("\n".join(lines) + "\n")
+
+    def update(
+        self, files: list[Path], matcher: ClassMatcher, jobs: int = 1
+    ) -> tuple[int, int]:
+        """Bring the index up to date with files, the full list of files to index.
+
+        Only files whose size or mtime changed are scanned again, and files no longer
+        in the list are dropped. Returns (files scanned, files removed).
+        """
+        keys = set()
+        stale = []
+        for filepath in files:
+            key = str(filepath)
+            keys.add(key)
+            entry = self.files.get(key)
+            if entry is None or not self.is_fresh(filepath, entry):
+                stale.append(filepath)
+        removed = [key for key in self.files if key not in keys]
+        for key in removed:
+            self._remove(key)
+        for filepath in stale:
+            self._remove(str(filepath))
+
+        index = partial(index_file, matcher=matcher)
+        if jobs <= 1 or len(stale) <= 1:
+            results = map(index, stale)
+            self._add_results(stale, results)
+        else:
+            jobs = min(jobs, len(stale))
+            chunksize = max(1, min(64, len(stale) // (jobs * 4)))
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                self._add_results(
+                    stale, executor.map(index, stale, chunksize=chunksize)
+                )
+        return len(stale), len(removed)
+
+    def find(self, patterns: list[str]) -> dict[str, dict[str, list[int]]]:
+        """Return {class name: {path: lines}} for classes matching any of patterns.
+
+        Patterns are class names or shell-style globs such as ``pg-button*``.
+        """
+        matches = pattern_matcher(patterns)
+        return {name: paths for name, paths in self.classes.items() if matches(name)}
+
+    def _remove(self, key: str):
+        entry = self.files.pop(key, None)
+        if entry is None:
+            return
+        for name in entry["classes"]:
+            paths = self.classes.get(name, {})
+            paths.pop(key, None)
+            if not paths:
+                self.classes.pop(name, None)
+                self.unmapped.discard(name)
+
+    def _add_results(self, files: list[Path], results):
+        for filepath, result in zip(files, results):
+            if result is None:
+                continue
+            size, mtime_ns, occurrences, unmapped = result
+            key = str(filepath)
+            self.files[key] = {
+                "size": size,
+                "mtime_ns": mtime_ns,
+                "classes": sorted(occurrences),
+            }
+            for name, lines in occurrences.items():
+                self.classes.setdefault(name, {})[key] = lines
+            self.unmapped.update(unmapped)
+
+
+def pattern_matcher(patterns: list[str]) -> Callable[[str], bool]:
+    """Return a function telling whether a class name matches any of patterns,
+    which are class names or shell-style globs."""
+    names = set()
+    globs = []
+    for pattern in patterns:
+        if any(char in pattern for char in "*?["):
+            globs.append(pattern)
+        else:
+            names.add(pattern)
+
+    def matches(name: str) -> bool:
+        return name in names or any(fnmatch.fnmatch(name, glob) for glob in globs)
+
+    return matches
+
+
+def index_file(
+    filepath: Path, matcher: ClassMatcher
+) -> tuple[int, int, dict[str, list[int]], list[str]] | None:
+    """Find the classes used in filepath.
+
+    Returns (size, mtime_ns, {class name: line numbers}, unmapped class names), or
+    None if the file can no longer be read.
+    """
+    try:
+        stat = filepath.stat()
+        data, _ = read_candidate(filepath, matcher.marker)
+    except OSError:
+        return None
+    occurrences: dict[str, list[int]] = {}
+    unmapped = []
+    if data is not None:
+        content, _ = decode(data)
+        spans, unmapped_positions = matcher.locate(content)
+        unmapped = sorted({name for _, name in unmapped_positions})
+        positions = [(start, name) for start, _, name in spans]
+        positions.extend(unmapped_positions)
+        positions.sort()
+        line = 1
+        previous = 0
+        for start, name in positions:
+            line += content.count("\n", previous, start)
+            previous = start
+            lines = occurrences.setdefault(name, [])
+            if not lines or lines[-1] != line:
+                lines.append(line)
+    return stat.st_size, stat.st_mtime_ns, occurrences, unmapped
+
+
+@click.group(name="css-index")
+def css_index():
+    """Index where CSS classes are used in your project, and query the index.
+
+    Run `pegasus css-index update` to build or refresh the index, then
+    `pegasus css-index query` to look up classes in it.
+    """
+
+
+@css_index.command()
+@click.option(
+    "--css-file",
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=DEFAULT_CSS_FILE,
+    show_default=True,
+    help="Path to the Pegasus tailwind.css file containing pg- class definitions",
+)
+@click.option(
+    "--rules",
+    "rules_files",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    multiple=True,
+    help="YAML or JSON file of extra class renames whose classes should be indexed.",
+)
+@click.option(
+    "--search-dir",
+    "search_dirs",
+    type=click.Path(file_okay=False, path_type=Path),
+    multiple=True,
+    help=(
+        "Directory to search for files to index. Can be passed multiple times. "
+        f"Defaults to: {', '.join(DEFAULT_SEARCH_DIRS)}"
+    ),
+)
+@click.option(
+    "--exclude",
+    "excludes",
+    multiple=True,
+    help="Glob for file or directory names to skip, in addition to the defaults.",
+)
+@click.option(
+    "--no-gitignore",
+    is_flag=True,
+    help="Don't skip files and directories ignored by .gitignore",
+)
+@click.option(
+    "--index",
+    "index_file",
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=DEFAULT_INDEX_FILE,
+    show_default=True,
+    help="Index file to update",
+)
+@click.option("--rebuild", is_flag=True, help="Scan every file, not just changed ones")
+@click.option(
+    "--jobs",
+    "-j",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Number of worker processes to use. Defaults to the number of CPUs.",
+)
+def update(
+    css_file: Path,
+    rules_files: tuple[Path, ...],
+    search_dirs: tuple[Path, ...],
+    excludes: tuple[str, ...],
+    no_gitignore: bool,
+    index_file: Path,
+    rebuild: bool,
+    jobs: int | None,
+):
+    """Build the class index, or update it with the files changed since last time."""
+    if not css_file.exists() and not rules_files:
+        raise click.ClickException(
+            f"{css_file} not found. Run from your project root or pass --css-file."
+        )
+    _, css_class_map, matcher = load_rulesets(css_file, rules_files)
+    if not css_class_map:
+        raise click.ClickException(f"No class mappings found in {css_file}.")
+
+    fingerprint = css_class_map_fingerprint(css_class_map)
+    if rebuild:
+        index = ClassIndex(index_file, fingerprint)
+    else:
+        index = ClassIndex.load(index_file, fingerprint)
+    dirs = search_dirs or tuple(Path(d) for d in DEFAULT_SEARCH_DIRS)
+    files = find_files(dirs, EXCLUDES + excludes, use_gitignore=not no_gitignore)
+    scanned, removed = index.update(files, matcher, jobs=jobs or os.cpu_count() or 1)
+    index.save()
+
+    click.echo(
+        f"Scanned {scanned} changed files and removed {removed}. {index_file} has "
+        f"{len(index.classes)} classes in {len(index.files)} files."
+    )
+
+
+@css_index.command()
+@click.argument("patterns", nargs=-1)
+@click.option(
+    "--unmapped",
+    is_flag=True,
+    help="Only show classes with no mapping",
+)
+@click.option(
+    "--index",
+    "index_file",
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=DEFAULT_INDEX_FILE,
+    show_default=True,
+    help="Index file to query",
+)
+@click.option("--json", "as_json", is_flag=True, help="Output JSON")
+def query(patterns: tuple[str, ...], unmapped: bool, index_file: Path, as_json: bool):
+    """Show where classes are used.
+
+    PATTERNS are class names or globs, e.g. `pg-button*`. Each line where a matching
+    class is used is listed as path:line. With neither PATTERNS nor --unmapped, every
+    indexed class is listed with its number of uses.
+    """
+    if not index_file.exists():
+        raise click.ClickException(
+            f"{index_file} not found. Run `pegasus css-index update` first."
+        )
+    if patterns or unmapped:
+        index = ClassIndex.load(
+            index_file, patterns=list(patterns) or ["*"], unmapped_only=unmapped
+        )
+    else:
+        index = ClassIndex.load(index_file, patterns=["*"])
+    matches = index.classes
+
+    if as_json:
+        click.echo(json.dumps(matches, indent=2, sort_keys=True))
+        return
+    if not matches:
+        click.echo("No matching classes found.", err=True)
+        return
+    for name in sorted(matches):
+        paths = matches[name]
+        if patterns or unmapped:
+            for path in sorted(paths):
+                for line in paths[path]:
+                    click.echo(f"{path}:{line}: {name}")
+        else:
+            uses = sum(len(lines) for lines in paths.values())
+            click.echo(
+                f"{name} ({uses} line{'s' if uses != 1 else ''} in "
+                f"{len(paths)} file{'s' if len(paths) != 1 else ''})"
+            )
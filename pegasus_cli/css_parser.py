@@ -0,0 +1,83 @@
+"""A small tokenizer-based parser for the class definitions in tailwind.css.
+
+Only what's needed to read ``.name { @apply ...; }`` rules is understood, but it
+is done properly: comments and strings are skipped, ``@apply`` may span several
+lines or be split over several declarations, and rules may be nested inside
+``@layer`` (or any other) blocks.
+"""
+import re
+from collections.abc import Iterator
+
+TOKEN_PATTERN = re.compile(
+    r"""
+      /\*.*?(?:\*/|\Z)              # comment, possibly unterminated
+    | "(?:\\.|[^"\\])*"?            # double-quoted string
+    | '(?:\\.|[^'\\])*'?            # single-quoted string
+    | [{};]                         # structure
+    | [^{};/"']+                    # anything else
+    | /                             # a slash that doesn't start a comment
+    """,
+    re.DOTALL | re.VERBOSE,
+)
+CLASS_SELECTOR_PATTERN = re.compile(r"\.([a-z0-9-]+)")
+APPLY_PATTERN = re.compile(r"@apply\s+(.*)", re.DOTALL)
+
+
+def tokenize(content: str) -> Iterator[tuple[str, str]]:
+    """Yield (terminator, prelude) for each statement in content.
+
+    terminator is one of ``{``, ``}`` or ``;`` (or ``""`` for trailing text at the
+    end of content), and prelude is the text leading up to it with comments removed.
+    """
+    prelude = []
+    for match in TOKEN_PATTERN.finditer(content):
+        token = match.group()
+        if token in "{};":
+            yield token, "".join(prelude)
+            prelude = []
+        elif not token.startswith("/*"):
+            prelude.append(token)
+    if "".join(prelude).strip():
+        yield "", "".join(prelude)
+
+
+def parse_apply_rules(content: str, prefix: str) -> dict[str, str]:
+    """Return {class name: applied classes} for the rules defining prefixed classes.
+
+    A rule counts if its selector is a single class (or a comma-separated list of
+    them) and its body holds nothing but ``@apply`` declarations. Rules that also set
+    other properties, or that target pseudo-classes or descendants, can't be replaced
+    by a plain list of classes and are skipped.
+    """
+    classes = {}
+    # One entry per open block: [class names defined, applied classes, only @apply]
+    stack = []
+    for terminator, prelude in tokenize(content):
+        prelude = " ".join(prelude.split())
+        if terminator == "{":
+            stack.append([_class_names(prelude, prefix), [], True])
+            continue
+        if stack and prelude:
+            block = stack[-1]
+            apply_match = APPLY_PATTERN.fullmatch(prelude)
+            if apply_match:
+                block[1].append(apply_match.group(1))
+            else:
+                block[2] = False
+        if terminator == "}" and stack:
+            names, applied, only_apply = stack.pop()
+            if names and applied and only_apply:
+                for name in names:
+                    classes[name] = " ".join(applied)
+    return classes
+
+
+def _class_names(selector: str, prefix: str) -> list[str]:
+    names = []
+    for part in selector.split(","):
+        match = CLASS_SELECTOR_PATTERN.fullmatch(part.strip())
+        if match is None:
+            return []
+        if match.group(1).startswith(prefix):
+            names.append(match.group(1))
+    return names
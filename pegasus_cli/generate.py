@@ -1,6 +1,323 @@
-from cookiecutter.generate import generate_files
+"""Render cookiecutter-style template packs without going through cookiecutter.
 
-from .jinja import ENV_KWARGS, TEMPLATE_BASE
+A pack is a directory holding one templated project directory, such as
+``{{cookiecutter.app_name}}``, and optionally a ``hooks`` directory. Hooks are
+``pre_gen_project`` and ``post_gen_project`` functions in ``hooks/hooks.py``, which
+run in-process, or cookiecutter-style templated scripts of the same names. Paths are
+rendered with the FILENAME_ENV_KWARGS delimiters and file contents with ENV_KWARGS,
+as cookiecutter renders them once patched by tests/cookiecutter_patch.py.
+
+Packs are rendered into a RenderedTree in memory, and only the files whose contents
+changed are written to disk, so unchanged files keep their mtimes.
+"""
+import functools
+import importlib.util
+import os
+import re
+import stat
+import subprocess
+import sys
+import tempfile
+from collections.abc import Callable
+from pathlib import Path
+from typing import NamedTuple
+
+from jinja2 import Environment, FileSystemLoader, StrictUndefined, Template
+
+from .jinja import (
+    ENV_KWARGS,
+    FILENAME_ENV_KWARGS,
+    TEMPLATE_BASE,
+    TemplateBytecodeCache,
+    from_string,
+)
+
+HOOKS_DIR = "hooks"
+HOOKS_MODULE = "hooks.py"
+PRE_GEN_HOOK = "pre_gen_project"
+POST_GEN_HOOK = "post_gen_project"
+NEWLINE_PATTERN = re.compile(rb"\r\n|\r|\n")
+
+
+class HookError(Exception):
+    pass
+
+
+class TemplateFile(NamedTuple):
+    """A file in a template pack, with its path and contents already compiled."""
+
+    path: Template
+    # None for binary files, which are copied as they are
+    content: Template | None
+    data: bytes
+    newline: str | None
+    mode: int
+
+
+class RenderedFile(NamedTuple):
+    data: bytes
+    mode: int
+
+
+class RenderedTree:
+    """Files rendered from one or more template packs, held in memory.
+
+    Nothing touches the disk until write(), which only writes the files whose
+    contents differ from what is already there. Hook scripts, which need the files
+    on disk, are queued in before_write and after_write to run around the writing.
+    """
+
+    def __init__(self):
+        self.dirs: set[Path] = set()
+        self.files: dict[Path, RenderedFile] = {}
+        self.removed: set[Path] = set()
+        self.before_write: list[Callable[[], None]] = []
+        self.after_write: list[Callable[[], None]] = []
+
+    def add(self, path: Path, data: bytes, mode: int):
+        self.files[path] = RenderedFile(data, mode)
+        self.removed.discard(path)
+
+    def remove(self, path: Path):
+        """Drop path from the tree, deleting it from disk too if it exists."""
+        self.files.pop(path, None)
+        self.removed.add(path)
+
+    def changes(self) -> dict[Path, str]:
+        """Return {path: "create", "update" or "delete"} for every file that write()
+        would change, in path order."""
+        changes = {}
+        for path in sorted(self.files.keys() | self.removed):
+            rendered = self.files.get(path)
+            try:
+                stat_result = path.stat()
+            except FileNotFoundError:
+                if rendered is not None:
+                    changes[path] = "create"
+                continue
+            if rendered is None:
+                if not path.is_dir():
+                    changes[path] = "delete"
+            elif (
+                stat_result.st_size != len(rendered.data)
+                or stat.S_IMODE(stat_result.st_mode) != rendered.mode
+                or path.read_bytes() != rendered.data
+            ):
+                changes[path] = "update"
+        return changes
+
+    def write(self) -> dict[Path, str]:
+        """Write the tree to disk, leaving unchanged files untouched.
+
+        Returns the changes made, as returned by changes(). Changes made by hook
+        scripts aren't included.
+        """
+        for path in sorted(self.dirs):
+            path.mkdir(parents=True, exist_ok=True)
+        for hook in self.before_write:
+            hook()
+        changes = self.changes()
+        for path, change in changes.items():
+            if change == "delete":
+                path.unlink()
+                continue
+            rendered = self.files[path]
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(rendered.data)
+            os.chmod(path, rendered.mode)
+        for hook in self.after_write:
+            hook()
+        return changes
+
+
+class TemplatePack:
+    """A template pack, loaded and compiled once so it can be rendered many times.
+
+    Every path, file and hook in the pack is compiled when it is loaded, so
+    rendering it again, for instance once per model, only evaluates templates that
+    are already compiled. Use load_template_pack to share packs within a process.
+    """
+
+    def __init__(self, repo_dir: Path):
+        self.repo_dir = Path(repo_dir)
+        template_dir = _find_template_dir(self.repo_dir)
+        self.env = Environment(
+            loader=FileSystemLoader([template_dir, self.repo_dir / "templates"]),
+            undefined=StrictUndefined,
+            keep_trailing_newline=True,
+            bytecode_cache=TemplateBytecodeCache(),
+            **ENV_KWARGS,
+        )
+        filename_env = self.env.overlay(**FILENAME_ENV_KWARGS)
+        self.project_dir_name = from_string(filename_env, template_dir.name)
+        self.dirs: list[Template] = []
+        self.files: list[TemplateFile] = []
+        for root, dirs, files in os.walk(template_dir):
+            dirs.sort()
+            rel_root = os.path.relpath(root, template_dir)
+            for name in dirs:
+                rel_path = os.path.normpath(os.path.join(rel_root, name))
+                self.dirs.append(from_string(filename_env, rel_path))
+            for name in sorted(files):
+                rel_path = os.path.normpath(os.path.join(rel_root, name))
+                self.files.append(self._load_file(filename_env, template_dir, rel_path))
+        hook_functions = self._load_hook_functions()
+        self.hooks = {
+            hook: hook_functions.get(hook) or self._load_hook(hook)
+            for hook in (PRE_GEN_HOOK, POST_GEN_HOOK)
+        }
+        self.env.bytecode_cache.prune()
+
+    def render(
+        self, output_dir: Path, context: dict, accept_hooks: bool = True
+    ) -> Path:
+        """Render the pack into output_dir, writing only the files that changed.
+
+        Returns the rendered project directory.
+        """
+        tree = RenderedTree()
+        project_dir = self.render_into(tree, output_dir, context, accept_hooks)
+        tree.write()
+        return project_dir
+
+    def render_into(
+        self,
+        tree: RenderedTree,
+        output_dir: Path,
+        context: dict,
+        accept_hooks: bool = True,
+    ) -> Path:
+        """Render the pack into tree, as if into output_dir.
+
+        Hook functions are called straight away. Hook scripts need the files on disk,
+        so they are queued on the tree to run when it is written: the pre-generation
+        script just before the files are written, and the post-generation script
+        just after. Returns the project directory.
+        """
+        project_dir = self.project_dir(output_dir, context)
+        if accept_hooks:
+            self._call_hook(PRE_GEN_HOOK, tree, project_dir, context)
+            for hook, queue in (
+                (PRE_GEN_HOOK, tree.before_write),
+                (POST_GEN_HOOK, tree.after_write),
+            ):
+                if self._has_hook_script(hook):
+                    queue.append(
+                        functools.partial(
+                            self._run_hook_script, hook, project_dir, dict(context)
+                        )
+                    )
+
+        tree.dirs.add(project_dir)
+        for path in self.dirs:
+            tree.dirs.add(project_dir / path.render(**context))
+        for template_file in self.files:
+            outfile = project_dir / template_file.path.render(**context)
+            if outfile in tree.dirs or outfile.is_dir():
+                # The file name rendered to nothing
+                continue
+            if template_file.content is None:
+                data = template_file.data
+            else:
+                rendered = template_file.content.render(**context)
+                newline = template_file.newline or os.linesep
+                data = rendered.replace("\n", newline).encode("utf-8")
+            tree.add(outfile, data, template_file.mode)
+
+        if accept_hooks:
+            self._call_hook(POST_GEN_HOOK, tree, project_dir, context)
+        return project_dir
+
+    def project_dir(self, output_dir: Path, context: dict) -> Path:
+        return Path(output_dir, self.project_dir_name.render(**context)).resolve()
+
+    def _load_file(self, filename_env, template_dir: Path, rel_path: str):
+        source = template_dir / rel_path
+        data = source.read_bytes()
+        mode = stat.S_IMODE(source.stat().st_mode)
+        path = from_string(filename_env, rel_path)
+        if _is_binary(data):
+            return TemplateFile(path, None, data, None, mode)
+        content = self.env.get_template(rel_path.replace(os.sep, "/"))
+        # Write the output with the same line endings as the template's first line
+        match = NEWLINE_PATTERN.search(data)
+        newline = match.group().decode() if match else None
+        return TemplateFile(path, content, b"", newline, mode)
+
+    def _load_hook_functions(self) -> dict[str, Callable]:
+        """Import the pack's hooks module, if it has one, and return its hooks."""
+        path = self.repo_dir / HOOKS_DIR / HOOKS_MODULE
+        if not path.is_file():
+            return {}
+        spec = importlib.util.spec_from_file_location(
+            f"pegasus_cli.template_hooks.{self.repo_dir.name}", path
+        )
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return {
+            hook: getattr(module, hook)
+            for hook in (PRE_GEN_HOOK, POST_GEN_HOOK)
+            if callable(getattr(module, hook, None))
+        }
+
+    def _load_hook(self, hook: str) -> tuple[str, Template] | None:
+        hooks_dir = self.repo_dir / HOOKS_DIR
+        if not hooks_dir.is_dir():
+            return None
+        for script in sorted(hooks_dir.iterdir()):
+            if (
+                script.stem == hook
+                and script.is_file()
+                and not script.name.endswith("~")
+            ):
+                source = script.read_text(encoding="utf-8")
+                return script.suffix, from_string(self.env, source)
+        return None
+
+    def _has_hook_script(self, hook: str) -> bool:
+        return self.hooks[hook] is not None and not callable(self.hooks[hook])
+
+    def _call_hook(
+        self, hook: str, tree: RenderedTree, project_dir: Path, context: dict
+    ):
+        """Call the hook function, if the pack has one, with project_dir, the
+        context and the tree being rendered."""
+        if not callable(self.hooks[hook]):
+            return
+        try:
+            self.hooks[hook](project_dir, context, tree)
+        except Exception as e:
+            raise HookError(f"{hook} hook failed (error: {e})") from e
+
+    def _run_hook_script(self, hook: str, project_dir: Path, context: dict):
+        """Render the hook script and run it from project_dir."""
+        suffix, template = self.hooks[hook]
+        with tempfile.NamedTemporaryFile(
+            "w", encoding="utf-8", suffix=suffix, delete=False
+        ) as f:
+            f.write(template.render(**context))
+        try:
+            if suffix == ".py":
+                command = [sys.executable, f.name]
+            else:
+                os.chmod(f.name, 0o755)
+                command = [f.name]
+            try:
+                exit_status = subprocess.call(command, cwd=project_dir)
+            except OSError as e:
+                raise HookError(f"{hook} hook script failed (error: {e})") from e
+            if exit_status != 0:
+                raise HookError(
+                    f"{hook} hook script failed (exit status: {exit_status})"
+                )
+        finally:
+            os.remove(f.name)
+
+
+@functools.cache
+def load_template_pack(repo_dir: Path) -> TemplatePack:
+    """Return the TemplatePack for repo_dir, loading it only once per process."""
+    return TemplatePack(repo_dir)
 
 
 def render_cookiecutter(
@@ -9,21 +326,37 @@ def render_cookiecutter(
     context,
     extra_cookiecutter_context=None,
     template_base=TEMPLATE_BASE,
+    tree: RenderedTree | None = None,
 ):
-    repo_dir = template_base / template_pack
-
-    generate_files(
-        repo_dir=repo_dir,
-        context={
-            **context,
-            "cookiecutter": {
-                "_jinja2_env_vars": ENV_KWARGS,
-                **extra_cookiecutter_context,
-            },
+    """Render template_pack into output_dir, or into tree if one is given, in which
+    case nothing is written until tree.write() is called."""
+    pack = load_template_pack(Path(template_base) / template_pack)
+    context = {
+        **context,
+        "cookiecutter": {
+            "_jinja2_env_vars": ENV_KWARGS,
+            **(extra_cookiecutter_context or {}),
         },
-        overwrite_if_exists=True,
-        skip_if_file_exists=False,
-        output_dir=output_dir,
-        accept_hooks=True,
-        keep_project_on_failure=True,
-    )
+    }
+    if tree is None:
+        return pack.render(output_dir, context)
+    return pack.render_into(tree, output_dir, context)
+
+
+def _find_template_dir(repo_dir: Path) -> Path:
+    start = FILENAME_ENV_KWARGS["variable_start_string"]
+    end = FILENAME_ENV_KWARGS["variable_end_string"]
+    for path in sorted(repo_dir.iterdir()):
+        if "cookiecutter" in path.name and start in path.name and end in path.name:
+            return path
+    raise ValueError(f"No templated project directory found in {repo_dir}")
+
+
+def _is_binary(data: bytes) -> bool:
+    if b"\0" in data[:1024]:
+        return True
+    try:
+        data.decode("utf-8")
+    except UnicodeDecodeError:
+        return True
+    return False
@@ -0,0 +1,55 @@
+"""Ask the local git repository which files have changed."""
+import os
+import subprocess
+from pathlib import Path
+
+
+class GitError(Exception):
+    pass
+
+
+def changed_files(since: str) -> list[Path]:
+    """Return the files changed since the commit since, relative to the current directory.
+
+    Committed, staged and unstaged changes are included, as are untracked files that
+    aren't ignored, but deleted files are not. Only files in the current directory
+    or below are returned, and only the local repository is consulted.
+    """
+    commit = resolve_commit(since)
+    changed = _run_git(
+        ["diff", "--name-only", "--relative", "--diff-filter=d", "-z", commit, "--"]
+    )
+    untracked = _run_git(["ls-files", "--others", "--exclude-standard", "-z"])
+    return sorted({Path(path) for path in changed + untracked})
+
+
+def resolve_commit(ref: str) -> str:
+    """Return the hash of the commit ref names.
+
+    The ref is passed after --end-of-options, so one starting with a dash is looked
+    up rather than being taken as an option.
+    """
+    result = _git(
+        ["rev-parse", "--verify", "--quiet", "--end-of-options", f"{ref}^{{commit}}"]
+    )
+    if result.returncode != 0:
+        # --quiet leaves stderr empty for a missing ref, but not outside a repository
+        raise GitError(
+            os.fsdecode(result.stderr).strip()
+            or f"{ref!r} is not a commit in this repository"
+        )
+    return os.fsdecode(result.stdout).strip()
+
+
+def _run_git(args: list[str]) -> list[str]:
+    result = _git(args)
+    if result.returncode != 0:
+        raise GitError(os.fsdecode(result.stderr).strip() or "git failed")
+    return [path for path in os.fsdecode(result.stdout).split("\0") if path]
+
+
+def _git(args: list[str]) -> subprocess.CompletedProcess:
+    try:
+        return subprocess.run(["git", *args], capture_output=True, check=False)
+    except FileNotFoundError:
+        raise GitError("git is not installed")
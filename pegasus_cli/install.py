@@ -39,6 +39,15 @@ def add_to_installed_apps(settings_path: str, app_config: str) -> bool:
     closing bracket.  Returns True if the entry was inserted, False if no suitable
     list assignment was found.
     """
+    return add_all_to_installed_apps(settings_path, [app_config])
+
+
+def add_all_to_installed_apps(settings_path: str, app_configs: list[str]) -> bool:
+    """Add each of app_configs to INSTALLED_APPS (or PROJECT_APPS) in one edit.
+
+    Entries already in the list are skipped. Returns True if the list was found,
+    False otherwise.
+    """
     path = pathlib.Path(settings_path)
     source = path.read_text()
     tree = ast.parse(source)
@@ -46,10 +55,13 @@ def add_to_installed_apps(settings_path: str, app_config: str) -> bool:
     for var_name in ("PROJECT_APPS", "INSTALLED_APPS"):
         list_node = _find_list_assignment(tree, var_name)
         if list_node is not None:
-            if _list_contains_string(list_node, app_config):
-                return True
-            modified = _insert_into_ast_list(source, list_node, f'"{app_config}"')
-            path.write_text(modified)
+            entries = [
+                f'"{app_config}"'
+                for app_config in dict.fromkeys(app_configs)
+                if not _list_contains_string(list_node, app_config)
+            ]
+            if entries:
+                path.write_text(_insert_into_ast_list(source, list_node, entries))
             return True
 
     return False
@@ -62,6 +74,17 @@ def add_to_urlpatterns(
 
     Returns True if the entry was inserted, False if no suitable list assignment was found.
     """
+    return add_all_to_urlpatterns(urls_path, [(app_name, app_module_path)], use_teams)
+
+
+def add_all_to_urlpatterns(
+    urls_path: str, apps: list[tuple[str, str]], use_teams: bool
+) -> bool:
+    """Add a path() entry for each (app_name, app_module_path) in apps in one edit.
+
+    Apps whose urls are already included are skipped. Returns True if the list was
+    found, False otherwise.
+    """
     path = pathlib.Path(urls_path)
     source = path.read_text()
     tree = ast.parse(source)
@@ -71,11 +94,13 @@ def add_to_urlpatterns(
     if list_node is None:
         return False
 
-    if _list_contains_string(list_node, f"{app_module_path}.urls"):
-        return True
-    entry = f'path("{app_name}/", include("{app_module_path}.urls"))'
-    modified = _insert_into_ast_list(source, list_node, entry)
-    path.write_text(modified)
+    entries = [
+        f'path("{app_name}/", include("{app_module_path}.urls"))'
+        for app_name, app_module_path in dict.fromkeys(apps)
+        if not _list_contains_string(list_node, f"{app_module_path}.urls")
+    ]
+    if entries:
+        path.write_text(_insert_into_ast_list(source, list_node, entries))
     return True
 
 
@@ -134,8 +159,8 @@ def _find_list_assignment(tree: ast.Module, var_name: str) -> "ast.List | None":
     return None
 
 
-def _insert_into_ast_list(source: str, list_node: ast.List, entry: str) -> str:
-    """Insert entry (raw text) as a new element into the list, before the closing ']'."""
+def _insert_into_ast_list(source: str, list_node: ast.List, entries: list[str]) -> str:
+    """Insert entries (raw text) as new elements into the list, before the closing ']'."""
     lines = source.splitlines(keepends=True)
     end_line_idx = list_node.end_lineno - 1  # 0-indexed
     end_col = list_node.end_col_offset  # column index right after ']'
@@ -145,13 +170,13 @@ def _insert_into_ast_list(source: str, list_node: ast.List, entry: str) -> str:
         # Single-line list: insert before ']'
         sep = ", " if list_node.elts else ""
         lines[end_line_idx] = (
-            line[: end_col - 1] + f"{sep}{entry}" + line[end_col - 1 :]
+            line[: end_col - 1] + sep + ", ".join(entries) + line[end_col - 1 :]
         )
     else:
         # Multi-line list: insert a new line before the line containing ']'
         bracket_indent = line[: end_col - 1]
         item_indent = bracket_indent + "    "
-        new_line = f"{item_indent}{entry},\n"
-        lines[end_line_idx] = new_line + line
+        new_lines = "".join(f"{item_indent}{entry},\n" for entry in entries)
+        lines[end_line_idx] = new_lines + line
 
     return "".join(lines)
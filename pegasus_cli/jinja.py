@@ -1,12 +1,18 @@
 import pathlib
 
-from jinja2 import Environment, FileSystemLoader, select_autoescape
+import jinja2
+from jinja2 import Environment, FileSystemLoader, Template, select_autoescape
+from jinja2.bccache import Bucket, BytecodeCache
+
+from . import cache
 
 START = "<"
 END = ">"
 OSTART = "{"
 OEND = "}"
 TEMPLATE_BASE = pathlib.Path(__file__).parent / "templates"
+BYTECODE_CACHE = "jinja-bytecode"
+BYTECODE_CACHE_MAX_SIZE = 32 * 1024 * 1024
 
 ENV_KWARGS = dict(
     block_start_string=f"{START}%",
@@ -27,10 +33,90 @@ FILENAME_ENV_KWARGS = dict(
 )
 
 
+class TemplateBytecodeCache(BytecodeCache):
+    """Jinja bytecode cache stored under ~/.pegasus/cache.
+
+    Entries are keyed by the template source and everything else that changes the
+    compiled code (the Jinja version, the environment's syntax options and the
+    template name), so a changed template or upgraded Jinja is simply a cache miss.
+    Call prune() once a batch of templates is loaded to evict the least recently used
+    entries if the cache has grown past max_size.
+    """
+
+    def __init__(self, max_size: int = BYTECODE_CACHE_MAX_SIZE):
+        self.max_size = max_size
+        self.written = False
+
+    def get_bucket(self, environment, name, filename, source) -> Bucket:
+        autoescape = environment.autoescape
+        if callable(autoescape):
+            autoescape = autoescape(name)
+        key = cache.content_key(
+            jinja2.__version__,
+            repr(_syntax_options(environment)),
+            repr(autoescape),
+            name or "",
+            source,
+        )
+        bucket = Bucket(environment, key, self.get_source_checksum(source))
+        self.load_bytecode(bucket)
+        return bucket
+
+    def load_bytecode(self, bucket: Bucket):
+        data = cache.read_bytes(BYTECODE_CACHE, bucket.key, ".jbc")
+        if data is not None:
+            bucket.bytecode_from_string(data)
+
+    def dump_bytecode(self, bucket: Bucket):
+        cache.write_bytes(
+            BYTECODE_CACHE, bucket.key, ".jbc", bucket.bytecode_to_string()
+        )
+        self.written = True
+
+    def prune(self):
+        """Evict entries until the cache fits in max_size, if anything was written
+        since the last prune."""
+        if self.written:
+            cache.prune(BYTECODE_CACHE, self.max_size)
+            self.written = False
+
+
+def from_string(env: Environment, source: str) -> Template:
+    """Like env.from_string, but using env's bytecode cache if it has one."""
+    bytecode_cache = env.bytecode_cache
+    if bytecode_cache is None:
+        return env.from_string(source)
+    bucket = bytecode_cache.get_bucket(env, None, None, source)
+    if bucket.code is None:
+        bucket.code = env.compile(source)
+        bytecode_cache.set_bucket(bucket)
+    return env.template_class.from_code(env, bucket.code, env.make_globals(None))
+
+
+def _syntax_options(env: Environment) -> tuple:
+    return (
+        env.block_start_string,
+        env.block_end_string,
+        env.variable_start_string,
+        env.variable_end_string,
+        env.comment_start_string,
+        env.comment_end_string,
+        env.line_statement_prefix,
+        env.line_comment_prefix,
+        env.trim_blocks,
+        env.lstrip_blocks,
+        env.newline_sequence,
+        env.keep_trailing_newline,
+        sorted(env.extensions),
+        env.optimized,
+    )
+
+
 def get_template_env(search_path=TEMPLATE_BASE):
     return Environment(
         loader=FileSystemLoader(search_path),
         autoescape=select_autoescape(),
+        bytecode_cache=TemplateBytecodeCache(),
         # Use different delimiters to avoid conflicts with Django templates
         **ENV_KWARGS,
     )
@@ -1,69 +1,1572 @@
 """Migrate pg- CSS classes to native Tailwind/DaisyUI equivalents."""
+import codecs
+import hashlib
+import json
+import mmap
+import os
 import re
+import shutil
+import tempfile
+import time
+from bisect import bisect_right
+from collections import Counter, deque
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
 from pathlib import Path
+from typing import BinaryIO, NamedTuple, TextIO
 
 import click
+import yaml
+
+from . import cache
+from .css_parser import parse_apply_rules
+from .git import GitError, changed_files
+from .profiling import Profile, new_file_stats, timed
+from .transaction import Transaction, TransactionError, rollback
+from .unidiff import unified_diff
+from .walker import DEFAULT_EXCLUDES, exclude_matcher, walk_files
+from .watch import create_watcher
 
 DEFAULT_CSS_FILE = "assets/styles/pegasus/tailwind.css"
 DEFAULT_SEARCH_DIRS = ("templates", "assets/javascript", "apps")
+DEFAULT_MANIFEST_FILE = ".pegasus/migrate-css-manifest.json"
+DEFAULT_JOURNAL_DIR = ".pegasus/migrate-css-journal"
 EXTENSIONS = {".html", ".jsx", ".js", ".vue", ".ts", ".tsx"}
-
-PG_CLASS_PATTERN = re.compile(
-    r"\.(pg-[a-z0-9-]+)\s*\{\s*\n\s*@apply\s+([^;]+);?\s*\n\}",
+# Files at least this big are memory-mapped rather than read to look for a class prefix
+MMAP_THRESHOLD = 1024 * 1024
+# Files at least this big are streamed in chunks instead of being loaded whole
+STREAM_THRESHOLD = 16 * 1024 * 1024
+CHUNK_SIZE = 1024 * 1024
+# How much of each file is read to decide whether it's worth scanning at all
+SNIFF_SIZE = 8 * 1024
+# Files at least this big whose lines average at least this long are minified
+MINIFIED_MIN_SIZE = 16 * 1024
+MINIFIED_LINE_LENGTH = 1000
+# Signs of a bundler runtime near the start of a file
+VENDOR_MARKERS = (
+    b"__webpack_require__",
+    b"webpackBootstrap",
+)
+# Signs of a third-party library, which hand-written sources often carry too, so
+# they only count in files at least VENDOR_BANNER_MIN_SIZE bytes
+VENDOR_BANNER_MARKERS = (
+    b"@license",
+    b"/*!",
+    b"define.amd",
 )
+VENDOR_BANNER_MIN_SIZE = 4 * MINIFIED_MIN_SIZE
+SKIP_REASONS = ("binary", "minified", "vendored")
+# How many of the files using each unmapped class are kept to show in reports
+UNMIGRATED_SAMPLE_SIZE = 3
+# CSS/style directories hold the pg- definitions themselves
+EXCLUDES = (*DEFAULT_EXCLUDES, "styles", "css")
+PG_PREFIX = "pg-"
+# Name of the ruleset read from the CSS file, in reports
+PEGASUS_RULESET = "pegasus"
+# Cache namespace for parsed class maps. Bump the version when parsing changes.
+CSS_MAP_CACHE = "migrate-css"
+CSS_MAP_CACHE_VERSION = 1
+
 ANY_PG_CLASS_PATTERN = re.compile(r"\b(pg-[a-z0-9-]+)\b")
+CLASS_NAME_CHARS = re.compile(r"[a-z0-9-]*")
+# Where class names without the prefix are replaced: class and className attributes
+# (including :class bindings) and classList calls. Anywhere else, a bare word such
+# as "shadow" is as likely to be an identifier or prose as a class.
+CLASS_CONTEXT_PATTERN = re.compile(
+    r"""(?<![\w-])(?:(?:class|className)\s*=\s*(?:"[^"]*"|'[^']*'|\{[^}]*\})"""
+    r"|classList\.(?:add|remove|toggle|replace)\([^)]*\))"
+)
+# The start of a class context, or what may become one at the end of the text
+CLASS_CONTEXT_START = re.compile(
+    r"""(?<![\w-])(?:(?:class|className)\s*(?:=\s*(?:["'{]|\Z)|\Z)"""
+    r"|classList\.(?:(?:add|remove|toggle|replace)\(|\Z))"
+)
 
 
 def parse_tailwind_css(path: Path) -> dict[str, str]:
-    """Parse .pg-foo { @apply bar baz; } patterns from tailwind.css."""
-    classes = {}
-    content = path.read_text()
-    for match in PG_CLASS_PATTERN.finditer(content):
-        name = match.group(1)
-        apply_classes = match.group(2).strip().rstrip(";")
-        classes[name] = apply_classes
-    return classes
+    """Parse .pg-foo { @apply bar baz; } rules from tailwind.css."""
+    return parse_apply_rules(decode(path.read_bytes())[0], PG_PREFIX)
+
+
+class ClassMatcher:
+    """Find mapped class names in a single left-to-right pass over a string.
+
+    Matches the same spans as the regex ``(name1|name2|...)(?![a-z0-9-])`` with the
+    names sorted longest first, but without backtracking through every alternative
+    at every position. Since class names only contain ``[a-z0-9-]`` and must not be
+    followed by one of those characters, a name can only match if it runs from its
+    start to the end of the surrounding run of class-name characters. So each run
+    starting with the shared prefix is found once and each candidate start inside
+    it needs a single set lookup, whatever the size of the map.
+
+    Names that don't start with the prefix, such as the entries of a rename table,
+    only match whole tokens inside a class context (see ``CLASS_CONTEXT_PATTERN``):
+    runs of class-name characters with no word character or dash on either side, so
+    in ``class="hover:btn my-btn"`` ``btn`` matches the first token but not the
+    second. If there are any, every token is looked at rather than only runs
+    starting with the prefix, and ``marker`` is empty, as files can't be skipped
+    just because they don't contain the prefix.
+    """
+
+    def __init__(self, names: Iterable[str], prefix: str = PG_PREFIX):
+        self.names = frozenset(names)
+        self.prefix = prefix
+        runs = re.escape(prefix) + CLASS_NAME_CHARS.pattern
+        self.marker = prefix.encode()
+        unprefixed = [name for name in self.names if not name.startswith(prefix)]
+        for name in unprefixed:
+            if not name or not CLASS_NAME_CHARS.fullmatch(name):
+                raise ValueError(
+                    f"Class name {name!r} may only contain a-z, 0-9 and dashes"
+                )
+        if unprefixed:
+            # Prefixed runs are tried first, so they behave exactly as without
+            # unprefixed names. The lookahead and backreference make the token match
+            # atomic, so it doesn't backtrack when followed by a word character.
+            runs += r"|(?<![\w-])(?=([a-z0-9-]+))\1(?![\w-])"
+            self.marker = b""
+        self.has_unprefixed = bool(unprefixed)
+        self._runs = re.compile(runs)
+
+    def context_boundary(self, buffer: str, cut: int) -> int:
+        """Return where buffer[:cut] can be cut so no class context is split.
+
+        That is the start of the first class context that doesn't end before cut,
+        or cut if there is none. Only unprefixed names depend on class contexts, so
+        without them cut is returned unchanged.
+        """
+        if not self.has_unprefixed:
+            return cut
+        for start_match in CLASS_CONTEXT_START.finditer(buffer, 0, cut):
+            start = start_match.start()
+            context = CLASS_CONTEXT_PATTERN.match(buffer, start, cut)
+            if context is None:
+                return start
+        return cut
+
+    def _token_filter(self, content: str) -> Callable[[re.Match], bool]:
+        """Return a function telling whether the whole of a run may be a mapped name.
+
+        Runs starting with the prefix always may. Unprefixed tokens may only when
+        they're inside a class context; any prefixed names within them still match.
+        """
+        if not self.has_unprefixed:
+            return lambda run_match: True
+        starts = []
+        ends = []
+        for context in CLASS_CONTEXT_PATTERN.finditer(content):
+            starts.append(context.start())
+            ends.append(context.end())
+
+        def in_context(run_match: re.Match) -> bool:
+            if run_match.group(1) is None:
+                return True
+            index = bisect_right(starts, run_match.start()) - 1
+            return index >= 0 and run_match.start() < ends[index]
+
+        return in_context
+
+    def finditer(self, content: str) -> Iterator[tuple[int, int, str]]:
+        """Yield (start, end, name) for each mapped class name in content."""
+        names = self.names
+        prefix = self.prefix
+        whole_run = self._token_filter(content)
+        for run_match in self._runs.finditer(content):
+            run = run_match.group()
+            # The run may hold more candidates, e.g. "pg-foo-pg-bar"; the leftmost
+            # one that is a mapped name wins, as it would with the regex.
+            offset = 0 if whole_run(run_match) else run.find(prefix, 1)
+            while offset != -1:
+                name = run[offset:] if offset else run
+                if name in names:
+                    yield run_match.start() + offset, run_match.end(), name
+                    break
+                offset = run.find(prefix, offset + 1)
+
+    def sub(self, repl: Callable[[str], str], content: str) -> str:
+        """Return content with each mapped class name replaced by repl(name)."""
+        names = self.names
+        prefix = self.prefix
+        whole_run = self._token_filter(content)
+
+        def replace_run(run_match):
+            run = run_match.group()
+            if run in names and whole_run(run_match):
+                return repl(run)
+            offset = run.find(prefix, 1)
+            while offset != -1:
+                if run[offset:] in names:
+                    return run[:offset] + repl(run[offset:])
+                offset = run.find(prefix, offset + 1)
+            return run
+
+        return self._runs.sub(replace_run, content)
+
+    def scan(self, content: str) -> tuple[list[tuple[int, int, str]], set[str]]:
+        """Find mapped and unmapped class names in a single pass over content.
+
+        Returns (spans, unmapped): the (start, end, name) spans that finditer would
+        yield, and the prefixed class names with no mapping, delimited by word
+        boundaries as ``ANY_PG_CLASS_PATTERN`` would find them. An unmapped name
+        ends where a mapped name after it in the same run starts.
+        """
+        spans, unmapped = self.locate(content)
+        return spans, {name for _, name in unmapped}
+
+    def locate(
+        self, content: str
+    ) -> tuple[list[tuple[int, int, str]], list[tuple[int, str]]]:
+        """Like scan, but also return where each unmapped name is.
+
+        Returns (spans, unmapped), where unmapped lists a (start, name) pair for
+        each use of an unmapped name, in order.
+        """
+        names = self.names
+        prefix = self.prefix
+        spans = []
+        unmapped = []
+        whole_run = self._token_filter(content)
+        for run_match in self._runs.finditer(content):
+            run = run_match.group()
+            run_start = run_match.start()
+            run_end = run_match.end()
+            # Offsets of the candidates before the mapped name, if there is one
+            starts = []
+            offset = 0 if whole_run(run_match) else run.find(prefix, 1)
+            while offset != -1:
+                name = run[offset:] if offset else run
+                if name in names:
+                    spans.append((run_start + offset, run_end, name))
+                    # An unmapped name can't run into the mapped one after it
+                    run_end = run_start + offset
+                    break
+                starts.append(offset)
+                offset = run.find(prefix, offset + 1)
+            # Unmapped names don't overlap, matching findall
+            unmapped_from = 0
+            for offset in starts:
+                start = run_start + offset
+                if (
+                    offset >= unmapped_from
+                    and run.startswith(prefix, offset)
+                    and _is_word_start(content, start)
+                ):
+                    end = _word_end(content, start + len(prefix) + 1, run_end)
+                    if end is not None:
+                        if content[start:end] not in names:
+                            unmapped.append((start, content[start:end]))
+                        unmapped_from = end - run_start
+        return spans, unmapped
+
+
+def _is_word_char(char: str) -> bool:
+    # The definition of \w used by re for str patterns
+    return char.isalnum() or char == "_"
+
+
+def _is_word_start(content: str, pos: int) -> bool:
+    return pos == 0 or not _is_word_char(content[pos - 1])
+
+
+def _word_end(content: str, min_end: int, run_end: int) -> int | None:
+    """Return the last word boundary in [min_end, run_end], or None if there is none."""
+    after_is_word = run_end < len(content) and _is_word_char(content[run_end])
+    for end in range(run_end, min_end - 1, -1):
+        if _is_word_char(content[end - 1]) != after_is_word:
+            return end
+        after_is_word = _is_word_char(content[end - 1])
+    return None
+
+
+def build_pattern(css_class_map: dict[str, str]) -> ClassMatcher:
+    """Build a matcher for the class names in css_class_map."""
+    return ClassMatcher(css_class_map)
+
+
+def load_css_class_map(
+    css_file: Path, use_cache: bool = True, profile: Profile | None = None
+) -> tuple[dict[str, str], ClassMatcher]:
+    """Return the class map parsed from css_file and a matcher for it.
+
+    Parsed maps are cached by the hash of the CSS, so unchanged files aren't parsed
+    again on later runs.
+    """
+    with timed(profile, "css parse"):
+        data = css_file.read_bytes()
+        key = cache.content_key(data, str(CSS_MAP_CACHE_VERSION))
+        cached = cache.read_json(CSS_MAP_CACHE, key) if use_cache else None
+        if isinstance(cached, dict) and isinstance(cached.get("classes"), dict):
+            css_class_map = cached["classes"]
+        else:
+            css_class_map = parse_apply_rules(decode(data)[0], PG_PREFIX)
+            if use_cache:
+                cache.write_json(CSS_MAP_CACHE, key, {"classes": css_class_map})
+    with timed(profile, "pattern build"):
+        return css_class_map, build_pattern(css_class_map)
+
+
+class Ruleset(NamedTuple):
+    """A named table of class renames, and the file it was read from."""
+
+    name: str
+    source: Path
+    renames: dict[str, str]
+
+
+def load_rules_file(path: Path) -> Ruleset:
+    """Load a rename table from a YAML or JSON file (by extension).
+
+    The file holds either a plain mapping of old to new class names, or a mapping
+    with a ``renames`` table and an optional ``name`` (defaulting to the file name
+    without its extension). A null new name removes the class.
+    """
+    raw = path.read_text()
+    suffix = path.suffix.lower()
+    try:
+        if suffix in (".yaml", ".yml"):
+            data = yaml.safe_load(raw)
+        elif suffix == ".json":
+            data = json.loads(raw)
+        else:
+            raise click.ClickException(
+                f"Rules file must end in .yaml, .yml, or .json "
+                f"(got {path.suffix or 'no extension'})."
+            )
+    except (yaml.YAMLError, ValueError) as e:
+        raise click.ClickException(f"Could not parse rules file {path}: {e}") from e
+    if not isinstance(data, dict):
+        raise click.ClickException(f"Rules file {path} did not parse to a dict.")
+    name = path.stem
+    if isinstance(data.get("renames"), dict):
+        name = str(data.get("name") or name)
+        data = data["renames"]
+    renames = {}
+    for old, new in data.items():
+        if not isinstance(old, str) or not CLASS_NAME_CHARS.fullmatch(old) or not old:
+            raise click.ClickException(
+                f"Invalid class name {old!r} in {path}: class names may only "
+                "contain a-z, 0-9 and dashes."
+            )
+        if new is not None and not isinstance(new, str):
+            raise click.ClickException(
+                f"Invalid replacement for {old!r} in {path}: expected a string."
+            )
+        renames[old] = new or ""
+    return Ruleset(name, path, renames)
+
 
+def combine_rulesets(rulesets: Iterable[Ruleset]) -> dict[str, str]:
+    """Merge the renames of rulesets into a single class map.
 
-def build_pattern(css_class_map: dict[str, str]) -> re.Pattern:
-    """Build regex that matches pg- class names, longest first."""
-    names = sorted(css_class_map.keys(), key=len, reverse=True)
-    return re.compile(r"(" + "|".join(re.escape(n) for n in names) + r")(?![a-z0-9-])")
+    Raises ValueError if two rulesets rename the same class differently.
+    """
+    css_class_map = {}
+    defined_by = {}
+    for ruleset in rulesets:
+        for old, new in ruleset.renames.items():
+            if old in css_class_map and css_class_map[old] != new:
+                raise ValueError(
+                    f"{old!r} is renamed to {css_class_map[old]!r} by "
+                    f"{defined_by[old].source} but to {new!r} by {ruleset.source}"
+                )
+            css_class_map[old] = new
+            defined_by.setdefault(old, ruleset)
+    return css_class_map
+
+
+def load_rulesets(
+    css_file: Path,
+    rules_files: Iterable[Path] = (),
+    use_cache: bool = True,
+    profile: Profile | None = None,
+) -> tuple[list[Ruleset], dict[str, str], ClassMatcher]:
+    """Load the pegasus class map from css_file (if it exists) and the rules files.
+
+    Returns (rulesets, combined class map, matcher for the combined map).
+    """
+    rulesets = []
+    css_class_map, matcher = {}, None
+    if css_file.exists():
+        css_class_map, matcher = load_css_class_map(css_file, use_cache, profile)
+        rulesets.append(Ruleset(PEGASUS_RULESET, css_file, css_class_map))
+    rules = []
+    for path in rules_files:
+        with timed(profile, "css parse"):
+            rules.append(load_rules_file(path))
+    if rules or matcher is None:
+        rulesets.extend(rules)
+        try:
+            css_class_map = combine_rulesets(rulesets)
+        except ValueError as e:
+            raise click.ClickException(f"Conflicting rules: {e}") from e
+        with timed(profile, "pattern build"):
+            matcher = build_pattern(css_class_map)
+    return rulesets, css_class_map, matcher
 
 
 def migrate_file(
     filepath: Path,
-    pattern: re.Pattern,
+    matcher: ClassMatcher,
     css_class_map: dict[str, str],
     dry_run: bool = False,
 ) -> tuple[list[tuple[str, str]], set[str]]:
     """Replace pg- classes in a single file.
 
     Returns (replacements made, set of pg- class names found but not in the mapping).
+    The file is replaced atomically, so it is never left half-written.
+    """
+    if filepath.stat().st_size >= STREAM_THRESHOLD:
+        return migrate_large_file(filepath, matcher, css_class_map, dry_run)
+    data, _ = read_candidate(filepath, matcher.marker)
+    replacements, unmigrated, _ = _migrate_data(
+        filepath, data, matcher, css_class_map, dry_run
+    )
+    return replacements, unmigrated
+
+
+def migrate_large_file(
+    filepath: Path,
+    matcher: ClassMatcher,
+    css_class_map: dict[str, str],
+    dry_run: bool = False,
+    chunk_size: int = CHUNK_SIZE,
+) -> tuple[list[tuple[str, str]], set[str]]:
+    """Like migrate_file, but with memory bounded by chunk_size whatever the file size.
+
+    The file is decoded and scanned chunk_size characters at a time. The trailing
+    partial token of each chunk is carried over to the next one, so class names
+    spanning a chunk boundary are still found. Output goes to a temporary file next
+    to filepath, which atomically replaces it once the whole file has been processed.
     """
-    content = filepath.read_text()
+    replacements, unmigrated, _ = _migrate_large_file(
+        filepath, matcher, css_class_map, dry_run, chunk_size
+    )
+    return replacements, unmigrated
+
+
+def _migrate_large_file(
+    filepath: Path,
+    matcher: ClassMatcher,
+    css_class_map: dict[str, str],
+    dry_run: bool,
+    chunk_size: int = CHUNK_SIZE,
+    stage: bool = False,
+) -> tuple[list[tuple[str, str]], set[str], str | None]:
+    if not _file_contains(filepath, matcher.marker):
+        return [], set(), None
+    with open(filepath, "rb") as f:
+        has_bom = f.read(len(codecs.BOM_UTF8)) == codecs.BOM_UTF8
+    encoding = "utf-8-sig" if has_bom else "utf-8"
+    try:
+        return _stream_file(
+            filepath, encoding, matcher, css_class_map, dry_run, chunk_size, stage
+        )
+    except UnicodeDecodeError:
+        if has_bom:
+            raise
+        # As in decode(), latin-1 round-trips any other 8-bit encoding unchanged
+        return _stream_file(
+            filepath, "latin-1", matcher, css_class_map, dry_run, chunk_size, stage
+        )
+
+
+def _stream_file(
+    filepath: Path,
+    encoding: str,
+    matcher: ClassMatcher,
+    css_class_map: dict[str, str],
+    dry_run: bool,
+    chunk_size: int,
+    stage: bool,
+) -> tuple[list[tuple[str, str]], set[str], str | None]:
     replacements = []
+    unmigrated = set()
+    staged = None
+    out = None
+    if not dry_run:
+        out = tempfile.NamedTemporaryFile(
+            "w",
+            encoding=encoding,
+            newline="",
+            dir=filepath.parent,
+            prefix=f".{filepath.name}.",
+            suffix=".tmp",
+            delete=False,
+        )
+    try:
+        with open(filepath, encoding=encoding, newline="") as f:
+            carry = ""
+            while True:
+                chunk = f.read(chunk_size)
+                buffer = carry + chunk
+                cut = len(buffer)
+                if chunk:
+                    cut = matcher.context_boundary(buffer, _token_boundary(buffer))
+                if cut == 0 and chunk:
+                    # A single token or class context longer than a chunk; only
+                    # split it if it gets unreasonably long.
+                    if len(buffer) < max(4 * chunk_size, 4096):
+                        carry = buffer
+                        continue
+                    cut = len(buffer)
+                segment, carry = buffer[:cut], buffer[cut:]
+                spans, found = matcher.scan(segment)
+                unmigrated |= found
+                replacements.extend((name, css_class_map[name]) for _, _, name in spans)
+                if out is not None:
+                    if spans:
+                        segment = apply_replacements(segment, spans, css_class_map)
+                    out.write(segment)
+                if not chunk:
+                    break
+        if out is not None:
+            out.close()
+            if not replacements:
+                os.remove(out.name)
+            elif stage:
+                shutil.copymode(filepath, out.name)
+                staged = out.name
+            else:
+                shutil.copymode(filepath, out.name)
+                os.replace(out.name, filepath)
+    except BaseException:
+        if out is not None:
+            out.close()
+            os.remove(out.name)
+        raise
+    return replacements, unmigrated, staged
+
+
+def diff_file(
+    filepath: Path,
+    matcher: ClassMatcher,
+    css_class_map: dict[str, str],
+    out: BinaryIO,
+) -> tuple[list[tuple[str, str]], set[str]]:
+    """Write a unified diff of the replacements migrate_file would make to out.
 
-    def replace_match(match):
-        old = match.group(1)
-        new = css_class_map[old]
-        replacements.append((old, new))
-        return new + match.group(0)[len(old) :]
+    The file itself is left untouched. It is read a line at a time, which finds the
+    same classes as scanning it whole, since class names never span lines (lines
+    are only held back while a class context spans them), and keeps memory flat
+    however big the file is. Each line is decoded on its own and encoded
+    back the same way, so the diff matches the file's bytes exactly.
 
-    new_content = pattern.sub(replace_match, content)
+    Returns (replacements, unmigrated) as migrate_file does.
+    """
+    replacements = []
+    unmigrated = set()
+    if not _file_contains(filepath, matcher.marker):
+        return replacements, unmigrated
 
-    unmigrated = {
-        name
-        for name in ANY_PG_CLASS_PATTERN.findall(new_content)
-        if name not in css_class_map
-    }
+    def scan_lines(pending):
+        text = "".join(line for _, line, _ in pending)
+        spans, found = matcher.scan(text)
+        unmigrated.update(found)
+        replacements.extend((name, css_class_map[name]) for _, _, name in spans)
+        start = 0
+        for raw, line, encoding in pending:
+            end = start + len(line)
+            line_spans = [
+                (span_start - start, span_end - start, name)
+                for span_start, span_end, name in spans
+                if start <= span_start < end
+            ]
+            start = end
+            if not line_spans:
+                yield raw, raw
+                continue
+            new = apply_replacements(line, line_spans, css_class_map)
+            yield raw, new.encode(encoding)
 
-    if replacements and not dry_run:
-        filepath.write_text(new_content)
+    def lines():
+        # Lines are scanned together while a class context runs on to the next one
+        pending = []
+        with open(filepath, "rb") as f:
+            for raw in f:
+                if not pending and matcher.marker not in raw:
+                    yield raw, raw
+                    continue
+                try:
+                    line, encoding = raw.decode("utf-8"), "utf-8"
+                except UnicodeDecodeError:
+                    line, encoding = raw.decode("latin-1"), "latin-1"
+                pending.append((raw, line, encoding))
+                if matcher.has_unprefixed:
+                    text = "".join(line for _, line, _ in pending)
+                    if matcher.context_boundary(text, len(text)) < len(text):
+                        continue
+                yield from scan_lines(pending)
+                pending = []
+        yield from scan_lines(pending)
 
+    path = Path(os.path.relpath(filepath)) if filepath.is_absolute() else filepath
+    for chunk in unified_diff(path.as_posix(), lines()):
+        out.write(chunk)
     return replacements, unmigrated
 
 
+def _token_boundary(buffer: str) -> int:
+    """Return the start of the trailing run of word characters and dashes in buffer.
+
+    Everything before it can be scanned on its own: no class name can span the
+    boundary, and the character before it is a word boundary.
+    """
+    cut = len(buffer)
+    while cut and (_is_word_char(buffer[cut - 1]) or buffer[cut - 1] == "-"):
+        cut -= 1
+    return cut
+
+
+def _file_contains(filepath: Path, marker: bytes) -> bool:
+    with open(filepath, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return False
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return mapped.find(marker) != -1
+
+
+def read_candidate(
+    filepath: Path, marker: bytes, with_digest: bool = False
+) -> tuple[bytes | None, str | None]:
+    """Read filepath as bytes if it contains marker.
+
+    Returns (data, digest). data is None if the file doesn't contain marker, so it
+    never needs to be decoded or scanned. digest is the sha256 of the file contents
+    if with_digest is set. Large files are memory-mapped, so those without the
+    marker are never copied into memory.
+    """
+    with open(filepath, "rb") as f:
+        if os.fstat(f.fileno()).st_size < MMAP_THRESHOLD:
+            data = f.read()
+            digest = hashlib.sha256(data).hexdigest() if with_digest else None
+            return (data if marker in data else None), digest
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            digest = hashlib.sha256(mapped).hexdigest() if with_digest else None
+            if mapped.find(marker) == -1:
+                return None, digest
+            return mapped[:], digest
+
+
+def decode(data: bytes) -> tuple[str, str]:
+    """Decode file contents, returning (content, encoding).
+
+    Newlines are left untranslated and the encoding is returned, so that writing
+    content.encode(encoding) back preserves the original bytes outside of the
+    replacements.
+    """
+    if data.startswith(codecs.BOM_UTF8):
+        return data.decode("utf-8-sig"), "utf-8-sig"
+    try:
+        return data.decode("utf-8"), "utf-8"
+    except UnicodeDecodeError:
+        # latin-1 maps every byte, so unknown 8-bit encodings round-trip unchanged
+        return data.decode("latin-1"), "latin-1"
+
+
+def _migrate_data(
+    filepath: Path,
+    data: bytes | None,
+    matcher: ClassMatcher,
+    css_class_map: dict[str, str],
+    dry_run: bool,
+    stage: bool = False,
+    stats: dict | None = None,
+) -> tuple[list[tuple[str, str]], set[str], str | None]:
+    """Migrate the contents of filepath, already read as data.
+
+    Returns (replacements, unmigrated, staged). The new contents are written to a
+    temporary file next to filepath, which replaces it straight away unless stage
+    is set, in which case its path is returned as staged for the caller to swap in.
+    If stats is given, the time spent matching and writing is added to it.
+    """
+    if data is None:
+        return [], set(), None
+    start = time.perf_counter()
+    content, encoding = decode(data)
+    spans, unmigrated = matcher.scan(content)
+    replacements = [(name, css_class_map[name]) for _, _, name in spans]
+    matched = time.perf_counter()
+
+    staged = None
+    if replacements and not dry_run:
+        new_data = apply_replacements(content, spans, css_class_map).encode(encoding)
+        staged = _write_staged(filepath, new_data)
+        if not stage:
+            os.replace(staged, filepath)
+            staged = None
+        if stats is not None:
+            stats["bytes_written"] += len(new_data)
+            stats["write"] += time.perf_counter() - matched
+
+    if stats is not None:
+        stats["match"] += matched - start
+    return replacements, unmigrated, staged
+
+
+def _write_staged(filepath: Path, data: bytes) -> str:
+    """Write data to a new temporary file next to filepath, with the same mode."""
+    fd, staged = tempfile.mkstemp(
+        dir=filepath.parent, prefix=f".{filepath.name}.", suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        shutil.copymode(filepath, staged)
+    except BaseException:
+        os.remove(staged)
+        raise
+    return staged
+
+
+def apply_replacements(
+    content: str, spans: list[tuple[int, int, str]], css_class_map: dict[str, str]
+) -> str:
+    """Return content with each (start, end, name) span replaced by its mapping."""
+    parts = []
+    last = 0
+    for start, end, name in spans:
+        parts.append(content[last:start])
+        parts.append(css_class_map[name])
+        last = end
+    parts.append(content[last:])
+    return "".join(parts)
+
+
+def sniff_file(filepath: Path) -> str | None:
+    """Return the reason to skip filepath without scanning it, or None.
+
+    Only the first SNIFF_SIZE bytes are read. A file is "binary" if they contain a
+    NUL byte, "minified" if it is at least MINIFIED_MIN_SIZE bytes and its lines
+    average MINIFIED_LINE_LENGTH bytes or more, and "vendored" if they contain one
+    of the VENDOR_MARKERS left by bundlers, or if it is at least
+    VENDOR_BANNER_MIN_SIZE bytes and they contain a license banner or another of the
+    VENDOR_BANNER_MARKERS. None of these ever hold hand-written classes.
+    """
+    with open(filepath, "rb") as f:
+        head = f.read(SNIFF_SIZE)
+        size = os.fstat(f.fileno()).st_size
+    if b"\0" in head:
+        return "binary"
+    if size >= MINIFIED_MIN_SIZE and len(head) >= MINIFIED_LINE_LENGTH * (
+        head.count(b"\n") + 1
+    ):
+        return "minified"
+    if any(marker in head for marker in VENDOR_MARKERS):
+        return "vendored"
+    if size >= VENDOR_BANNER_MIN_SIZE and any(
+        marker in head for marker in VENDOR_BANNER_MARKERS
+    ):
+        return "vendored"
+    return None
+
+
+def sniff_filter(always_migrate: Iterable[str] = ()) -> Callable[[Path], bool]:
+    """Return a function telling whether a file should be sniffed before migrating.
+
+    Files whose path or name matches one of the always_migrate globs never are.
+    """
+    is_forced = exclude_matcher(always_migrate)
+    return lambda filepath: (
+        not (is_forced(filepath.as_posix()) or is_forced(filepath.name))
+    )
+
+
+def find_files(
+    dirs: tuple[Path, ...],
+    excludes: tuple[str, ...] = EXCLUDES,
+    use_gitignore: bool = True,
+) -> list[Path]:
+    """Return the files under dirs that should be migrated, in a stable order."""
+    files = []
+    for search_dir in dirs:
+        if search_dir.is_dir():
+            files.extend(walk_files(search_dir, EXTENSIONS, excludes, use_gitignore))
+    return files
+
+
+def select_files(
+    paths: Iterable[Path],
+    dirs: tuple[Path, ...],
+    excludes: tuple[str, ...] = EXCLUDES,
+) -> list[Path]:
+    """Return those of paths that find_files(dirs, excludes) would find, in order.
+
+    This lets a run cover just the files passed on the command line or changed in
+    git, while migrating exactly the files a full run would have. Only files inside
+    dirs, with a supported extension and with no excluded directory or file name
+    below the search dir are kept. .gitignore isn't consulted, since files that git
+    reports as changed aren't ignored.
+    """
+    is_excluded = exclude_matcher(excludes)
+    roots = [os.path.abspath(search_dir) for search_dir in dirs]
+    selected = set()
+    for path in paths:
+        if path.suffix not in EXTENSIONS or not path.is_file():
+            continue
+        abs_path = os.path.abspath(path)
+        for root in roots:
+            if abs_path.startswith(root + os.sep):
+                parts = abs_path[len(root) + 1 :].split(os.sep)
+                if not any(is_excluded(part) for part in parts):
+                    selected.add(Path(os.path.normpath(path)))
+                break
+    return sorted(selected)
+
+
+def shard_files(files: list[Path], index: int, count: int) -> list[Path]:
+    """Return the files in shard index (counting from 1) of count.
+
+    Files are assigned to shards by a hash of their path, so a file is always in the
+    same shard whichever machine runs it and whatever other files there are.
+    """
+    return [filepath for filepath in files if _shard_of(filepath, count) == index - 1]
+
+
+def _shard_of(filepath: Path, count: int) -> int:
+    digest = hashlib.sha256(filepath.as_posix().encode()).digest()
+    return int.from_bytes(digest[:8], "big") % count
+
+
+def validate_shard(ctx, param, value):
+    if value is None:
+        return None
+    index, _, count = value.partition("/")
+    if not (index.isdigit() and count.isdigit() and 1 <= int(index) <= int(count)):
+        raise click.BadParameter(
+            f"'{value}' is not a valid shard. Use i/N, e.g. 1/4, with i from 1 to N."
+        )
+    return int(index), int(count)
+
+
+class StatRecord:
+    """Base for on-disk records of files whose entries stay valid while the file's
+    size and mtime are unchanged.
+
+    Entries hold a file's ``size`` and ``mtime_ns``, and the record stores the time
+    it was saved, since a file modified at or after that time may have changed
+    again within the same mtime tick.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.saved_at_ns = 0
+
+    def is_fresh(self, filepath: Path, entry: dict) -> bool:
+        """Whether filepath is unchanged since entry was recorded, judged by stat alone."""
+        try:
+            stat = filepath.stat()
+        except OSError:
+            return False
+        return (
+            stat.st_size == entry["size"]
+            and stat.st_mtime_ns == entry["mtime_ns"]
+            and stat.st_mtime_ns < self.saved_at_ns
+        )
+
+    def write(self, text: str):
+        """Replace the record on disk with text atomically."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        tmp_path.write_text(text)
+        os.replace(tmp_path, self.path)
+
+
+class Manifest(StatRecord):
+    """On-disk record of files already known to need no replacements.
+
+    Entries are keyed by path and store the file's size, mtime and content hash along
+    with the unmapped pg- classes it contains, so a clean file can be skipped (and
+    still reported) without being scanned again. The whole manifest is tied to a
+    fingerprint of the class map and is discarded when the map changes.
+    """
+
+    # Bumped whenever the rules for skipping files change, since skipped files are
+    # recorded too
+    VERSION = 2
+
+    def __init__(self, path: Path, fingerprint: str, entries: dict | None = None):
+        super().__init__(path)
+        self.fingerprint = fingerprint
+        self.entries: dict[str, dict] = entries or {}
+
+    @classmethod
+    def load(cls, path: Path, fingerprint: str) -> "Manifest":
+        """Load the manifest at path, or return an empty one if it is missing,
+        unreadable or was built from a different class map."""
+        manifest = cls(path, fingerprint)
+        try:
+            data = json.loads(path.read_text())
+        except (OSError, ValueError):
+            return manifest
+        if (
+            not isinstance(data, dict)
+            or data.get("version") != cls.VERSION
+            or data.get("fingerprint") != fingerprint
+        ):
+            return manifest
+        manifest.entries = data.get("files", {})
+        manifest.saved_at_ns = data.get("saved_at_ns", 0)
+        return manifest
+
+    def save(self):
+        """Write the manifest atomically."""
+        data = {
+            "version": self.VERSION,
+            "fingerprint": self.fingerprint,
+            "saved_at_ns": time.time_ns(),
+            "files": self.entries,
+        }
+        self.write(json.dumps(data, sort_keys=True))
+
+    def get(self, filepath: Path) -> dict | None:
+        return self.entries.get(str(filepath))
+
+    def update(self, filepath: Path, entry: dict | None):
+        if entry is None:
+            self.entries.pop(str(filepath), None)
+        else:
+            self.entries[str(filepath)] = entry
+
+
+def css_class_map_fingerprint(css_class_map: dict[str, str]) -> str:
+    """Return a hash that changes whenever the class map does."""
+    serialized = json.dumps(css_class_map, sort_keys=True).encode()
+    return hashlib.sha256(serialized).hexdigest()
+
+
+def migrate_file_with_manifest(
+    filepath: Path,
+    matcher: ClassMatcher,
+    css_class_map: dict[str, str],
+    dry_run: bool = False,
+    entry: dict | None = None,
+    stage: bool = False,
+    sniff: bool = False,
+    stats: dict | None = None,
+) -> tuple[list[tuple[str, str]], set[str], dict | None, str | None]:
+    """Like migrate_file, but skip the scan if the content hash matches entry.
+
+    Returns (replacements, unmigrated, new manifest entry, staged). The new entry is
+    None if the file still needs (or just had) replacements. If stage is set, the
+    new contents are left in a temporary file, returned as staged, rather than
+    replacing filepath.
+
+    If sniff is set, files that sniff_file says to skip are not read any further,
+    and the reason is recorded in the new entry as "skipped".
+
+    If stats (from new_file_stats) is given, the time spent on each phase and the
+    bytes read and written are added to it. Streamed files are read while they are
+    matched, so all of their time counts as matching.
+    """
+    start = time.perf_counter()
+    stat = filepath.stat()
+    if sniff:
+        reason = sniff_file(filepath)
+        if reason is not None:
+            if stats is not None:
+                stats["read"] += time.perf_counter() - start
+                stats["bytes_read"] += min(stat.st_size, SNIFF_SIZE)
+            return (
+                [],
+                set(),
+                {**_manifest_entry(stat, None, []), "skipped": reason},
+                None,
+            )
+    if stat.st_size >= STREAM_THRESHOLD:
+        data = None
+        digest = _file_digest(filepath)
+    else:
+        data, digest = read_candidate(filepath, matcher.marker, with_digest=True)
+    if stats is not None:
+        stats["read"] += time.perf_counter() - start
+        stats["bytes_read"] += stat.st_size
+    if entry is not None and entry["sha256"] == digest:
+        return (
+            [],
+            set(entry["unmigrated"]),
+            _manifest_entry(stat, digest, entry["unmigrated"]),
+            None,
+        )
+
+    if stat.st_size >= STREAM_THRESHOLD:
+        start = time.perf_counter()
+        replacements, unmigrated, staged = _migrate_large_file(
+            filepath, matcher, css_class_map, dry_run, stage=stage
+        )
+        if stats is not None:
+            stats["match"] += time.perf_counter() - start
+            stats["bytes_read"] += stat.st_size
+            if replacements and not dry_run:
+                stats["bytes_written"] += os.path.getsize(staged or filepath)
+    else:
+        replacements, unmigrated, staged = _migrate_data(
+            filepath, data, matcher, css_class_map, dry_run, stage, stats
+        )
+    if replacements:
+        return replacements, unmigrated, None, staged
+    entry = _manifest_entry(stat, digest, sorted(unmigrated))
+    return replacements, unmigrated, entry, None
+
+
+def _file_digest(filepath: Path) -> str:
+    with open(filepath, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return hashlib.sha256().hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return hashlib.sha256(mapped).hexdigest()
+
+
+def _manifest_entry(
+    stat: os.stat_result, digest: str | None, unmigrated: list[str]
+) -> dict:
+    return {
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "sha256": digest,
+        "unmigrated": unmigrated,
+    }
+
+
+# Per-process state for pool workers, populated once by _init_worker so the class map
+# and matcher are not re-sent with every file.
+_worker_state: dict = {}
+
+
+def _init_worker(
+    matcher: ClassMatcher,
+    css_class_map: dict[str, str],
+    dry_run: bool,
+    stage: bool,
+    profile: bool,
+):
+    _worker_state["matcher"] = matcher
+    _worker_state["css_class_map"] = css_class_map
+    _worker_state["dry_run"] = dry_run
+    _worker_state["stage"] = stage
+    _worker_state["profile"] = profile
+
+
+def _migrate_files_in_worker(tasks: list[tuple[Path, dict | None, bool]]) -> list:
+    return [_migrate_task(task, **_worker_state) for task in tasks]
+
+
+def _migrate_task(
+    task: tuple[Path, dict | None, bool],
+    matcher: ClassMatcher,
+    css_class_map: dict[str, str],
+    dry_run: bool,
+    stage: bool,
+    profile: bool,
+) -> tuple[list[tuple[str, str]], set[str], dict | None, str | None, dict | None]:
+    """Run migrate_file_with_manifest for a task, returning its result and stats."""
+    filepath, entry, sniff = task
+    stats = new_file_stats() if profile else None
+    result = migrate_file_with_manifest(
+        filepath,
+        matcher,
+        css_class_map,
+        dry_run=dry_run,
+        entry=entry,
+        stage=stage,
+        sniff=sniff,
+        stats=stats,
+    )
+    return (*result, stats)
+
+
+def migrate_files(
+    files: list[Path],
+    matcher: ClassMatcher,
+    css_class_map: dict[str, str],
+    dry_run: bool = False,
+    jobs: int = 1,
+    manifest: Manifest | None = None,
+    transaction: Transaction | None = None,
+    sniff: Callable[[Path], bool] | None = None,
+    profile: Profile | None = None,
+):
+    """Run migrate_file over files, yielding (filepath, replacements, unmigrated,
+    skipped).
+
+    With jobs > 1 the work is spread over a process pool. Results are always yielded
+    in the order of files, so output does not depend on the number of workers.
+
+    If a manifest is given, files it records as unchanged and clean are skipped, and
+    it is updated with the outcome for every other file.
+
+    If a transaction is given, new file contents are staged and handed to it to be
+    swapped in, rather than each file being replaced as soon as it is migrated. A
+    file is only guaranteed to have been written once the transaction is flushed.
+
+    If sniff is given, files for which it returns True are first checked with
+    sniff_file, and skipped is the reason for skipping them (None for files that
+    were scanned).
+
+    If a profile is given, the time taken by each file is added to it.
+    """
+    stage = transaction is not None
+    fresh = {}
+    tasks = []
+    for filepath in files:
+        entry = manifest.get(filepath) if manifest else None
+        should_sniff = sniff is not None and sniff(filepath)
+        if (
+            entry is not None
+            and manifest.is_fresh(filepath, entry)
+            and (should_sniff or "skipped" not in entry)
+        ):
+            fresh[filepath] = entry
+        else:
+            tasks.append((filepath, entry, should_sniff))
+
+    if jobs <= 1 or len(tasks) <= 1:
+        results = (
+            _migrate_task(
+                task, matcher, css_class_map, dry_run, stage, profile is not None
+            )
+            for task in tasks
+        )
+        yield from _merge_results(files, fresh, results, manifest, transaction, profile)
+        return
+
+    jobs = min(jobs, len(tasks))
+    chunksize = max(1, min(64, len(tasks) // (jobs * 4)))
+    with ProcessPoolExecutor(
+        max_workers=jobs,
+        initializer=_init_worker,
+        initargs=(matcher, css_class_map, dry_run, stage, profile is not None),
+    ) as executor:
+        results = _pool_results(executor, tasks, jobs, chunksize, stage)
+        yield from _merge_results(files, fresh, results, manifest, transaction, profile)
+
+
+def _pool_results(
+    executor: ProcessPoolExecutor,
+    tasks: list[tuple[Path, dict | None, bool]],
+    jobs: int,
+    chunksize: int,
+    stage: bool,
+) -> Iterator[tuple]:
+    """Yield the results of running tasks in executor, in order.
+
+    Unlike executor.map, only a couple of chunks per worker are submitted ahead of
+    the results being consumed, so that workers don't stage new contents for the
+    whole tree before any of it is handed to the transaction. If the caller stops
+    early or a worker fails, the pool is shut down and any files staged for tasks
+    whose results were never yielded are removed.
+    """
+    chunks = iter([tasks[i : i + chunksize] for i in range(0, len(tasks), chunksize)])
+    pending = deque(
+        executor.submit(_migrate_files_in_worker, chunk)
+        for chunk in islice(chunks, 2 * jobs)
+    )
+    yielded = 0
+    try:
+        while pending:
+            results = pending.popleft().result()
+            chunk = next(chunks, None)
+            if chunk is not None:
+                pending.append(executor.submit(_migrate_files_in_worker, chunk))
+            for result in results:
+                # Counted before it's yielded, since the caller may never resume
+                # the generator after taking the last result
+                yielded += 1
+                yield result
+    finally:
+        if yielded < len(tasks):
+            executor.shutdown(wait=True, cancel_futures=True)
+            if stage:
+                _remove_staged_files([filepath for filepath, _, _ in tasks[yielded:]])
+
+
+def _remove_staged_files(filepaths: list[Path]):
+    """Remove the temporary files staged by _write_staged or _stream_file for
+    filepaths, listing each directory only once."""
+    names_by_dir: dict[Path, set[str]] = {}
+    for filepath in filepaths:
+        names_by_dir.setdefault(filepath.parent, set()).add(filepath.name)
+    for directory, names in names_by_dir.items():
+        try:
+            entries = os.listdir(directory)
+        except OSError:
+            continue
+        for entry in entries:
+            # Staged files are named .<name>.<random>.tmp
+            if not (entry.startswith(".") and entry.endswith(".tmp")):
+                continue
+            if entry[1:-4].rpartition(".")[0] in names:
+                try:
+                    os.remove(directory / entry)
+                except OSError:
+                    pass
+
+
+def _merge_results(files, fresh, results, manifest, transaction, profile):
+    """Interleave skipped files with scan results, in the original file order."""
+    results = iter(results)
+    for filepath in files:
+        if filepath in fresh:
+            entry = fresh[filepath]
+            yield filepath, [], set(entry["unmigrated"]), entry.get("skipped")
+            continue
+        replacements, unmigrated, entry, staged, stats = next(results)
+        if profile is not None:
+            profile.add_file(filepath, stats)
+        if manifest is not None:
+            manifest.update(filepath, entry)
+        if staged is not None:
+            transaction.add(filepath, staged)
+        skipped = entry.get("skipped") if entry is not None else None
+        yield filepath, replacements, unmigrated, skipped
+
+
+class MigrationReport:
+    """Aggregates migrate_css results and writes them out as they arrive.
+
+    Formats:
+      text     per-file lines with per-class counts, then the totals
+      summary  only the totals and unmigrated classes
+      json     one JSON document, with file records streamed into a "files" list
+      ndjson   one JSON object per line: a record per file, then the summary
+
+    With verbose, the text format also lists every single replacement; skipped files
+    are always listed. If there is more than one ruleset, replacements are also counted per
+    ruleset. With err, the report goes to stderr, leaving stdout free for a diff.
+    With shard, an (index, count) pair, the summary records which shard of the files
+    the report covers, so that merge_reports can check every shard is present.
+
+    Only a count and the first few files are kept for each unmapped class, so
+    memory use doesn't grow with the size of the project. The full list can be
+    written to unmigrated_file as it is found, one ``class<TAB>path`` line each.
+    """
+
+    FORMATS = ("text", "summary", "json", "ndjson")
+
+    def __init__(
+        self,
+        fmt: str,
+        css_file: Path,
+        dry_run: bool = False,
+        verbose: bool = False,
+        rulesets: list[Ruleset] | None = None,
+        err: bool = False,
+        shard: tuple[int, int] | None = None,
+        unmigrated_file: TextIO | None = None,
+    ):
+        self.fmt = fmt
+        self.css_file = css_file
+        self.dry_run = dry_run
+        self.verbose = verbose
+        self.rulesets = rulesets or []
+        self.err = err
+        self.shard = shard
+        self.unmigrated_file = unmigrated_file
+        self.total_files = 0
+        self.total_replacements = 0
+        self.replacements_by_ruleset: Counter[str] = Counter()
+        self.skipped_by_reason: Counter[str] = Counter()
+        # Number of files using each unmapped class, and the first few of them
+        self.unmigrated_by_class: Counter[str] = Counter()
+        self.unmigrated_examples: dict[str, list[Path]] = {}
+        self._files_written = 0
+        # The first ruleset defining a class gets the credit for it
+        self._ruleset_of = {
+            old: ruleset.name
+            for ruleset in reversed(self.rulesets)
+            for old in ruleset.renames
+        }
+
+    def start(self, css_class_map: dict[str, str] | None = None):
+        """Begin the report, announcing css_class_map if it was just loaded."""
+        if css_class_map is not None:
+            message = (
+                "\n".join(
+                    f"Loaded {len(ruleset.renames)} class mappings from {ruleset.source}"
+                    for ruleset in self.rulesets
+                )
+                or f"Loaded {len(css_class_map)} class mappings from {self.css_file}"
+            )
+            if self.fmt == "text":
+                self._echo(message + "\n")
+            else:
+                click.echo(message, err=True)
+        if self.fmt == "json":
+            self._echo('{"files": [', nl=False)
+
+    def add_file(
+        self,
+        filepath: Path,
+        replacements: list[tuple[str, str]],
+        unmigrated: set[str],
+        skipped: str | None = None,
+    ):
+        if skipped is not None:
+            self.skipped_by_reason[skipped] += 1
+            if self.fmt == "text":
+                self._echo(f"  skipped {filepath} ({skipped})")
+            elif self.fmt in ("json", "ndjson"):
+                self._write_record({"path": str(filepath), "skipped": skipped})
+            return
+        if replacements:
+            self.total_files += 1
+            self.total_replacements += len(replacements)
+            if len(self.rulesets) > 1:
+                self.replacements_by_ruleset.update(
+                    self._ruleset_of[old] for old, _ in replacements
+                )
+        for name in unmigrated:
+            self.unmigrated_by_class[name] += 1
+            examples = self.unmigrated_examples.setdefault(name, [])
+            if len(examples) < UNMIGRATED_SAMPLE_SIZE:
+                examples.append(filepath)
+            if self.unmigrated_file is not None:
+                self.unmigrated_file.write(f"{name}\t{filepath}\n")
+        if not (replacements or unmigrated) or self.fmt == "summary":
+            return
+        if self.fmt == "text":
+            self._write_text_file(filepath, replacements)
+        else:
+            self._write_record(self._file_record(filepath, replacements, unmigrated))
+
+    def finish(self):
+        if self.fmt in ("json", "ndjson"):
+            summary = self.summary()
+            if self.fmt == "json":
+                self._echo('], "summary": ' + json.dumps(summary) + "}")
+            else:
+                self._echo(json.dumps({"type": "summary", **summary}))
+            return
+
+        if self.total_replacements:
+            action = "Would update" if self.dry_run else "Updated"
+            self._echo(
+                f"\n{action} {self.total_replacements} class references "
+                f"in {self.total_files} files"
+            )
+            if len(self.rulesets) > 1:
+                for ruleset in self.rulesets:
+                    count = self.replacements_by_ruleset[ruleset.name]
+                    self._echo(f"  {ruleset.name}: {count}")
+        elif self._uses_rules_files():
+            self._echo(f"No classes from {self._mapping_files()} found to migrate.")
+        else:
+            self._echo("No pg- CSS classes found to migrate.")
+
+        if self.skipped_by_reason:
+            total = sum(self.skipped_by_reason.values())
+            reasons = ", ".join(
+                f"{self.skipped_by_reason[reason]} {reason}"
+                for reason in SKIP_REASONS
+                if self.skipped_by_reason[reason]
+            )
+            self._echo(
+                f"\nSkipped {total} file{'s' if total != 1 else ''} ({reasons}). "
+                "Pass --always-migrate to migrate them anyway."
+            )
+
+        if self.unmigrated_by_class:
+            self._echo(
+                f"\nFound {len(self.unmigrated_by_class)} pg- class(es) with no mapping "
+                f"in {self._mapping_files()}. These classes cannot yet be migrated:"
+            )
+            for name in sorted(self.unmigrated_by_class):
+                count = self.unmigrated_by_class[name]
+                self._echo(f"  {name} ({count} file{'s' if count != 1 else ''})")
+                if self.verbose:
+                    examples = self.unmigrated_examples[name]
+                    for filepath in examples:
+                        self._echo(f"    {filepath}")
+                    if count > len(examples):
+                        self._echo(f"    ... and {count - len(examples)} more")
+
+    def _uses_rules_files(self) -> bool:
+        return any(ruleset.name != PEGASUS_RULESET for ruleset in self.rulesets)
+
+    def _mapping_files(self) -> str:
+        """Name the files the class mappings were read from."""
+        if not self._uses_rules_files():
+            return str(self.css_file)
+        return ", ".join(str(ruleset.source) for ruleset in self.rulesets)
+
+    def summary(self) -> dict:
+        summary = {
+            "css_file": str(self.css_file),
+            "dry_run": self.dry_run,
+            "total_files": self.total_files,
+            "total_replacements": self.total_replacements,
+            "unmigrated_by_class": {
+                name: self.unmigrated_by_class[name]
+                for name in sorted(self.unmigrated_by_class)
+            },
+        }
+        if self._uses_rules_files():
+            summary["rulesets"] = {
+                ruleset.name: str(ruleset.source) for ruleset in self.rulesets
+            }
+        if len(self.rulesets) > 1:
+            summary["replacements_by_ruleset"] = {
+                ruleset.name: self.replacements_by_ruleset[ruleset.name]
+                for ruleset in self.rulesets
+            }
+        if self.skipped_by_reason:
+            summary["skipped_by_reason"] = {
+                reason: self.skipped_by_reason[reason]
+                for reason in SKIP_REASONS
+                if self.skipped_by_reason[reason]
+            }
+        if self.shard is not None:
+            summary["shard"] = "{}/{}".format(*self.shard)
+        return summary
+
+    def _write_text_file(self, filepath: Path, replacements: list[tuple[str, str]]):
+        if not replacements:
+            return
+        prefix = "[dry run] " if self.dry_run else ""
+        lines = [f"  {prefix}{filepath} ({len(replacements)} replacements)"]
+        if self.verbose:
+            lines.extend(f"    {old} -> {new}" for old, new in replacements)
+        else:
+            counts = Counter(replacements)
+            lines.extend(
+                f"    {old} -> {new} (x{count})" if count > 1 else f"    {old} -> {new}"
+                for (old, new), count in counts.items()
+            )
+        self._echo("\n".join(lines))
+
+    def _file_record(
+        self, filepath: Path, replacements: list[tuple[str, str]], unmigrated: set[str]
+    ) -> dict:
+        classes = {}
+        for (old, new), count in Counter(replacements).items():
+            classes[old] = {"to": new, "count": count}
+        return {
+            "path": str(filepath),
+            "replacements": len(replacements),
+            "classes": classes,
+            "unmigrated": sorted(unmigrated),
+        }
+
+    def _echo(self, message: str, nl: bool = True):
+        click.echo(message, nl=nl, err=self.err)
+
+    def _write_record(self, record: dict):
+        if self.fmt == "ndjson":
+            self._echo(json.dumps({"type": "file", **record}))
+        else:
+            separator = "," if self._files_written else ""
+            self._echo(separator + json.dumps(record), nl=False)
+        self._files_written += 1
+
+
+def read_report(path: Path) -> tuple[list[dict], dict]:
+    """Read a json or ndjson migrate-css report, returning (file records, summary)."""
+    try:
+        text = path.read_text()
+        try:
+            data = json.loads(text)
+        except ValueError:
+            lines = [json.loads(line) for line in text.splitlines() if line.strip()]
+            data = {
+                "files": [line for line in lines if line.get("type") == "file"],
+                "summary": next(
+                    (line for line in lines if line.get("type") == "summary"), None
+                ),
+            }
+    except (OSError, ValueError, AttributeError) as e:
+        raise click.ClickException(f"Could not read report {path}: {e}")
+    if not isinstance(data, dict) or not isinstance(data.get("summary"), dict):
+        raise click.ClickException(
+            f"{path} is not a complete json or ndjson migrate-css report."
+        )
+    records = [
+        {key: value for key, value in record.items() if key != "type"}
+        for record in data.get("files", [])
+    ]
+    return records, data["summary"]
+
+
+def merge_reports(
+    paths: Iterable[Path],
+    fmt: str,
+    verbose: bool = False,
+    unmigrated_file: TextIO | None = None,
+):
+    """Combine json or ndjson reports from sharded runs and write them out as one.
+
+    The file records are replayed through a MigrationReport in fmt, in path order,
+    so the output, including the totals and unmigrated classes, is what a single run
+    over all the shards would have produced. Raises ClickException if the reports aren't from
+    the same kind of run, or if a shard is missing or repeated.
+    """
+    reports = [(path, *read_report(path)) for path in paths]
+    if not reports:
+        raise click.ClickException("No reports to merge.")
+    summaries = [summary for _, _, summary in reports]
+    for key in ("css_file", "rulesets", "dry_run"):
+        if len({json.dumps(summary.get(key)) for summary in summaries}) > 1:
+            raise click.ClickException(f"Can't merge reports with different {key}.")
+    _check_shards([(path, summary.get("shard")) for path, _, summary in reports])
+
+    report = MigrationReport(
+        fmt,
+        Path(summaries[0]["css_file"]),
+        dry_run=summaries[0]["dry_run"],
+        verbose=verbose,
+        unmigrated_file=unmigrated_file,
+    )
+    report.start()
+    records = sorted(
+        (record for _, shard_records, _ in reports for record in shard_records),
+        key=lambda record: record["path"],
+    )
+    for record in records:
+        if "skipped" in record:
+            report.add_file(Path(record["path"]), [], set(), record["skipped"])
+            continue
+        replacements = [
+            (old, change["to"])
+            for old, change in record["classes"].items()
+            for _ in range(change["count"])
+        ]
+        report.add_file(Path(record["path"]), replacements, set(record["unmigrated"]))
+    # Which ruleset each class belongs to isn't in the reports, only the totals
+    by_ruleset: Counter[str] = Counter()
+    for summary in summaries:
+        by_ruleset.update(summary.get("replacements_by_ruleset", {}))
+    rulesets = summaries[0].get("rulesets", {})
+    report.rulesets = [
+        Ruleset(name, Path(source), {}) for name, source in rulesets.items()
+    ]
+    report.replacements_by_ruleset = by_ruleset
+    report.finish()
+
+
+def _check_shards(shards: list[tuple[Path, str | None]]):
+    if all(shard is None for _, shard in shards):
+        return
+    seen = {}
+    counts = set()
+    for path, shard in shards:
+        if shard is None:
+            raise click.ClickException(f"{path} is not from a sharded run.")
+        _, _, count = shard.partition("/")
+        counts.add(count)
+        if shard in seen:
+            raise click.ClickException(
+                f"{seen[shard]} and {path} are both reports for shard {shard}."
+            )
+        seen[shard] = path
+    if len(counts) > 1:
+        raise click.ClickException("Can't merge reports with different shard counts.")
+    count = int(counts.pop())
+    missing = [
+        f"{i}/{count}" for i in range(1, count + 1) if f"{i}/{count}" not in seen
+    ]
+    if missing:
+        raise click.ClickException(f"Missing reports for shards {', '.join(missing)}.")
+
+
 @click.command(name="migrate-css")
 @click.option(
     "--dry-run",
@@ -77,6 +1580,16 @@ def migrate_file(
     show_default=True,
     help="Path to the Pegasus tailwind.css file containing pg- class definitions",
 )
+@click.option(
+    "--rules",
+    "rules_files",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    multiple=True,
+    help=(
+        "YAML or JSON file of extra class renames to apply in the same pass. "
+        "Can be passed multiple times."
+    ),
+)
 @click.option(
     "--search-dir",
     "search_dirs",
@@ -87,70 +1600,429 @@ def migrate_file(
         f"Defaults to: {', '.join(DEFAULT_SEARCH_DIRS)}"
     ),
 )
-def migrate_css(dry_run: bool, css_file: Path, search_dirs: tuple[Path, ...]):
+@click.option(
+    "--jobs",
+    "-j",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Number of worker processes to use. Defaults to the number of CPUs.",
+)
+@click.option(
+    "--manifest",
+    "manifest_file",
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=DEFAULT_MANIFEST_FILE,
+    show_default=True,
+    help="File recording already-clean files, so unchanged files are skipped on later runs",
+)
+@click.option(
+    "--no-manifest",
+    is_flag=True,
+    help="Scan every file and don't read or write the manifest",
+)
+@click.option(
+    "--exclude",
+    "excludes",
+    multiple=True,
+    help=(
+        "Glob for file or directory names to skip, in addition to the defaults. "
+        f"Can be passed multiple times. Defaults: {', '.join(EXCLUDES)}"
+    ),
+)
+@click.option(
+    "--no-gitignore",
+    is_flag=True,
+    help="Don't skip files and directories ignored by .gitignore",
+)
+@click.option(
+    "--always-migrate",
+    "always_migrate",
+    multiple=True,
+    help=(
+        "Glob for file paths or names to migrate even if they look binary, minified "
+        "or vendored. Can be passed multiple times."
+    ),
+)
+@click.option(
+    "--no-sniff",
+    is_flag=True,
+    help="Migrate every file, including ones that look binary, minified or vendored",
+)
+@click.option(
+    "--report",
+    "report_format",
+    type=click.Choice(MigrationReport.FORMATS),
+    default="text",
+    show_default=True,
+    help=(
+        "Output format. json and ndjson write per-file records with per-class counts "
+        "and a final summary."
+    ),
+)
+@click.option(
+    "--verbose",
+    "-v",
+    is_flag=True,
+    help=(
+        "List every single replacement, and a few of the files using each unmapped "
+        "class, in text output"
+    ),
+)
+@click.option(
+    "--unmigrated-paths",
+    "unmigrated_file",
+    type=click.File("w", encoding="utf-8", lazy=True),
+    default=None,
+    help=(
+        "Write every file using each unmapped class to this file, one "
+        "'class<TAB>path' line each"
+    ),
+)
+@click.option(
+    "--watch",
+    is_flag=True,
+    help="After migrating, keep running and migrate files again as they change",
+)
+@click.option(
+    "--no-cache",
+    is_flag=True,
+    help="Always parse the CSS file, instead of using the cached class mappings",
+)
+@click.option(
+    "--diff",
+    "diff_path",
+    type=click.Path(dir_okay=False, allow_dash=True),
+    is_flag=False,
+    flag_value="-",
+    default=None,
+    help=(
+        "Don't modify files, but write the changes as a unified diff to this file, "
+        "or to stdout if no file is given. The diff can be applied with git apply."
+    ),
+)
+@click.option(
+    "--rollback",
+    "do_rollback",
+    is_flag=True,
+    help="Undo the changes made by the last migration that modified files, and exit",
+)
+@click.option(
+    "--shard",
+    callback=validate_shard,
+    metavar="I/N",
+    help=(
+        "Only migrate shard I of N, e.g. 2/4. Files are split into shards by a hash "
+        "of their path, so separate machines can each check a part of the project."
+    ),
+)
+@click.option(
+    "--profile",
+    "do_profile",
+    is_flag=True,
+    help=(
+        "Time each phase of the run and report it at the end, on stderr, along with "
+        "the bytes read and written and the slowest files. JSON with --report json "
+        "or ndjson."
+    ),
+)
+@click.option(
+    "--since",
+    metavar="REF",
+    help=(
+        "Only migrate files changed since the git commit REF, including uncommitted "
+        "and untracked files"
+    ),
+)
+@click.option(
+    "--merge-reports",
+    "merge",
+    is_flag=True,
+    help=(
+        "Instead of migrating, combine the json or ndjson reports of sharded runs, "
+        "passed as PATHS, into a single report in the --report format"
+    ),
+)
+@click.argument(
+    "paths",
+    nargs=-1,
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+)
+def migrate_css(
+    dry_run: bool,
+    css_file: Path,
+    rules_files: tuple[Path, ...],
+    search_dirs: tuple[Path, ...],
+    jobs: int | None,
+    manifest_file: Path,
+    no_manifest: bool,
+    excludes: tuple[str, ...],
+    no_gitignore: bool,
+    always_migrate: tuple[str, ...],
+    no_sniff: bool,
+    report_format: str,
+    verbose: bool,
+    unmigrated_file: TextIO | None,
+    watch: bool,
+    no_cache: bool,
+    diff_path: str | None,
+    do_rollback: bool,
+    shard: tuple[int, int] | None,
+    do_profile: bool,
+    since: str | None,
+    merge: bool,
+    paths: tuple[Path, ...],
+):
     """Migrate pg- CSS classes to native Tailwind/DaisyUI equivalents.
 
     Replaces legacy pg- prefixed CSS classes with their native Tailwind/DaisyUI
     equivalents in templates and JavaScript files.
 
     The class mappings are read from your project's tailwind.css so they always
-    match the version of Pegasus your project was built with.
+    match the version of Pegasus your project was built with. Other renames, such
+    as those needed for a DaisyUI or Tailwind upgrade, can be applied in the same
+    pass with --rules.
+
+    Files are replaced atomically, and the originals are kept in
+    .pegasus/migrate-css-journal until the next run that changes files, so the most
+    recent migration can be undone with --rollback.
+
+    If PATHS are given, as they are by pre-commit, only those files are migrated
+    (if they are in the search dirs), and with --since only the files changed in
+    git since a commit are. Large projects can be checked in parallel on several
+    machines with --shard, and the json reports of each shard combined with
+    --merge-reports.
 
     Run from your project root.
     """
-    if not css_file.exists():
+    if merge:
+        merge_reports(paths, report_format, verbose, unmigrated_file)
+        return
+    if do_rollback:
+        try:
+            restored = rollback(Path(DEFAULT_JOURNAL_DIR))
+        except FileNotFoundError:
+            raise click.ClickException("There is no migration to roll back.")
+        click.echo(f"Restored {restored} file{'s' if restored != 1 else ''}.")
+        return
+    if diff_path is not None and watch:
+        raise click.UsageError("--diff can't be used with --watch.")
+    if shard is not None and watch:
+        raise click.UsageError("--shard can't be used with --watch.")
+    if (paths or since is not None) and watch:
+        raise click.UsageError("--since and PATHS can't be used with --watch.")
+    if not css_file.exists() and not rules_files:
         raise click.ClickException(
             f"{css_file} not found. Run from your project root or pass --css-file."
         )
 
-    css_class_map = parse_tailwind_css(css_file)
+    profile = Profile() if do_profile else None
+    rulesets, css_class_map, matcher = load_rulesets(
+        css_file, rules_files, use_cache=not no_cache, profile=profile
+    )
     if not css_class_map:
+        if rules_files:
+            raise click.ClickException("No class mappings found.")
         raise click.ClickException(f"No pg- class mappings found in {css_file}.")
 
-    click.echo(f"Loaded {len(css_class_map)} class mappings from {css_file}\n")
+    def make_report(rulesets):
+        return MigrationReport(
+            report_format,
+            css_file,
+            dry_run=dry_run or diff_path is not None,
+            verbose=verbose,
+            rulesets=rulesets,
+            err=diff_path == "-",
+            shard=shard,
+            unmigrated_file=unmigrated_file,
+        )
 
-    pattern = build_pattern(css_class_map)
-    dirs = search_dirs or tuple(Path(d) for d in DEFAULT_SEARCH_DIRS)
-    total_files = 0
-    total_replacements = 0
-    unmigrated_by_class: dict[str, list[Path]] = {}
+    def finish_report(report):
+        with timed(profile, "report"):
+            report.finish()
+        if profile is None:
+            return
+        if report_format in ("json", "ndjson"):
+            click.echo(json.dumps({"profile": profile.to_dict()}), err=True)
+        else:
+            click.echo(profile.format(), err=True)
 
-    for search_dir in dirs:
-        if not search_dir.is_dir():
-            continue
-        for filepath in search_dir.rglob("*"):
-            if not filepath.is_file() or filepath.suffix not in EXTENSIONS:
-                continue
-            # Skip CSS/style directories
-            parts = set(filepath.parts)
-            if "styles" in parts or "css" in parts:
-                continue
-            replacements, unmigrated = migrate_file(
-                filepath, pattern, css_class_map, dry_run=dry_run
+    dirs = search_dirs or tuple(Path(d) for d in DEFAULT_SEARCH_DIRS)
+    sniff = None if no_sniff else sniff_filter(always_migrate)
+    with timed(profile, "walk"):
+        if paths or since is not None:
+            selection = list(paths)
+            if since is not None:
+                try:
+                    selection.extend(changed_files(since))
+                except GitError as e:
+                    raise click.ClickException(f"Could not run git: {e}")
+            files = select_files(selection, dirs, EXCLUDES + excludes)
+        else:
+            files = find_files(
+                dirs, EXCLUDES + excludes, use_gitignore=not no_gitignore
             )
-            if replacements:
-                total_files += 1
-                total_replacements += len(replacements)
-                prefix = "[dry run] " if dry_run else ""
-                click.echo(f"  {prefix}{filepath} ({len(replacements)} replacements)")
-                for old, new in replacements:
-                    click.echo(f"    {old} -> {new}")
-            for name in unmigrated:
-                unmigrated_by_class.setdefault(name, []).append(filepath)
-
-    if total_replacements:
-        action = "Would update" if dry_run else "Updated"
-        click.echo(
-            f"\n{action} {total_replacements} class references in {total_files} files"
+        if shard is not None:
+            files = shard_files(files, *shard)
+
+    report = make_report(rulesets)
+    with timed(profile, "report"):
+        report.start(css_class_map)
+
+    if diff_path is not None:
+        # Diffs are written in file order as they are generated, so this runs in
+        # a single process and doesn't use the manifest.
+        with click.open_file(diff_path, "wb") as out:
+            for filepath in files:
+                skipped = sniff_file(filepath) if sniff and sniff(filepath) else None
+                if skipped is not None:
+                    report.add_file(filepath, [], set(), skipped)
+                    continue
+                start = time.perf_counter()
+                result = diff_file(filepath, matcher, css_class_map, out)
+                if profile is not None:
+                    # Reading, matching and diffing are interleaved line by line
+                    stats = new_file_stats()
+                    stats["match"] = time.perf_counter() - start
+                    stats["bytes_read"] = filepath.stat().st_size
+                    profile.add_file(filepath, stats)
+                with timed(profile, "report"):
+                    report.add_file(filepath, *result)
+        finish_report(report)
+        return
+
+    manifest = None
+    if not no_manifest:
+        manifest = Manifest.load(
+            manifest_file, css_class_map_fingerprint(css_class_map)
         )
-    else:
-        click.echo("No pg- CSS classes found to migrate.")
 
-    if unmigrated_by_class:
-        click.echo(
-            f"\nFound {len(unmigrated_by_class)} pg- class(es) with no mapping "
-            f"in {css_file}. These classes cannot yet be migrated:"
+    transaction = None
+    if not dry_run:
+        transaction = Transaction(Path(DEFAULT_JOURNAL_DIR))
+        transaction.begin()
+    results = migrate_files(
+        files,
+        matcher,
+        css_class_map,
+        dry_run=dry_run,
+        jobs=jobs or os.cpu_count() or 1,
+        manifest=manifest,
+        transaction=transaction,
+        sniff=sniff,
+        profile=profile,
+    )
+    try:
+        for result in results:
+            with timed(profile, "report"):
+                report.add_file(*result)
+        if transaction is not None:
+            # Waits for the last files to be swapped in by the writer thread
+            with timed(profile, "swap"):
+                transaction.flush()
+
+        # A dry run doesn't write anything into the project, not even the manifest
+        if manifest is not None and not dry_run:
+            manifest.save()
+
+        finish_report(report)
+
+        if watch:
+            _watch(
+                css_file,
+                rules_files,
+                (rulesets, css_class_map, matcher),
+                dirs,
+                EXCLUDES + excludes,
+                not no_gitignore,
+                make_report,
+                use_cache=not no_cache,
+                transaction=transaction,
+                sniff=sniff,
+            )
+    except TransactionError as e:
+        # Stops the workers and removes the files they staged but never handed over
+        results.close()
+        transaction.close(discard=True)
+        raise click.ClickException(
+            f"{e} Files already written can be restored with --rollback."
         )
-        for name in sorted(unmigrated_by_class):
-            files = unmigrated_by_class[name]
-            click.echo(f"  {name} ({len(files)} file{'s' if len(files) != 1 else ''})")
+    except BaseException:
+        results.close()
+        if transaction is not None:
+            transaction.close(discard=True)
+        raise
+    if transaction is not None:
+        transaction.close()
+
+
+def _watch(
+    css_file: Path,
+    rules_files: tuple[Path, ...],
+    loaded: tuple[list[Ruleset], dict[str, str], ClassMatcher],
+    dirs: tuple[Path, ...],
+    excludes: tuple[str, ...],
+    use_gitignore: bool,
+    make_report: Callable[[list[Ruleset]], MigrationReport],
+    use_cache: bool = True,
+    transaction: Transaction | None = None,
+    sniff: Callable[[Path], bool] | None = None,
+):
+    """Migrate files again whenever they change, until interrupted.
+
+    The rulesets, class map and matcher in loaded are reused between runs and only
+    reloaded when css_file or one of the rules files changes, in which case every
+    file is migrated again. Files are written through transaction, which is flushed
+    after each run, so a rollback undoes everything since the command started.
+    """
+    rulesets, css_class_map, matcher = loaded
+    watcher = create_watcher(
+        dirs,
+        EXTENSIONS,
+        excludes,
+        use_gitignore,
+        extra_files=[css_file, *rules_files],
+    )
+    click.echo("\nWatching for changes. Press Ctrl+C to stop.", err=True)
+    try:
+        while True:
+            changed = watcher.wait_for_changes()
+            if changed & {css_file, *rules_files}:
+                try:
+                    loaded = load_rulesets(css_file, rules_files, use_cache)
+                except click.ClickException as e:
+                    click.echo(f"Error: {e.message}", err=True)
+                    continue
+                if not loaded[1]:
+                    click.echo(f"No pg- class mappings found in {css_file}.", err=True)
+                    continue
+                rulesets, css_class_map, matcher = loaded
+                loaded_map = css_class_map
+                files = find_files(dirs, excludes, use_gitignore)
+            else:
+                loaded_map = None
+                files = sorted(f for f in changed if f.is_file())
+            if not files:
+                continue
+            report = make_report(rulesets)
+            report.start(loaded_map)
+            written = []
+            for result in migrate_files(
+                files,
+                matcher,
+                css_class_map,
+                dry_run=report.dry_run,
+                transaction=transaction,
+                sniff=sniff,
+            ):
+                report.add_file(*result)
+                if result[1] and not report.dry_run:
+                    written.append(result[0])
+            if transaction is not None:
+                transaction.flush()
+            # Swapping the new files into place would otherwise trigger another run
+            watcher.ignore_writes(written)
+            report.finish()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
@@ -0,0 +1,123 @@
+"""Wall time, counts and bytes for each phase of a migrate-css run."""
+import heapq
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+
+# Phases in the order they're reported. Any other phase follows these.
+PHASES = (
+    "css parse",
+    "pattern build",
+    "walk",
+    "read",
+    "match",
+    "write",
+    "swap",
+    "report",
+)
+# Phases timed separately for every file, possibly in several processes at once
+FILE_PHASES = ("read", "match", "write")
+SLOWEST_FILES = 10
+
+
+class Profile:
+    """Collects the time spent in each phase of a run.
+
+    Phases in the main process are timed with phase(). The per-file phases are
+    timed wherever the file is processed and passed to add_file() as a stats dict
+    (see new_file_stats), so with several workers their times are summed over all
+    workers and can add up to more than the wall time.
+    """
+
+    def __init__(self, slowest: int = SLOWEST_FILES):
+        self.slowest = slowest
+        self.started = time.perf_counter()
+        self.seconds: Counter[str] = Counter()
+        self.counts: Counter[str] = Counter()
+        self.bytes_read = 0
+        self.bytes_written = 0
+        # Min-heap of (seconds, path), holding the slowest files seen so far
+        self._slowest_files: list[tuple[float, str]] = []
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] += time.perf_counter() - start
+            self.counts[name] += 1
+
+    def add_file(self, filepath: Path, stats: dict):
+        total = 0.0
+        for name in FILE_PHASES:
+            if stats[name]:
+                self.seconds[name] += stats[name]
+                self.counts[name] += 1
+                total += stats[name]
+        self.bytes_read += stats["bytes_read"]
+        self.bytes_written += stats["bytes_written"]
+        item = (total, str(filepath))
+        if len(self._slowest_files) < self.slowest:
+            heapq.heappush(self._slowest_files, item)
+        elif item > self._slowest_files[0]:
+            heapq.heapreplace(self._slowest_files, item)
+
+    def to_dict(self) -> dict:
+        names = [name for name in PHASES if name in self.counts]
+        names += [name for name in self.counts if name not in PHASES]
+        return {
+            "wall_seconds": round(time.perf_counter() - self.started, 6),
+            "phases": {
+                name: {
+                    "seconds": round(self.seconds[name], 6),
+                    "count": self.counts[name],
+                }
+                for name in names
+            },
+            "bytes_read": self.bytes_read,
+            "bytes_written": self.bytes_written,
+            "slowest_files": [
+                {"path": path, "seconds": round(seconds, 6)}
+                for seconds, path in sorted(self._slowest_files, reverse=True)
+            ],
+        }
+
+    def format(self) -> str:
+        data = self.to_dict()
+        lines = [f"\nProfile ({data['wall_seconds']:.3f}s wall time):"]
+        for name, phase in data["phases"].items():
+            summed = " (summed over files)" if name in FILE_PHASES else ""
+            lines.append(
+                f"  {name:<14} {phase['seconds']:>9.3f}s  x{phase['count']}{summed}"
+            )
+        lines.append(
+            f"  Read {_format_bytes(self.bytes_read)}, "
+            f"wrote {_format_bytes(self.bytes_written)}"
+        )
+        if data["slowest_files"]:
+            lines.append("  Slowest files:")
+            lines.extend(
+                f"    {entry['seconds'] * 1000:8.1f}ms  {entry['path']}"
+                for entry in data["slowest_files"]
+            )
+        return "\n".join(lines)
+
+
+def new_file_stats() -> dict:
+    """Return an empty stats dict for timing one file, to pass to Profile.add_file."""
+    return {name: 0.0 for name in FILE_PHASES} | {"bytes_read": 0, "bytes_written": 0}
+
+
+def timed(profile: Profile | None, name: str):
+    """Time a phase in profile, or do nothing if profile is None."""
+    return nullcontext() if profile is None else profile.phase(name)
+
+
+def _format_bytes(count: int) -> str:
+    for unit in ("B", "KB", "MB"):
+        if count < 1024:
+            return f"{count:.0f} {unit}" if unit == "B" else f"{count:.1f} {unit}"
+        count /= 1024
+    return f"{count:.1f} GB"
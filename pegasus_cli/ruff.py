@@ -1,27 +1,64 @@
 import logging
+import pathlib
 import subprocess
+import tempfile
 
 logger = logging.getLogger("pegasus")
 
 
-def run_ruff_format(path):
-    """Run 'ruff format' on the given path."""
-    if not _ruff_exists():
-        return
+def format_sources(sources: dict[pathlib.Path, bytes]) -> dict[pathlib.Path, bytes]:
+    """Run 'ruff format' on Python sources that haven't been written yet.
 
-    command = ["ruff", "format"] + [str(path)]
-    try:
-        subprocess.check_output(command, stderr=subprocess.STDOUT)
-    except subprocess.CalledProcessError as e:
-        logger.warning("Ruff command failed with error: %s", str(e.output))
+    The sources are copied to a temporary directory and formatted there with a
+    single ruff call per ruff config that applies to their real locations, which is
+    normally just one. Sources are returned unchanged if ruff isn't installed or
+    can't format them.
+    """
+    by_config: dict[pathlib.Path | None, list[pathlib.Path]] = {}
+    for path in sources:
+        by_config.setdefault(find_ruff_config(path.parent), []).append(path)
 
+    formatted = dict(sources)
+    with tempfile.TemporaryDirectory(prefix="pegasus-ruff-") as tmp_dir:
+        copies = {}
+        for index, path in enumerate(sources):
+            # A directory per file, so files with the same name don't collide
+            copy = pathlib.Path(tmp_dir, str(index), path.name)
+            copy.parent.mkdir()
+            copy.write_bytes(sources[path])
+            copies[path] = copy
 
-def _ruff_exists():
-    """Check if ruff is installed and available in the system path."""
-    try:
-        subprocess.check_call(
-            ["ruff", "--version"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
-        )
-        return True
-    except (subprocess.CalledProcessError, FileNotFoundError):
-        return False
+        for config, paths in by_config.items():
+            # The copies' paths are thrown away, so caching them would only grow
+            # the project's .ruff_cache on every run
+            command = ["ruff", "format", "--no-cache"]
+            if config is not None:
+                command += ["--config", str(config)]
+            command += [str(copies[path]) for path in paths]
+            try:
+                subprocess.check_output(command, stderr=subprocess.STDOUT)
+            except FileNotFoundError:
+                # ruff isn't installed
+                return formatted
+            except subprocess.CalledProcessError as e:
+                # The files ruff could parse have still been formatted
+                logger.warning("Ruff command failed with error: %s", str(e.output))
+            for path in paths:
+                formatted[path] = copies[path].read_bytes()
+    return formatted
+
+
+def find_ruff_config(directory: pathlib.Path) -> pathlib.Path | None:
+    """Return the ruff config file that applies to files in directory, found the
+    way ruff finds it, or None if there isn't one."""
+    for parent in (directory.absolute(), *directory.absolute().parents):
+        for name in (".ruff.toml", "ruff.toml"):
+            if (parent / name).is_file():
+                return parent / name
+        pyproject = parent / "pyproject.toml"
+        try:
+            if "[tool.ruff" in pyproject.read_text(encoding="utf-8"):
+                return pyproject
+        except OSError:
+            pass
+    return None
@@ -4,18 +4,27 @@ import yaml
 
 import click
 
-from .generate import render_cookiecutter
+from .generate import RenderedTree, render_cookiecutter
 from .install import (
-    add_to_installed_apps,
-    add_to_urlpatterns,
+    add_all_to_installed_apps,
+    add_all_to_urlpatterns,
     find_settings_from_manage_py,
 )
 from .jinja import get_template_env
-from .monkeypatch import patch_cookiecutter
-from .ruff import run_ruff_format
+from .ruff import format_sources
+
+# Options that apps in a --manifest file can set for themselves
+MANIFEST_APP_OPTIONS = (
+    "app_directory",
+    "module_path",
+    "template_directory",
+    "base_model",
+)
 
 
 def validate_name(ctx, param, value):
+    if value is None:
+        return value
     if not value.isidentifier():
         raise click.BadParameter(
             f"'{value}' is not a valid app name. Please make sure it is a valid identifier."
@@ -49,8 +58,43 @@ def load_config(ctx, param, value):
         raise click.BadParameter(f"Error loading config file: {str(e)}")
 
 
+def load_manifest(ctx, param, value):
+    if value is None:
+        return None
+    try:
+        with open(value, "r") as manifest_file:
+            manifest = yaml.safe_load(manifest_file)
+    except Exception as e:
+        raise click.BadParameter(f"Error loading manifest: {str(e)}")
+    if isinstance(manifest, dict):
+        manifest = manifest.get("apps")
+    if not isinstance(manifest, list) or not manifest:
+        raise click.BadParameter("The manifest should contain a list of apps.")
+
+    apps = []
+    for app in manifest:
+        if not isinstance(app, dict) or "name" not in app:
+            raise click.BadParameter(f"Each app needs a name, got: {app!r}")
+        unknown = set(app) - {"name", "models", *MANIFEST_APP_OPTIONS}
+        if unknown:
+            raise click.BadParameter(
+                f"Unknown options for app {app['name']}: {', '.join(sorted(unknown))}"
+            )
+        apps.append(
+            {
+                **app,
+                "name": validate_name(ctx, param, str(app["name"])),
+                "models": [
+                    validate_model_name(ctx, param, str(model_name))
+                    for model_name in app.get("models") or []
+                ],
+            }
+        )
+    return apps
+
+
 @click.command(name="startapp")
-@click.argument("name", callback=validate_name)
+@click.argument("name", required=False, callback=validate_name)
 @click.argument(
     "model_names",
     nargs=-1,
@@ -101,6 +145,17 @@ def load_config(ctx, param, value):
     default=None,
     help="Path to Django settings.py to automatically add the app to INSTALLED_APPS",
 )
+@click.option(
+    "--manifest",
+    type=click.Path(exists=True, dir_okay=False, resolve_path=True),
+    callback=load_manifest,
+    help="YAML file listing apps and their models to create, instead of NAME",
+)
+@click.option(
+    "--dry-run",
+    is_flag=True,
+    help="Show which files would be created or changed, without writing anything",
+)
 def startapp(
     name,
     model_names,
@@ -110,6 +165,8 @@ def startapp(
     template_directory,
     base_model: str | None = None,
     django_settings: str | None = None,
+    dry_run: bool = False,
+    manifest: list[dict] | None = None,
 ):
     """Creates a Django app directory structure for the given app name in
     the current directory or optionally in the given directory.
@@ -117,6 +174,9 @@ def startapp(
     \b
     NAME is the name of the Django app
     MODEL_NAMES are the names of the Django models (0 or more)
+
+    With --manifest, every app listed in the manifest is created in one go, and
+    added to settings.py and urls.py with a single edit of each.
     """
     # Override CLI options with config file values if present
     app_directory = config.get("app_directory", app_directory)
@@ -128,14 +188,105 @@ def startapp(
         resolved = find_settings_from_manage_py(manage_py)
         if resolved:
             django_settings = str(resolved)
+    template_directory = config.get("template_directory", template_directory)
+    use_teams = config.get("use_teams", False)
+    css_framework = config.get("css_framework", "tailwind")
+
+    if manifest is None:
+        if name is None:
+            raise click.UsageError("Missing argument 'NAME'.")
+        apps = [{"name": name, "models": config.get("model_names", model_names)}]
+    elif name is not None or model_names:
+        raise click.UsageError("Pass either NAME and MODEL_NAMES or --manifest.")
+    else:
+        apps = manifest
+
+    # Render everything in memory first, so that files which come out the same as
+    # they already are on disk aren't rewritten
+    trees = []
+    contexts = []
+    for app in apps:
+        tree = RenderedTree()
+        contexts.append(
+            _render_app(
+                tree,
+                app["name"],
+                app["models"],
+                app_directory=app.get("app_directory", app_directory),
+                module_path=app.get("module_path", module_path),
+                template_directory=app.get("template_directory", template_directory),
+                base_model=app.get("base_model", base_model),
+                use_teams=use_teams,
+                css_framework=css_framework,
+            )
+        )
+        trees.append(tree)
+    _format_python_files(trees)
+
+    all_changes = [tree.changes() if dry_run else tree.write() for tree in trees]
+    if dry_run:
+        files = sum(len(tree.files) for tree in trees)
+        changed = 0
+        for changes in all_changes:
+            for path, change in changes.items():
+                click.echo(f"Would {change} {path}")
+                changed += change != "delete"
+        click.echo(
+            f"{sum(len(changes) for changes in all_changes)} files would change, "
+            f"{files - changed} are up to date."
+        )
+        return
+
+    # Install every app with a single edit of settings.py and of urls.py
+    settings_updated = False
+    urls_updated = False
+    if django_settings:
+        settings_updated = add_all_to_installed_apps(
+            django_settings, [context["app_config_string"] for context in contexts]
+        )
+        urls_path = pathlib.Path(django_settings).parent / "urls.py"
+        if urls_path.exists():
+            urls_updated = add_all_to_urlpatterns(
+                str(urls_path),
+                [
+                    (context["app_name"], context["app_module_path"])
+                    for context in contexts
+                ],
+                use_teams,
+            )
+
+    env = get_template_env()
+    template = env.get_template("internal/cli_output.txt")
+    env.bytecode_cache.prune()
+    for tree, changes, context in zip(trees, all_changes, contexts):
+        context["settings_updated"] = settings_updated
+        context["urls_updated"] = urls_updated
+        context["files_unchanged"] = len(tree.files) - sum(
+            1 for change in changes.values() if change != "delete"
+        )
+        output = template.render(context)
+        print(output)
+
+
+def _render_app(
+    tree: RenderedTree,
+    name: str,
+    model_names: list[str],
+    app_directory: str,
+    module_path: str,
+    template_directory: str,
+    base_model: str | None,
+    use_teams: bool,
+    css_framework: str,
+) -> dict:
+    """Render the app's files into tree, and return the context they were rendered
+    with."""
     if base_model:
         base_model_module, base_model_class = base_model.rsplit(".", 1)
     else:
         base_model_module = None
         base_model_class = None
 
-    model_names = config.get("model_names", model_names)
-    template_directory = config.get("template_directory", template_directory)
     app_dir = pathlib.Path(app_directory) / name
 
     # if specified, use it, otherwise use the default directory inside the app
@@ -160,20 +311,16 @@ def startapp(
         "base_model_module": base_model_module,
         "base_model_class": base_model_class,
     }
-    use_teams = config.get("use_teams", False)
     context.update(_get_team_context(use_teams))
-
-    css_framework = config.get("css_framework", "tailwind")
     context.update(_get_css_framework_context(css_framework))
 
-    patch_cookiecutter()
-
     extra_cookiecutter_context = {"app_name": name, "template_dir_name": name}
     render_cookiecutter(
         "app_template",
         app_directory,
         context,
         extra_cookiecutter_context,
+        tree=tree,
     )
 
     render_cookiecutter(
@@ -181,6 +328,7 @@ def startapp(
         template_dir,
         context,
         extra_cookiecutter_context,
+        tree=tree,
     )
 
     for model_name in model_names:
@@ -191,27 +339,28 @@ def startapp(
             template_dir,
             context,
             extra_cookiecutter_context,
+            tree=tree,
         )
 
-    run_ruff_format(app_dir)
+    context["app_config_string"] = (
+        f"{app_module_path}.apps.{context['camel_case_app_name']}Config"
+    )
+    return context
 
-    app_config_string = f"{app_module_path}.apps.{context['camel_case_app_name']}Config"
-    settings_updated = False
-    urls_updated = False
-    if django_settings:
-        settings_updated = add_to_installed_apps(django_settings, app_config_string)
-        urls_path = pathlib.Path(django_settings).parent / "urls.py"
-        if urls_path.exists():
-            urls_updated = add_to_urlpatterns(
-                str(urls_path), name, app_module_path, use_teams
-            )
 
-    context["app_config_string"] = app_config_string
-    context["settings_updated"] = settings_updated
-    context["urls_updated"] = urls_updated
-    env = get_template_env()
-    output = env.get_template("internal/cli_output.txt").render(context)
-    print(output)
+def _format_python_files(trees: list[RenderedTree]):
+    """Format the Python files in trees with ruff, in a single pass."""
+    python_files = {
+        path: rendered.data
+        for tree in trees
+        for path, rendered in tree.files.items()
+        if path.suffix == ".py"
+    }
+    formatted = format_sources(python_files)
+    for tree in trees:
+        for path, rendered in tree.files.items():
+            if path in formatted:
+                tree.files[path] = rendered._replace(data=formatted[path])
 
 
 def _get_team_context(use_teams: bool) -> dict:
@@ -0,0 +1,8 @@
+"""Generation hooks for app_template, run in-process by pegasus_cli.generate."""
+from pathlib import Path
+
+
+def post_gen_project(project_dir: Path, context: dict, tree):
+    if not context["model_names"]:
+        # With no models there's nothing to put in forms.py
+        tree.remove(project_dir / "forms.py")
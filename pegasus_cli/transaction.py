@@ -0,0 +1,228 @@
+"""Swap rewritten files into place as a batched, journaled transaction.
+
+Files are never rewritten in place: their new contents are written to a temporary
+file in the same directory, which is later renamed over the original. A background
+thread does the renaming in batches, so scanning later files overlaps with writing
+earlier ones, and the fsyncs needed to make each batch durable are shared by the
+whole batch. Every original file is kept in a journal directory until the next
+transaction that changes files begins, so the most recent one can be rolled back.
+"""
+import json
+import os
+import queue
+import shutil
+import threading
+from pathlib import Path
+
+BATCH_SIZE = 64
+JOURNAL_FILE = "journal.ndjson"
+VERSION = 1
+
+
+class TransactionError(Exception):
+    pass
+
+
+class Transaction:
+    """Renames staged temporary files over their targets in journaled batches.
+
+    For each batch, the staged files are fsynced, each original is hard-linked (or
+    copied, if the filesystem can't link) into journal_dir and recorded in the
+    journal, and the journal is fsynced. Only then are the staged files renamed over
+    their targets, after which each affected directory is fsynced once. An
+    interrupted run therefore leaves every file either fully old or fully new, and
+    rollback() can restore the old ones.
+    """
+
+    def __init__(self, journal_dir: Path, batch_size: int = BATCH_SIZE):
+        self.journal_dir = journal_dir
+        self.batch_size = batch_size
+        self.files_written = 0
+        self._queue: queue.Queue = queue.Queue()
+        self._thread: threading.Thread | None = None
+        self._journal = None
+        self._error: BaseException | None = None
+        self._discard = False
+
+    def begin(self):
+        """Start a new transaction.
+
+        The journal of the previous transaction is only replaced once the first file
+        is swapped in, so a transaction that changes nothing leaves it in place.
+        """
+        self._thread = threading.Thread(
+            target=self._run, name="migrate-css-writer", daemon=True
+        )
+        self._thread.start()
+
+    def add(self, target: Path, staged: str):
+        """Queue staged, a temporary file next to target, to replace target."""
+        self._raise_error()
+        self._queue.put((target, staged))
+
+    def flush(self):
+        """Block until every file added so far has been swapped into place."""
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait()
+        self._raise_error()
+
+    def close(self, discard: bool = False):
+        """Finish the transaction.
+
+        Files still waiting to be swapped in are written first, unless discard is
+        set, in which case their staged copies are deleted instead and any error
+        from an earlier batch is not raised again.
+        """
+        if self._thread is None:
+            return
+        self._discard = discard
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        if not discard:
+            self._raise_error()
+
+    def __enter__(self):
+        self.begin()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(discard=exc_type is not None)
+
+    def _raise_error(self):
+        if self._error is not None:
+            raise TransactionError(
+                f"Could not write files: {self._error}"
+            ) from self._error
+
+    def _run(self):
+        batch = []
+        while True:
+            item = self._queue.get()
+            if isinstance(item, tuple):
+                batch.append(item)
+                if len(batch) < self.batch_size:
+                    continue
+            elif item is None and self._discard:
+                _remove_staged(batch)
+                batch = []
+            if batch:
+                if self._error is None:
+                    try:
+                        self._apply(batch)
+                    except Exception as e:
+                        self._error = e
+                        _remove_staged(batch)
+                else:
+                    _remove_staged(batch)
+                batch = []
+            if isinstance(item, threading.Event):
+                item.set()
+            elif item is None:
+                return
+
+    def _open_journal(self):
+        """Discard the previous transaction's journal and start this one's."""
+        shutil.rmtree(self.journal_dir, ignore_errors=True)
+        self.journal_dir.mkdir(parents=True)
+        self._journal = open(self.journal_dir / JOURNAL_FILE, "w", encoding="utf-8")
+        self._journal.write(json.dumps({"version": VERSION}) + "\n")
+
+    def _apply(self, batch: list[tuple[Path, str]]):
+        if self._journal is None:
+            self._open_journal()
+        for _, staged in batch:
+            _fsync_path(staged)
+        for target, _ in batch:
+            backup = f"{self.files_written:08d}"
+            _link_or_copy(target, self.journal_dir / backup)
+            record = {"path": os.path.abspath(target), "backup": backup}
+            self._journal.write(json.dumps(record) + "\n")
+            self.files_written += 1
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+        _fsync_dir(self.journal_dir)
+
+        directories = set()
+        for index, (target, staged) in enumerate(batch):
+            try:
+                os.replace(staged, target)
+            except BaseException:
+                _remove_staged(batch[index:])
+                raise
+            directories.add(os.path.dirname(os.path.abspath(target)))
+        for directory in directories:
+            _fsync_dir(directory)
+
+
+def rollback(journal_dir: Path) -> int:
+    """Restore the files changed by the transaction journaled in journal_dir.
+
+    Returns the number of files restored. Raises FileNotFoundError if there is no
+    journal. The journal is removed afterwards, so a transaction can only be rolled
+    back once.
+    """
+    with open(journal_dir / JOURNAL_FILE, encoding="utf-8") as f:
+        lines = f.read().splitlines()
+    records = []
+    for line in lines[1:]:
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            # A record cut short by a crash; its file was never replaced
+            break
+    restored = 0
+    directories = set()
+    # Newest first, so a file changed twice ends up with its oldest contents
+    for record in reversed(records):
+        backup = journal_dir / record["backup"]
+        if not backup.exists():
+            continue
+        target = record["path"]
+        try:
+            os.replace(backup, target)
+        except OSError:
+            # The journal may be on a different filesystem than the target
+            staged = f"{target}.rollback.tmp"
+            shutil.copy2(backup, staged)
+            os.replace(staged, target)
+        directories.add(os.path.dirname(target))
+        restored += 1
+    for directory in directories:
+        _fsync_dir(directory)
+    shutil.rmtree(journal_dir)
+    return restored
+
+
+def _link_or_copy(source: Path, destination: Path):
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copy2(source, destination)
+
+
+def _remove_staged(batch: list[tuple[Path, str]]):
+    for _, staged in batch:
+        try:
+            os.remove(staged)
+        except OSError:
+            pass
+
+
+def _fsync_path(path: str):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _fsync_dir(path):
+    # Directories can't be opened, let alone fsynced, on Windows
+    if os.name == "nt":
+        return
+    _fsync_path(path)
@@ -0,0 +1,69 @@
+"""Unified diffs of files whose lines are changed in place, generated as a stream."""
+from collections import deque
+from collections.abc import Iterable, Iterator
+
+DIFF_CONTEXT = 3
+NO_NEWLINE = b"\n\\ No newline at end of file\n"
+
+
+def unified_diff(
+    path: str, lines: Iterable[tuple[bytes, bytes]], context: int = DIFF_CONTEXT
+) -> Iterator[bytes]:
+    """Yield a unified diff of path, in the format git apply accepts.
+
+    lines yields an (old, new) pair for every line of the file, including its line
+    ending, where each line is replaced by exactly one new line. Only the current
+    hunk is held in memory, so files of any length can be diffed. Nothing is yielded
+    if no line changed.
+    """
+    before: deque[bytes] = deque(maxlen=context)
+    hunk: list[tuple[bytes, bytes]] = []
+    hunk_start = 0
+    # Unchanged lines since the last change in the hunk
+    trailing = 0
+    header_written = False
+    for lineno, (old, new) in enumerate(lines, start=1):
+        if old != new:
+            if not hunk:
+                hunk_start = lineno - len(before)
+                hunk = [(b" ", line) for line in before]
+                before.clear()
+            hunk.append((b"-", old))
+            hunk.append((b"+", new))
+            trailing = 0
+        elif hunk:
+            hunk.append((b" ", old))
+            trailing += 1
+            # Changes further apart than twice the context go in separate hunks
+            if trailing > 2 * context:
+                if not header_written:
+                    yield _header(path)
+                    header_written = True
+                cut = len(hunk) - (trailing - context)
+                yield _hunk(hunk_start, hunk[:cut])
+                before.extend(line for _, line in hunk[cut:])
+                hunk = []
+        else:
+            before.append(old)
+    if hunk:
+        if not header_written:
+            yield _header(path)
+        if trailing > context:
+            hunk = hunk[: len(hunk) - (trailing - context)]
+        yield _hunk(hunk_start, hunk)
+
+
+def _header(path: str) -> bytes:
+    encoded = path.encode()
+    return b"diff --git a/%s b/%s\n--- a/%s\n+++ b/%s\n" % ((encoded,) * 4)
+
+
+def _hunk(start: int, hunk: list[tuple[bytes, bytes]]) -> bytes:
+    old_count = sum(1 for tag, _ in hunk if tag != b"+")
+    new_count = sum(1 for tag, _ in hunk if tag != b"-")
+    parts = [b"@@ -%d,%d +%d,%d @@\n" % (start, old_count, start, new_count)]
+    for tag, line in hunk:
+        parts.append(tag + line)
+        if not line.endswith(b"\n"):
+            parts.append(NO_NEWLINE)
+    return b"".join(parts)
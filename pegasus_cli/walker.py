@@ -0,0 +1,196 @@
+"""Fast directory walking with pruning and .gitignore support."""
+import fnmatch
+import os
+import re
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+
+# Directories that never contain hand-written templates or scripts.
+DEFAULT_EXCLUDES = (
+    ".git",
+    "node_modules",
+    "__pycache__",
+    ".venv",
+    "venv",
+    "static",
+    "staticfiles",
+    "dist",
+    "build",
+)
+GITIGNORE = ".gitignore"
+
+
+class IgnoreRules:
+    """Patterns from a single .gitignore file.
+
+    Supports the commonly used subset of gitignore syntax: ``*``, ``?`` and ``**``
+    globs, ``#`` comments, patterns anchored with a leading or inner ``/``,
+    directory-only patterns with a trailing ``/`` and ``!`` negation.
+    """
+
+    def __init__(self, base: str, lines: Iterable[str]):
+        self.base = base
+        self.rules: list[tuple[re.Pattern, bool, bool]] = []
+        for line in lines:
+            line = line.rstrip("\n").rstrip()
+            if not line or line.startswith("#"):
+                continue
+            negate = line.startswith("!")
+            if negate:
+                line = line[1:]
+            dir_only = line.endswith("/")
+            line = line.strip("/") if dir_only else line
+            anchored = "/" in line
+            line = line.lstrip("/")
+            if not line:
+                continue
+            regex = _glob_to_regex(line)
+            if not anchored:
+                regex = "(?:.*/)?" + regex
+            self.rules.append((re.compile(regex + r"\Z"), negate, dir_only))
+
+    @classmethod
+    def from_file(cls, path: str) -> "IgnoreRules | None":
+        try:
+            with open(path, encoding="utf-8", errors="replace") as f:
+                return cls(os.path.dirname(path), f)
+        except OSError:
+            return None
+
+    def match(self, path: str, is_dir: bool) -> bool | None:
+        """Return True if the absolute path is ignored, False if it is re-included
+        and None if no rule applies."""
+        if not path.startswith(self.base + os.sep):
+            return None
+        rel = path[len(self.base) + 1 :].replace(os.sep, "/")
+        result = None
+        for regex, negate, dir_only in self.rules:
+            if dir_only and not is_dir:
+                continue
+            if regex.match(rel):
+                result = not negate
+        return result
+
+
+def _glob_to_regex(pattern: str) -> str:
+    regex = []
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            regex.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("**", i):
+            regex.append(".*")
+            i += 2
+        elif pattern[i] == "*":
+            regex.append("[^/]*")
+            i += 1
+        elif pattern[i] == "?":
+            regex.append("[^/]")
+            i += 1
+        elif pattern[i] == "[" and "]" in pattern[i + 1 :]:
+            end = pattern.index("]", i + 1)
+            regex.append("[" + pattern[i + 1 : end].replace("!", "^", 1) + "]")
+            i = end + 1
+        else:
+            regex.append(re.escape(pattern[i]))
+            i += 1
+    return "".join(regex)
+
+
+def _is_ignored(rule_sets: list[IgnoreRules], path: str, is_dir: bool) -> bool:
+    # Later (deeper) files take precedence, as do later rules within a file
+    for rules in reversed(rule_sets):
+        result = rules.match(path, is_dir)
+        if result is not None:
+            return result
+    return False
+
+
+def _ancestor_rules(search_dir: str) -> list[IgnoreRules]:
+    """Load .gitignore files from the current directory down to search_dir's parent."""
+    rule_sets = []
+    current = os.getcwd()
+    rel = os.path.relpath(search_dir, current)
+    if rel == os.curdir or rel.startswith(os.pardir):
+        return rule_sets
+    for part in [""] + rel.split(os.sep)[:-1]:
+        current = os.path.join(current, part) if part else current
+        rules = IgnoreRules.from_file(os.path.join(current, GITIGNORE))
+        if rules is not None:
+            rule_sets.append(rules)
+    return rule_sets
+
+
+def exclude_matcher(excludes: Iterable[str]):
+    """Return a function telling whether a file or directory name matches excludes."""
+    regex = "|".join(fnmatch.translate(pattern) for pattern in excludes)
+    return re.compile(regex or "(?!)").match
+
+
+def walk_files(
+    search_dir: Path,
+    extensions: Iterable[str],
+    excludes: Iterable[str] = DEFAULT_EXCLUDES,
+    use_gitignore: bool = True,
+) -> Iterator[Path]:
+    """Yield files under search_dir with one of the given extensions, in a stable order.
+
+    Directories whose name matches one of the excludes globs, or that are ignored by a
+    .gitignore, are pruned before they are descended into. Only matching files are
+    turned into Path objects.
+    """
+    for is_dir, path in _walk(
+        search_dir, frozenset(extensions), excludes, use_gitignore
+    ):
+        if not is_dir:
+            yield Path(path)
+
+
+def walk_dirs(
+    search_dir: Path,
+    excludes: Iterable[str] = DEFAULT_EXCLUDES,
+    use_gitignore: bool = True,
+) -> Iterator[str]:
+    """Yield search_dir and every directory below it that walk_files would visit."""
+    for is_dir, path in _walk(search_dir, frozenset(), excludes, use_gitignore):
+        if is_dir:
+            yield path
+
+
+def _walk(search_dir, extensions, excludes, use_gitignore):
+    """Yield (is_dir, path) for the directories visited and the matching files."""
+    is_excluded = exclude_matcher(excludes)
+    # Walk absolute paths so .gitignore rules can be matched against them, but yield
+    # paths in the same form as search_dir.
+    root = os.path.normpath(search_dir)
+    abs_root = os.path.abspath(root)
+    rule_sets = _ancestor_rules(abs_root) if use_gitignore else []
+
+    def walk(dirpath, rule_sets):
+        yield True, root + dirpath[len(abs_root) :]
+        try:
+            with os.scandir(dirpath) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError:
+            return
+        if use_gitignore and any(entry.name == GITIGNORE for entry in entries):
+            rules = IgnoreRules.from_file(os.path.join(dirpath, GITIGNORE))
+            if rules is not None:
+                rule_sets = rule_sets + [rules]
+        for entry in entries:
+            name = entry.name
+            try:
+                is_dir = entry.is_dir(follow_symlinks=False)
+            except OSError:
+                continue
+            if is_dir:
+                if is_excluded(name) or _is_ignored(rule_sets, entry.path, True):
+                    continue
+                yield from walk(entry.path, rule_sets)
+            elif os.path.splitext(name)[1] in extensions and entry.is_file():
+                if is_excluded(name) or _is_ignored(rule_sets, entry.path, False):
+                    continue
+                yield False, root + entry.path[len(abs_root) :]
+
+    yield from walk(abs_root, rule_sets)
@@ -0,0 +1,270 @@
+"""Watch directories for changed files, using inotify where available.
+
+On Linux, changes are delivered by inotify (via ctypes, so no extra dependency is
+needed). Everywhere else, or if inotify can't be set up, the watched files are
+polled for size and mtime changes instead.
+"""
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+from collections.abc import Iterable
+from pathlib import Path
+
+from .walker import DEFAULT_EXCLUDES, exclude_matcher, walk_dirs, walk_files
+
+# Seconds to wait for further events before handling a burst of changes
+DEBOUNCE = 0.2
+POLL_INTERVAL = 1.0
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+# Only completed writes and new entries matter; deleted files have nothing to migrate.
+INOTIFY_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+INOTIFY_EVENT = struct.Struct("iIII")
+
+
+class Watcher:
+    """Base class for watchers of the files under some directories, plus extra files.
+
+    Subclasses implement poll(), returning the paths that changed within timeout
+    seconds (or blocking until something changes if timeout is None).
+    """
+
+    def __init__(
+        self,
+        dirs: Iterable[Path],
+        extensions: Iterable[str],
+        excludes: Iterable[str] = DEFAULT_EXCLUDES,
+        use_gitignore: bool = True,
+        extra_files: Iterable[Path] = (),
+    ):
+        self.dirs = [d for d in dirs if d.is_dir()]
+        self.extensions = frozenset(extensions)
+        self.excludes = tuple(excludes)
+        self.use_gitignore = use_gitignore
+        self.extra_files = {os.path.normpath(f) for f in extra_files}
+        # path -> (size, mtime_ns) of files the caller wrote itself
+        self._own_writes: dict[str, tuple[int, int]] = {}
+
+    def poll(self, timeout: float | None) -> set[Path]:
+        raise NotImplementedError
+
+    def ignore_writes(self, paths: Iterable[Path]):
+        """Don't report the caller's own writes to paths as changes.
+
+        Each path's current size and mtime are recorded, and the next change seen
+        for it is dropped if they still match. Any later change is reported.
+        """
+        for path in paths:
+            signature = _signature(path)
+            if signature is not None:
+                self._own_writes[os.path.normpath(path)] = signature
+
+    def wait_for_changes(
+        self, debounce: float = DEBOUNCE, timeout: float | None = None
+    ) -> set[Path]:
+        """Block until files change, then collect further changes until none arrive
+        for debounce seconds. Returns an empty set if nothing changed within timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None
+            if deadline is not None:
+                remaining = max(0.0, deadline - time.monotonic())
+            polled = self.poll(remaining)
+            changed = self._drop_own_writes(polled)
+            if changed or not polled:
+                break
+        while changed:
+            more = self._drop_own_writes(self.poll(debounce))
+            if not more:
+                break
+            changed |= more
+        return changed
+
+    def close(self):
+        pass
+
+    def _wanted(self, path: str) -> bool:
+        return os.path.splitext(path)[1] in self.extensions
+
+    def _drop_own_writes(self, changed: set[Path]) -> set[Path]:
+        if not self._own_writes:
+            return changed
+        kept = set()
+        for path in changed:
+            signature = self._own_writes.pop(os.path.normpath(path), None)
+            if signature is None or signature != _signature(path):
+                kept.add(path)
+        return kept
+
+
+class PollingWatcher(Watcher):
+    """Detects changes by comparing the size and mtime of every watched file."""
+
+    def __init__(self, *args, interval: float = POLL_INTERVAL, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.interval = interval
+        self._snapshot = self._take_snapshot()
+
+    def poll(self, timeout: float | None) -> set[Path]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self.interval
+            if deadline is not None:
+                wait = min(wait, max(0.0, deadline - time.monotonic()))
+            time.sleep(wait)
+            snapshot = self._take_snapshot()
+            changed = {
+                Path(path)
+                for path, signature in snapshot.items()
+                if self._snapshot.get(path) != signature
+            }
+            self._snapshot = snapshot
+            if changed or (deadline is not None and time.monotonic() >= deadline):
+                return changed
+
+    def _take_snapshot(self) -> dict[str, tuple[int, int]]:
+        paths = [str(f) for f in self.extra_files]
+        for search_dir in self.dirs:
+            paths.extend(
+                str(f)
+                for f in walk_files(
+                    search_dir, self.extensions, self.excludes, self.use_gitignore
+                )
+            )
+        snapshot = {}
+        for path in paths:
+            signature = _signature(path)
+            if signature is not None:
+                snapshot[os.path.normpath(path)] = signature
+        return snapshot
+
+
+class InotifyWatcher(Watcher):
+    """Receives changes from the Linux kernel through inotify.
+
+    Every directory walk_files would visit gets a watch, as does the parent of each
+    extra file. Directories created later are watched as they appear.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is only available on Linux")
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        # watch descriptor -> (directory, whether it is part of a watched tree)
+        self._watches: dict[int, tuple[str, bool]] = {}
+        self._is_excluded = exclude_matcher(self.excludes)
+        try:
+            for search_dir in self.dirs:
+                self._watch_tree(search_dir)
+            for path in self.extra_files:
+                self._add_watch(os.path.dirname(path) or os.curdir, in_tree=False)
+        except OSError:
+            self.close()
+            raise
+
+    def poll(self, timeout: float | None) -> set[Path]:
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return set()
+        changed = set()
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            changed |= self._parse_events(data)
+        return changed
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+    def _parse_events(self, data: bytes) -> set[Path]:
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size
+            name = os.fsdecode(data[offset : offset + length].rstrip(b"\0"))
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                # Events were dropped, so anything may have changed
+                changed |= self._all_files()
+                continue
+            if mask & IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+            if wd not in self._watches or not name:
+                continue
+            directory, in_tree = self._watches[wd]
+            path = os.path.join(directory, name)
+            if os.path.normpath(path) in self.extra_files:
+                changed.add(Path(path))
+            elif not in_tree:
+                continue
+            elif mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO) and not self._is_excluded(name):
+                    self._watch_tree(Path(path))
+                    changed.update(
+                        walk_files(
+                            path, self.extensions, self.excludes, self.use_gitignore
+                        )
+                    )
+            elif self._wanted(path) and not self._is_excluded(name):
+                changed.add(Path(path))
+        return changed
+
+    def _watch_tree(self, search_dir: Path):
+        for directory in walk_dirs(search_dir, self.excludes, self.use_gitignore):
+            self._add_watch(directory, in_tree=True)
+
+    def _add_watch(self, directory: str, in_tree: bool):
+        wd = self._libc.inotify_add_watch(
+            self._fd, os.fsencode(directory), INOTIFY_MASK
+        )
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"Could not watch {directory}")
+        # The same directory may be both in a tree and the parent of an extra file
+        in_tree = in_tree or self._watches.get(wd, (directory, False))[1]
+        self._watches[wd] = (directory, in_tree)
+
+    def _all_files(self) -> set[Path]:
+        changed = {Path(path) for path in self.extra_files}
+        for search_dir in self.dirs:
+            changed |= set(
+                walk_files(
+                    search_dir, self.extensions, self.excludes, self.use_gitignore
+                )
+            )
+        return changed
+
+
+def _signature(path: str | Path) -> tuple[int, int] | None:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def create_watcher(*args, **kwargs) -> Watcher:
+    """Return an InotifyWatcher if inotify is available, else a PollingWatcher."""
+    try:
+        return InotifyWatcher(*args, **kwargs)
+    except (OSError, AttributeError, TypeError):
+        return PollingWatcher(*args, **kwargs)
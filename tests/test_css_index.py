@@ -0,0 +1,145 @@
+import json
+import os
+
+import pytest
+from click.testing import CliRunner
+
+from pegasus_cli import cache, css_index
+from pegasus_cli.cli import cli
+from pegasus_cli.css_index import ClassIndex, index_file
+from pegasus_cli.migrate_css import ClassMatcher
+
+TAILWIND_CSS = """\
+.pg-button {
+  @apply btn;
+}
+
+.pg-button-danger {
+  @apply btn btn-error;
+}
+"""
+
+
+@pytest.fixture(autouse=True)
+def project(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, "CACHE_DIR", tmp_path / "cache")
+    css_file = tmp_path / "assets" / "styles" / "pegasus" / "tailwind.css"
+    css_file.parent.mkdir(parents=True)
+    css_file.write_text(TAILWIND_CSS)
+    templates = tmp_path / "templates"
+    templates.mkdir()
+    (templates / "page.html").write_text(
+        '<a class="pg-button">\n<b class="pg-button pg-button-danger">\n'
+        '<i class="pg-unknown">\n'
+    )
+    (templates / "other.html").write_text('<a class="pg-button">\n')
+    # Make sure the files are older than any index saved by the tests
+    for path in templates.iterdir():
+        os.utime(path, ns=(0, 0))
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def run(*args):
+    result = CliRunner().invoke(cli, ["css-index", *args])
+    assert result.exit_code == 0, result.output
+    return result
+
+
+def test_index_file_records_lines(project):
+    matcher = ClassMatcher(["pg-button", "pg-button-danger"])
+
+    size, _, occurrences, unmapped = index_file(
+        project / "templates" / "page.html", matcher
+    )
+
+    assert occurrences == {
+        "pg-button": [1, 2],
+        "pg-button-danger": [2],
+        "pg-unknown": [3],
+    }
+    assert unmapped == ["pg-unknown"]
+    assert size > 0
+
+
+def test_unmapped_class_running_into_a_mapped_one(project):
+    page = project / "templates" / "page.html"
+    page.write_text('<a class="pg-x-pg-button">\n')
+    os.utime(page, ns=(0, 0))
+
+    run("update", "-j", "1")
+    assert run("query", "--unmapped").output == "templates/page.html:1: pg-x-\n"
+
+    page.write_text('<a class="pg-button">\n')
+    os.utime(page, ns=(0, 0))
+    run("update", "-j", "1")
+    index = ClassIndex.load(project / ".pegasus" / "css-index")
+    assert index.unmapped == set()
+
+
+def test_query(project):
+    result = run("update", "-j", "1")
+    assert "3 classes in 2 files" in result.output
+
+    result = run("query", "pg-button")
+    assert result.output == (
+        "templates/other.html:1: pg-button\n"
+        "templates/page.html:1: pg-button\n"
+        "templates/page.html:2: pg-button\n"
+    )
+
+    result = run("query", "pg-button*", "--json")
+    assert json.loads(result.output) == {
+        "pg-button": {"templates/other.html": [1], "templates/page.html": [1, 2]},
+        "pg-button-danger": {"templates/page.html": [2]},
+    }
+
+    assert run("query", "--unmapped").output == "templates/page.html:3: pg-unknown\n"
+    assert "pg-button (3 lines in 2 files)" in run("query").output
+
+
+def test_update_is_incremental(project, monkeypatch):
+    run("update", "-j", "1")
+    (project / "templates" / "other.html").unlink()
+    (project / "templates" / "new.html").write_text('<a class="pg-other">')
+    scanned = []
+
+    def tracking_index_file(filepath, matcher):
+        scanned.append(filepath.name)
+        return index_file(filepath, matcher)
+
+    monkeypatch.setattr(css_index, "index_file", tracking_index_file)
+    result = run("update", "-j", "1")
+
+    assert scanned == ["new.html"]
+    assert "Scanned 1 changed files and removed 1" in result.output
+    index = ClassIndex.load(project / ".pegasus" / "css-index")
+    assert index.find(["pg-button"]) == {"pg-button": {"templates/page.html": [1, 2]}}
+    assert index.unmapped == {"pg-other", "pg-unknown"}
+
+
+def test_query_without_index():
+    result = CliRunner().invoke(cli, ["css-index", "query", "pg-button"])
+
+    assert result.exit_code == 1
+    assert "Run `pegasus css-index update` first" in result.output
+
+
+def test_load_only_parses_matching_classes(project, monkeypatch):
+    run("update", "-j", "1")
+    parsed = []
+    loads = json.loads
+
+    def tracking_loads(text, *args, **kwargs):
+        parsed.append(text)
+        return loads(text, *args, **kwargs)
+
+    monkeypatch.setattr(css_index.json, "loads", tracking_loads)
+    index = ClassIndex.load(
+        project / ".pegasus" / "css-index", patterns=["pg-button-danger"]
+    )
+
+    assert index.classes == {"pg-button-danger": {"templates/page.html": [2]}}
+    assert index.files == {}
+    # The header and the one matching class
+    assert len(parsed) == 2
@@ -0,0 +1,55 @@
+from pegasus_cli.css_parser import parse_apply_rules, tokenize
+
+
+def test_parse_apply_rules_handles_real_world_css():
+    content = """\
+/* .pg-commented { @apply nope; } */
+@import "tailwindcss";
+@layer components {
+  .pg-card {
+    @apply card
+      bg-base-100   shadow-sm;
+  }
+
+  .pg-title { @apply text-lg; @apply font-bold }
+  .pg-with-comment {
+    /* a { brace } in a comment */
+    @apply badge; /* trailing */
+  }
+  .pg-quoted::before { content: "}"; }
+}
+.pg-one, .pg-two { @apply btn; }
+"""
+
+    assert parse_apply_rules(content, "pg-") == {
+        "pg-card": "card bg-base-100 shadow-sm",
+        "pg-title": "text-lg font-bold",
+        "pg-with-comment": "badge",
+        "pg-one": "btn",
+        "pg-two": "btn",
+    }
+
+
+def test_parse_apply_rules_skips_rules_that_are_not_plain_renames():
+    content = """\
+.pg-mixed { @apply btn; color: red; }
+.pg-hover:hover { @apply btn-active; }
+.parent .pg-child { @apply text-sm; }
+.pg-empty { }
+.other { @apply btn; }
+.pg-nested {
+  @apply card;
+  .pg-inner { @apply card-body; }
+}
+"""
+
+    assert parse_apply_rules(content, "pg-") == {
+        "pg-inner": "card-body",
+        "pg-nested": "card",
+    }
+
+
+def test_tokenize_keeps_strings_and_drops_comments():
+    tokens = list(tokenize('a { b: "x;}" /* c; */; } d'))
+
+    assert tokens == [("{", "a "), (";", ' b: "x;}" '), ("}", " "), ("", " d")]
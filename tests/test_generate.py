@@ -1,13 +1,38 @@
+import os
 import pathlib
+import subprocess
 
-from pegasus_cli.generate import render_cookiecutter
-from pegasus_cli.monkeypatch import patch_cookiecutter
+import pytest
+from click.testing import CliRunner
+from cookiecutter.generate import generate_files
+from cookiecutter_patch import patch_cookiecutter
+
+from pegasus_cli import cache
+from pegasus_cli.generate import (
+    RenderedTree,
+    TemplatePack,
+    load_template_pack,
+    render_cookiecutter,
+)
+from pegasus_cli.jinja import ENV_KWARGS, TEMPLATE_BASE, TemplateBytecodeCache
+from pegasus_cli.startapp import (
+    _get_css_framework_context,
+    _get_team_context,
+    startapp,
+)
 
 TEMPLATES_PATH = pathlib.Path(__file__).parent
 
 patch_cookiecutter()
 
 
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path_factory, monkeypatch):
+    path = tmp_path_factory.mktemp("cache")
+    monkeypatch.setattr(cache, "CACHE_DIR", path)
+    return path
+
+
 def test_generate(tmpdir):
     render_cookiecutter(
         "template",
@@ -25,3 +50,260 @@ def test_generate(tmpdir):
         "test_dir/readme.md": "Hello test_app!\n",
     }
     assert generated_files == expected
+
+
+def _read_tree(root):
+    return {
+        path.relative_to(root).as_posix(): (
+            path.read_bytes() if path.is_file() else None,
+            path.stat().st_mode,
+        )
+        for path in sorted(pathlib.Path(root).rglob("*"))
+    }
+
+
+def _startapp_context(model_names):
+    return {
+        "app_name": "things",
+        "camel_case_app_name": "Things",
+        "app_module_path": "apps.things",
+        "model_names": model_names,
+        "base_model": None,
+        "base_model_module": None,
+        "base_model_class": None,
+        **_get_team_context(True),
+        **_get_css_framework_context("tailwind"),
+    }
+
+
+def test_render_matches_cookiecutter(tmp_path):
+    extra = {"app_name": "things", "template_dir_name": "things"}
+    for model_names in ([], ["Widget"]):
+        context = _startapp_context(model_names)
+        if model_names:
+            context.update(model_name="Widget", model_name_lower="widget")
+        for pack in ("app_template", "app_template_templates", "model_templates"):
+            if pack == "model_templates" and not model_names:
+                continue
+            native = tmp_path / f"native-{pack}-{len(model_names)}"
+            expected = tmp_path / f"cookiecutter-{pack}-{len(model_names)}"
+            render_cookiecutter(pack, native, dict(context), extra)
+            generate_files(
+                repo_dir=TEMPLATE_BASE / pack,
+                context={
+                    **context,
+                    "cookiecutter": {"_jinja2_env_vars": ENV_KWARGS, **extra},
+                },
+                overwrite_if_exists=True,
+                output_dir=expected,
+            )
+            if pack == "app_template" and not model_names:
+                # cookiecutter doesn't run the in-process hook that removes forms.py
+                (expected / "things" / "forms.py").unlink()
+            assert _read_tree(native) == _read_tree(expected)
+
+
+def test_hooks_run_in_process(tmp_path, monkeypatch):
+    def call(*args, **kwargs):
+        raise AssertionError("hook run as a subprocess")
+
+    monkeypatch.setattr("subprocess.call", call)
+    pack = TemplatePack(TEMPLATE_BASE / "app_template")
+    project_dir = pack.render(
+        tmp_path, {**_startapp_context([]), "cookiecutter": {"app_name": "things"}}
+    )
+    assert project_dir == tmp_path / "things"
+    assert not (project_dir / "forms.py").exists()
+    assert (project_dir / "views.py").exists()
+
+
+def test_render_only_writes_changed_files(tmp_path):
+    context = {**_startapp_context(["Widget"]), "cookiecutter": {"app_name": "things"}}
+    pack = TemplatePack(TEMPLATE_BASE / "app_template")
+    project_dir = pack.render(tmp_path, context)
+    for path in project_dir.rglob("*.py"):
+        os.utime(path, ns=(0, 0))
+    (project_dir / "views.py").write_text("# edited\n")
+    (project_dir / "forms.py").chmod(0o600)
+
+    tree = RenderedTree()
+    pack.render_into(tree, tmp_path, context)
+    assert tree.changes() == {
+        project_dir / "forms.py": "update",
+        project_dir / "views.py": "update",
+    }
+    assert (project_dir / "views.py").read_text() == "# edited\n"
+
+    assert tree.write() == {
+        project_dir / "forms.py": "update",
+        project_dir / "views.py": "update",
+    }
+    assert tree.changes() == {}
+    assert {
+        path.name for path in project_dir.rglob("*.py") if path.stat().st_mtime_ns
+    } == {"forms.py", "views.py"}
+
+    tree = RenderedTree()
+    pack.render_into(tree, tmp_path, {**context, "model_names": []})
+    assert tree.changes()[project_dir / "forms.py"] == "delete"
+    tree.write()
+    assert not (project_dir / "forms.py").exists()
+
+
+def test_hook_scripts_are_still_supported(tmp_path):
+    pack_dir = tmp_path / "pack"
+    (pack_dir / "{{cookiecutter.name}}").mkdir(parents=True)
+    (pack_dir / "{{cookiecutter.name}}" / "readme.md").write_text("<< name >>\n")
+    (pack_dir / "hooks").mkdir()
+    (pack_dir / "hooks" / "post_gen_project.py").write_text(
+        "import pathlib\npathlib.Path('hooked.txt').write_text('<< name >>')\n"
+    )
+
+    project_dir = TemplatePack(pack_dir).render(
+        tmp_path / "out", {"name": "thing", "cookiecutter": {"name": "thing"}}
+    )
+    assert (project_dir / "readme.md").read_text() == "thing\n"
+    assert (project_dir / "hooked.txt").read_text() == "thing"
+
+
+def test_hook_scripts_run_when_a_rendered_tree_is_written(tmp_path):
+    pack_dir = tmp_path / "pack"
+    (pack_dir / "{{cookiecutter.name}}").mkdir(parents=True)
+    (pack_dir / "{{cookiecutter.name}}" / "readme.md").write_text("<< name >>\n")
+    (pack_dir / "hooks").mkdir()
+    (pack_dir / "hooks" / "pre_gen_project.py").write_text(
+        "import pathlib\nassert not pathlib.Path('readme.md').exists()\n"
+    )
+    (pack_dir / "hooks" / "post_gen_project.py").write_text(
+        "import pathlib\npathlib.Path('hooked.txt').write_text("
+        "pathlib.Path('readme.md').read_text())\n"
+    )
+
+    tree = RenderedTree()
+    project_dir = render_cookiecutter(
+        "pack", tmp_path / "out", {"name": "thing"}, {"name": "thing"}, tmp_path, tree
+    )
+    assert not project_dir.exists()
+
+    tree.write()
+    assert (project_dir / "hooked.txt").read_text() == "thing\n"
+
+
+def test_template_pack_is_compiled_once(tmp_path, monkeypatch):
+    compiled = []
+    original = TemplatePack.__init__
+    monkeypatch.setattr(
+        TemplatePack,
+        "__init__",
+        lambda self, repo_dir: compiled.append(repo_dir) or original(self, repo_dir),
+    )
+    load_template_pack.cache_clear()
+
+    for model_name in ("Widget", "Gadget", "Gizmo"):
+        render_cookiecutter(
+            "model_templates",
+            tmp_path,
+            {
+                **_startapp_context([model_name]),
+                "model_name": model_name,
+                "model_name_lower": model_name.lower(),
+            },
+            {"template_dir_name": "things"},
+        )
+
+    assert len(compiled) == 1
+    assert sorted(path.name for path in (tmp_path / "things").iterdir()) == [
+        f"{name}_{view}.html"
+        for name in ("gadget", "gizmo", "widget")
+        for view in ("detail", "form", "list")
+    ]
+
+
+def test_template_pack_bytecode_is_cached(cache_dir, monkeypatch):
+    TemplatePack(TEMPLATE_BASE / "model_templates")
+    assert list(cache_dir.glob("jinja-bytecode/*.jbc"))
+
+    def compile(*args, **kwargs):
+        raise AssertionError("template compiled again")
+
+    monkeypatch.setattr("jinja2.Environment.compile", compile)
+    pack = TemplatePack(TEMPLATE_BASE / "model_templates")
+    assert pack.files
+
+
+def test_bytecode_cache_evicts_least_recently_used(cache_dir):
+    env = TemplatePack(TEMPLATE_BASE / "model_templates").env
+    bytecode_cache = TemplateBytecodeCache(max_size=0)
+    env = env.overlay(bytecode_cache=bytecode_cache)
+    bucket = bytecode_cache.get_bucket(env, "a.html", None, "<< a >>")
+    bucket.code = env.compile("<< a >>")
+    bytecode_cache.set_bucket(bucket)
+    # Entries are only evicted when the cache is pruned
+    assert list(cache_dir.glob("jinja-bytecode/*"))
+    bytecode_cache.prune()
+    assert not list(cache_dir.glob("jinja-bytecode/*"))
+
+    paths = []
+    for name in ("old.html", "new.html"):
+        bucket = bytecode_cache.get_bucket(env, name, None, name)
+        bucket.code = env.compile(name)
+        bytecode_cache.set_bucket(bucket)
+        paths.append(cache.cache_path("jinja-bytecode", bucket.key, ".jbc"))
+    os.utime(paths[0], ns=(1_000_000_000, 1_000_000_000))
+    os.utime(paths[1], ns=(2_000_000_000, 2_000_000_000))
+    bytecode_cache.max_size = paths[1].stat().st_size
+    bytecode_cache.prune()
+    assert [path.exists() for path in paths] == [False, True]
+
+
+def test_startapp_manifest(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "proj").mkdir()
+    (tmp_path / "proj" / "settings.py").write_text("INSTALLED_APPS = [\n]\n")
+    (tmp_path / "proj" / "urls.py").write_text("urlpatterns = [\n]\n")
+    (tmp_path / "apps.yaml").write_text(
+        "apps:\n"
+        "  - name: todos\n"
+        "    models: [Project, Todo]\n"
+        "  - name: billing\n"
+        "    module_path: apps\n"
+    )
+    args = [
+        "--manifest",
+        "apps.yaml",
+        "--django-settings",
+        str(tmp_path / "proj" / "settings.py"),
+    ]
+
+    result = CliRunner().invoke(startapp, args)
+
+    assert result.exit_code == 0, result.output
+    assert (tmp_path / "todos" / "templates" / "todos" / "todo_list.html").exists()
+    assert not (tmp_path / "billing" / "forms.py").exists()
+    assert (tmp_path / "proj" / "settings.py").read_text() == (
+        "INSTALLED_APPS = [\n"
+        '    "todos.apps.TodosConfig",\n'
+        '    "apps.billing.apps.BillingConfig",\n'
+        "]\n"
+    )
+    assert (tmp_path / "proj" / "urls.py").read_text() == (
+        "urlpatterns = [\n"
+        '    path("todos/", include("todos.urls")),\n'
+        '    path("billing/", include("apps.billing.urls")),\n'
+        "]\n"
+    )
+
+    calls = []
+    popen = subprocess.Popen
+    monkeypatch.setattr(
+        "subprocess.Popen",
+        lambda args, **kwargs: calls.append(args) or popen(args, **kwargs),
+    )
+    result = CliRunner().invoke(startapp, [*args, "--dry-run"])
+    assert result.exit_code == 0, result.output
+    assert result.output.endswith("0 files would change, 25 are up to date.\n")
+    # Every app's Python files are formatted in a single ruff call
+    assert [args[:3] for args in calls] == [["ruff", "format", "--no-cache"]]
+
+    result = CliRunner().invoke(startapp, ["todos", *args])
+    assert result.exit_code == 2
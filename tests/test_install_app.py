@@ -2,6 +2,8 @@ import pathlib
 import textwrap
 
 from pegasus_cli.install import (
+    add_all_to_installed_apps,
+    add_all_to_urlpatterns,
     add_to_installed_apps,
     add_to_urlpatterns,
     find_settings_from_manage_py,
@@ -52,6 +54,28 @@ def test_installed_apps_multiline(tmp_path):
     assert apps[-1] == APP_CONFIG
 
 
+def test_installed_apps_adds_several_apps_at_once(tmp_path):
+    settings = write_settings(
+        tmp_path,
+        """
+        INSTALLED_APPS = ["django.contrib.auth", "todos.apps.TodosConfig"]
+    """,
+    )
+
+    result = add_all_to_installed_apps(
+        str(settings),
+        ["todos.apps.TodosConfig", APP_CONFIG, "billing.apps.BillingConfig"],
+    )
+
+    assert result is True
+    assert installed_apps_contents(settings) == [
+        "django.contrib.auth",
+        "todos.apps.TodosConfig",
+        APP_CONFIG,
+        "billing.apps.BillingConfig",
+    ]
+
+
 def test_installed_apps_single_line(tmp_path):
     settings = write_settings(
         tmp_path,
@@ -337,6 +361,37 @@ def test_urlpatterns_multiline(tmp_path):
     assert 'path("admin/", admin.site.urls)' in text
 
 
+def test_urlpatterns_adds_several_apps_at_once(tmp_path):
+    urls = write_urls(
+        tmp_path,
+        """
+        from django.urls import path, include
+
+        urlpatterns = [
+            path("golf/", include("apps.golf.urls")),
+        ]
+    """,
+    )
+
+    result = add_all_to_urlpatterns(
+        str(urls),
+        [("golf", "apps.golf"), ("tennis", "apps.tennis"), ("polo", "apps.polo")],
+        use_teams=False,
+    )
+
+    assert result is True
+    assert urls.read_text().count('include("apps.golf.urls")') == 1
+    assert (
+        textwrap.dedent("""\
+            path("golf/", include("apps.golf.urls")),
+            path("tennis/", include("apps.tennis.urls")),
+            path("polo/", include("apps.polo.urls")),
+        ]
+    """)
+        in urls.read_text()
+    )
+
+
 def test_urlpatterns_empty_list(tmp_path):
     urls = write_urls(
         tmp_path,
@@ -0,0 +1,1011 @@
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import textwrap
+from pathlib import Path
+
+import pytest
+from click.testing import CliRunner
+
+from pegasus_cli import cache, migrate_css
+from pegasus_cli.cli import cli
+from pegasus_cli.migrate_css import (
+    ANY_PG_CLASS_PATTERN,
+    ClassMatcher,
+    Manifest,
+    apply_replacements,
+    build_pattern,
+    css_class_map_fingerprint,
+    find_files,
+    load_css_class_map,
+    migrate_file,
+    migrate_files,
+    migrate_large_file,
+    parse_tailwind_css,
+    shard_files,
+    sniff_file,
+)
+from pegasus_cli.transaction import Transaction
+from pegasus_cli.watch import InotifyWatcher
+
+TAILWIND_CSS = """\
+.pg-button-danger {
+  @apply btn btn-error;
+}
+
+.pg-button {
+  @apply btn;
+}
+
+.pg-text-muted {
+  @apply text-base-content/70;
+}
+"""
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    path = tmp_path / "cache"
+    monkeypatch.setattr(cache, "CACHE_DIR", path)
+    return path
+
+
+def _fail_scan(*args, **kwargs):
+    raise AssertionError("file should not be scanned")
+
+
+def write_project(root, files):
+    css_file = root / "assets" / "styles" / "pegasus" / "tailwind.css"
+    css_file.parent.mkdir(parents=True)
+    css_file.write_text(TAILWIND_CSS)
+    for name, content in files.items():
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(textwrap.dedent(content))
+    return css_file
+
+
+def test_parse_tailwind_css(tmp_path):
+    css_file = write_project(tmp_path, {})
+
+    assert parse_tailwind_css(css_file) == {
+        "pg-button-danger": "btn btn-error",
+        "pg-button": "btn",
+        "pg-text-muted": "text-base-content/70",
+    }
+
+
+def test_load_css_class_map_caches_parsed_map(tmp_path, cache_dir, monkeypatch):
+    css_file = write_project(tmp_path, {})
+    expected = parse_tailwind_css(css_file)
+    load_css_class_map(css_file)
+
+    def fail_parse(*args):
+        raise AssertionError("CSS should not be parsed again")
+
+    monkeypatch.setattr(migrate_css, "parse_apply_rules", fail_parse)
+    css_class_map, matcher = load_css_class_map(css_file)
+
+    assert css_class_map == expected
+    assert matcher.names == set(expected)
+    assert len(list(cache_dir.glob("migrate-css/*.json"))) == 1
+
+    with pytest.raises(AssertionError):
+        load_css_class_map(css_file, use_cache=False)
+    css_file.write_text(".pg-new { @apply btn; }")
+    with pytest.raises(AssertionError):
+        load_css_class_map(css_file)
+
+
+def test_load_css_class_map_ignores_corrupt_cache(tmp_path, cache_dir):
+    css_file = write_project(tmp_path, {})
+    load_css_class_map(css_file)
+    for path in cache_dir.glob("migrate-css/*.json"):
+        path.write_text("{not json")
+
+    css_class_map, _ = load_css_class_map(css_file)
+
+    assert css_class_map == parse_tailwind_css(css_file)
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        '<a class="pg-button pg-button-danger">',
+        "pg-button-dangerous pg-button-",
+        "xpg-button pg-buttonpg-button",
+        "pg-unknown-pg-button pg-button-pg-button-danger",
+        "{% if x %}pg-button{% endif %}\npg-text-muted",
+        "no classes here",
+    ],
+)
+def test_class_matcher_matches_alternation_regex(content):
+    names = ["pg-button-danger", "pg-button", "pg-text-muted"]
+    regex = re.compile(
+        r"(" + "|".join(sorted(names, key=len, reverse=True)) + r")(?![a-z0-9-])"
+    )
+    matcher = ClassMatcher(names)
+
+    assert [(s, e, n) for s, e, n in matcher.finditer(content)] == [
+        (m.start(), m.end(), m.group(1)) for m in regex.finditer(content)
+    ]
+    assert matcher.sub(str.upper, content) == regex.sub(
+        lambda m: m.group(1).upper(), content
+    )
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        "pg-unknown pg-other-thing",
+        "pg-unknown- pg-unknown_x pg-Unknown apg-unknown -pg-unknown",
+        "pg-a-pg-b pg-",
+        "pg-card-é pg-card1",
+        "pg-danger-pg-text-muted pg-danger-pg-button-pg-x",
+    ],
+)
+def test_class_matcher_scan_finds_unmapped_like_regex(content):
+    names = {"pg-button", "pg-text-muted"}
+    matcher = ClassMatcher(names)
+
+    spans, unmapped = matcher.scan(content)
+    _, positions = matcher.locate(content)
+
+    assert spans == list(matcher.finditer(content))
+    assert {name for _, name in positions} == unmapped
+    assert all(content.startswith(name, start) for start, name in positions)
+    # Unmapped names are found as if the mapped ones had been replaced first
+    for start, end, _name in spans:
+        content = content[:start] + "X" * (end - start) + content[end:]
+    assert unmapped == {
+        name for name in ANY_PG_CLASS_PATTERN.findall(content) if name not in names
+    }
+
+
+def test_class_matcher_scan_returns_spans_and_unmapped():
+    matcher = ClassMatcher(["pg-button", "pg-text-muted"])
+
+    spans, unmapped = matcher.scan('<a class="pg-button pg-unknown pg-button-">')
+
+    assert spans == [(10, 19, "pg-button")]
+    assert unmapped == {"pg-unknown"}
+
+
+def test_class_matcher_matches_unprefixed_names_as_whole_tokens():
+    matcher = ClassMatcher(["pg-button", "btn-ghost", "rounded"])
+    content = (
+        'class="hover:btn-ghost my-btn-ghost btn-ghost_x rounded/50 xpg-button -pg-new"'
+    )
+
+    spans, unmapped = matcher.scan(content)
+
+    assert [name for _, _, name in spans] == ["btn-ghost", "rounded", "pg-button"]
+    assert [name for _, _, name in matcher.finditer(content)] == [
+        name for _, _, name in spans
+    ]
+    assert unmapped == {"pg-new"}
+    assert matcher.marker == b""
+    assert ClassMatcher(["pg-button"]).marker == b"pg-"
+
+
+def test_class_matcher_only_matches_unprefixed_names_in_class_contexts():
+    matcher = ClassMatcher(["pg-button", "shadow", "rounded"])
+    content = textwrap.dedent(
+        """\
+        import { shadow } from "./theme";
+        const style = theme.shadow;
+        <p>A rounded corner casts a shadow, like pg-button.</p>
+        <a class="shadow pg-button" className={"rounded"}>
+        <div :class="{ rounded: isOpen }" data-class="shadow"></div>
+        el.classList.toggle("shadow", on); el.classList.contains("shadow");
+        """
+    )
+
+    spans, _ = matcher.scan(content)
+
+    assert [(content[:start].count("\n") + 1, name) for start, _, name in spans] == [
+        (3, "pg-button"),
+        (4, "shadow"),
+        (4, "pg-button"),
+        (4, "rounded"),
+        (5, "rounded"),
+        (6, "shadow"),
+    ]
+    assert list(matcher.finditer(content)) == spans
+    assert matcher.sub(str.upper, content) == apply_replacements(
+        content, spans, {name: name.upper() for name in matcher.names}
+    )
+
+
+def test_migrate_css_rules_leave_identifiers_and_text_alone(tmp_path, monkeypatch):
+    files = {
+        "templates/page.html": (
+            '<p>A rounded corner casts a shadow.</p>\n<a class="btn\n  shadow">\n'
+        ),
+        "apps/web/theme.js": (
+            'import { shadow } from "./theme";\n'
+            "const style = theme.shadow;\n"
+            'el.classList.add("rounded");\n'
+        ),
+    }
+    write_project(tmp_path, files)
+    (tmp_path / "rules.yaml").write_text("shadow: shadow-sm\nrounded: rounded-sm\n")
+    monkeypatch.chdir(tmp_path)
+    args = ["migrate-css", "--no-manifest", "--rules", "rules.yaml"]
+
+    diff = CliRunner().invoke(cli, [*args, "--diff", "-"])
+    result = CliRunner().invoke(cli, args)
+
+    assert result.exit_code == 0, result.output
+    assert "Updated 2 class references in 2 files" in result.output
+    assert (tmp_path / "templates" / "page.html").read_text() == (
+        '<p>A rounded corner casts a shadow.</p>\n<a class="btn\n  shadow-sm">\n'
+    )
+    assert (tmp_path / "apps" / "web" / "theme.js").read_text() == (
+        'import { shadow } from "./theme";\n'
+        "const style = theme.shadow;\n"
+        'el.classList.add("rounded-sm");\n'
+    )
+    added = [
+        line
+        for line in diff.stdout.splitlines()
+        if line.startswith("+") and not line.startswith("+++")
+    ]
+    assert added == ['+  shadow-sm">', '+el.classList.add("rounded-sm");']
+
+
+def test_migrate_large_file_keeps_class_contexts_whole(tmp_path):
+    large = tmp_path / "large.html"
+    large.write_text('<a class="btn\n  shadow">\nshadow\n' * 50)
+    matcher = ClassMatcher(["shadow"])
+
+    replacements, _ = migrate_large_file(
+        large, matcher, {"shadow": "shadow-sm"}, chunk_size=16
+    )
+
+    assert len(replacements) == 50
+    assert large.read_text() == '<a class="btn\n  shadow-sm">\nshadow\n' * 50
+
+
+def test_class_matcher_rejects_invalid_unprefixed_names():
+    with pytest.raises(ValueError):
+        ClassMatcher(["w-1.5"])
+
+
+def test_migrate_file(tmp_path):
+    css_file = write_project(
+        tmp_path,
+        {"templates/page.html": '<a class="pg-button pg-button-danger pg-unknown">'},
+    )
+    css_class_map = parse_tailwind_css(css_file)
+    page = tmp_path / "templates" / "page.html"
+
+    replacements, unmigrated = migrate_file(
+        page, build_pattern(css_class_map), css_class_map
+    )
+
+    assert replacements == [("pg-button", "btn"), ("pg-button-danger", "btn btn-error")]
+    assert unmigrated == {"pg-unknown"}
+    assert page.read_text() == '<a class="btn btn btn-error pg-unknown">'
+
+
+def test_migrate_file_dry_run(tmp_path):
+    css_file = write_project(tmp_path, {"templates/page.html": '<a class="pg-button">'})
+    css_class_map = parse_tailwind_css(css_file)
+    page = tmp_path / "templates" / "page.html"
+
+    replacements, _ = migrate_file(
+        page, build_pattern(css_class_map), css_class_map, dry_run=True
+    )
+
+    assert replacements == [("pg-button", "btn")]
+    assert page.read_text() == '<a class="pg-button">'
+
+
+@pytest.mark.parametrize(
+    "original, expected",
+    [
+        (b'<a class="pg-button">\r\n<b>\r\n', b'<a class="btn">\r\n<b>\r\n'),
+        (b'\xef\xbb\xbf<a class="pg-button">', b'\xef\xbb\xbf<a class="btn">'),
+        (b'<a title="caf\xe9" class="pg-button">', b'<a title="caf\xe9" class="btn">'),
+    ],
+)
+def test_migrate_file_preserves_encoding_and_newlines(tmp_path, original, expected):
+    page = tmp_path / "page.html"
+    page.write_bytes(original)
+    css_class_map = {"pg-button": "btn"}
+
+    migrate_file(page, build_pattern(css_class_map), css_class_map)
+
+    assert page.read_bytes() == expected
+
+
+@pytest.mark.parametrize("mmap_threshold", [1, migrate_css.MMAP_THRESHOLD])
+def test_migrate_file_skips_files_without_prefix(tmp_path, monkeypatch, mmap_threshold):
+    page = tmp_path / "page.html"
+    page.write_text('<a class="btn">')
+    monkeypatch.setattr(migrate_css, "MMAP_THRESHOLD", mmap_threshold)
+    monkeypatch.setattr(migrate_css, "decode", _fail_scan)
+    css_class_map = {"pg-button": "btn"}
+
+    assert migrate_file(page, build_pattern(css_class_map), css_class_map) == (
+        [],
+        set(),
+    )
+
+
+def test_migrate_file_memory_maps_large_files(tmp_path, monkeypatch):
+    page = tmp_path / "page.html"
+    page.write_text('<a class="pg-button">')
+    monkeypatch.setattr(migrate_css, "MMAP_THRESHOLD", 1)
+    css_class_map = {"pg-button": "btn"}
+
+    replacements, _ = migrate_file(page, build_pattern(css_class_map), css_class_map)
+
+    assert replacements == [("pg-button", "btn")]
+    assert page.read_text() == '<a class="btn">'
+
+
+LARGE_CONTENT = (
+    '<a class="pg-button pg-button-danger">\r\n'
+    '<p class="pg-text-muted pg-unknown-thing">caf\u00e9</p>\n'
+    "pg-button-pg-text-muted xpg-button"
+) * 20
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 64, 100_000])
+def test_migrate_large_file_matches_migrate_file(tmp_path, chunk_size):
+    css_class_map = parse_tailwind_css(write_project(tmp_path, {}))
+    matcher = build_pattern(css_class_map)
+    small = tmp_path / "small.html"
+    large = tmp_path / "large.html"
+    small.write_bytes(LARGE_CONTENT.encode())
+    large.write_bytes(LARGE_CONTENT.encode())
+
+    expected = migrate_file(small, matcher, css_class_map)
+    result = migrate_large_file(large, matcher, css_class_map, chunk_size=chunk_size)
+
+    assert result == expected
+    assert large.read_bytes() == small.read_bytes()
+    assert not list(tmp_path.glob(".large.html.*"))
+
+
+def test_migrate_large_file_dry_run_and_routing(tmp_path, monkeypatch):
+    page = tmp_path / "page.html"
+    page.write_bytes(b'<a class="pg-button" title="caf\xe9">')
+    monkeypatch.setattr(migrate_css, "STREAM_THRESHOLD", 1)
+    css_class_map = {"pg-button": "btn"}
+    matcher = build_pattern(css_class_map)
+
+    assert migrate_file(page, matcher, css_class_map, dry_run=True) == (
+        [("pg-button", "btn")],
+        set(),
+    )
+    assert page.read_bytes() == b'<a class="pg-button" title="caf\xe9">'
+
+    migrate_file(page, matcher, css_class_map)
+    assert page.read_bytes() == b'<a class="btn" title="caf\xe9">'
+
+
+def test_find_files_skips_styles_and_other_extensions(tmp_path):
+    write_project(
+        tmp_path,
+        {
+            "templates/b.html": "",
+            "templates/a.html": "",
+            "templates/notes.txt": "",
+            "assets/styles/site.js": "",
+        },
+    )
+
+    files = find_files((tmp_path / "templates", tmp_path / "assets"))
+
+    assert files == [
+        tmp_path / "templates" / "a.html",
+        tmp_path / "templates" / "b.html",
+    ]
+
+
+def test_migrate_files_parallel_matches_serial(tmp_path):
+    css_file = write_project(
+        tmp_path,
+        {
+            f"templates/page{i}.html": f'<a class="pg-button pg-missing-{i % 3}">'
+            for i in range(20)
+        },
+    )
+    css_class_map = parse_tailwind_css(css_file)
+    pattern = build_pattern(css_class_map)
+    files = find_files((tmp_path / "templates",))
+
+    serial = list(migrate_files(files, pattern, css_class_map, dry_run=True, jobs=1))
+    parallel = list(migrate_files(files, pattern, css_class_map, dry_run=True, jobs=4))
+
+    assert parallel == serial
+    assert [filepath for filepath, _, _, _ in parallel] == files
+
+
+def test_migrate_files_parallel_removes_unused_staged_files(tmp_path):
+    css_file = write_project(
+        tmp_path,
+        {f"templates/page{i}.html": '<a class="pg-button">' for i in range(200)},
+    )
+    css_class_map = parse_tailwind_css(css_file)
+    files = find_files((tmp_path / "templates",))
+
+    with Transaction(tmp_path / "journal") as transaction:
+        results = migrate_files(
+            files,
+            build_pattern(css_class_map),
+            css_class_map,
+            jobs=4,
+            transaction=transaction,
+        )
+        next(results)
+        results.close()
+        transaction.flush()
+
+    assert sorted(os.listdir(tmp_path / "templates")) == sorted(
+        path.name for path in files
+    )
+    migrated = [path for path in files if path.read_text() == '<a class="btn">']
+    assert migrated == [files[0]]
+
+
+def _run_with_manifest(tmp_path, css_class_map):
+    manifest_file = tmp_path / "manifest.json"
+    manifest = Manifest.load(manifest_file, css_class_map_fingerprint(css_class_map))
+    files = find_files((tmp_path / "templates",))
+    results = list(
+        migrate_files(
+            files, build_pattern(css_class_map), css_class_map, manifest=manifest
+        )
+    )
+    manifest.save()
+    return results
+
+
+def test_manifest_skips_unchanged_files(tmp_path, monkeypatch):
+    css_file = write_project(
+        tmp_path,
+        {"templates/clean.html": '<a class="btn pg-unknown">'},
+    )
+    css_class_map = parse_tailwind_css(css_file)
+    _run_with_manifest(tmp_path, css_class_map)
+
+    (tmp_path / "templates" / "clean.html").touch()
+    monkeypatch.setattr(migrate_css.ClassMatcher, "scan", _fail_scan)
+    second = _run_with_manifest(tmp_path, css_class_map)
+
+    assert second == [(tmp_path / "templates" / "clean.html", [], {"pg-unknown"}, None)]
+
+
+def test_manifest_invalidated_by_class_map_change(tmp_path):
+    css_file = write_project(tmp_path, {"templates/page.html": '<a class="pg-new">'})
+    css_class_map = parse_tailwind_css(css_file)
+    assert _run_with_manifest(tmp_path, css_class_map)[0][1] == []
+
+    css_class_map["pg-new"] = "badge"
+    results = _run_with_manifest(tmp_path, css_class_map)
+
+    assert results[0][1] == [("pg-new", "badge")]
+
+
+def test_migrate_css_command(tmp_path, monkeypatch):
+    write_project(
+        tmp_path,
+        {
+            "templates/page.html": '<a class="pg-button pg-unknown">',
+            "apps/web/static.js": 'el.className = "pg-text-muted";',
+        },
+    )
+    monkeypatch.chdir(tmp_path)
+
+    result = CliRunner().invoke(cli, ["migrate-css", "--jobs", "2"])
+
+    assert result.exit_code == 0, result.output
+    assert "Updated 2 class references in 2 files" in result.output
+    assert "pg-unknown (1 file)" in result.output
+    assert (tmp_path / "templates" / "page.html").read_text() == (
+        '<a class="btn pg-unknown">'
+    )
+
+
+def test_sniff_file(tmp_path):
+    files = {
+        "page.html": '<a class="pg-button">\n' * 2000,
+        "logo.js": "GIF89a\0pg-button",
+        "bundle.js": "var a=1;" * 4000,
+        "jquery.js": "/*! jQuery v3.7.1 | (c) OpenJS Foundation */\n"
+        + "var pg_button;\n" * 5000,
+        "app.js": "/*! my own helper, MIT */\nel.className = 'pg-button';\n",
+        "main.js": "/******/ (() => { // webpackBootstrap\n",
+    }
+    for name, content in files.items():
+        (tmp_path / name).write_text(content)
+
+    assert [sniff_file(tmp_path / name) for name in files] == [
+        None,
+        "binary",
+        "minified",
+        "vendored",
+        None,
+        "vendored",
+    ]
+
+
+def test_migrate_css_skips_sniffed_files(tmp_path, monkeypatch):
+    write_project(
+        tmp_path,
+        {
+            "templates/page.html": '<a class="pg-button">',
+            "assets/javascript/vendor.js": (
+                '__webpack_require__(1);\nel.className = "pg-button";'
+            ),
+            "assets/javascript/app.js": '/*! mine */\nel.className = "pg-button";',
+        },
+    )
+    monkeypatch.chdir(tmp_path)
+
+    result = CliRunner().invoke(cli, ["migrate-css", "--dry-run"])
+    assert result.exit_code == 0, result.output
+    assert not (tmp_path / ".pegasus").exists()
+    assert "skipped assets/javascript/vendor.js (vendored)" in result.output
+    assert "Would update 2 class references in 2 files" in result.output
+    assert "Skipped 1 file (1 vendored)." in result.output
+
+    result = CliRunner().invoke(
+        cli, ["migrate-css", "--dry-run", "--report", "json", "--no-manifest"]
+    )
+    assert json.loads(result.stdout)["summary"]["skipped_by_reason"] == {"vendored": 1}
+
+    result = CliRunner().invoke(
+        cli, ["migrate-css", "--always-migrate", "assets/javascript/*"]
+    )
+    assert result.exit_code == 0, result.output
+    assert "Updated 3 class references in 3 files" in result.output
+    assert "Skipped" not in result.output
+
+
+def test_shard_files_partitions_files():
+    files = [Path(f"templates/page{i}.html") for i in range(100)]
+
+    shards = [shard_files(files, index, 3) for index in (1, 2, 3)]
+
+    assert sorted((f for shard in shards for f in shard), key=files.index) == files
+    assert all(shards)
+    assert shard_files(files[:50], 2, 3) == [f for f in shards[1] if f in files[:50]]
+
+
+def test_migrate_css_merge_sharded_reports(tmp_path, monkeypatch):
+    write_project(
+        tmp_path,
+        {
+            f"templates/page{i}.html": f'<a class="pg-button pg-missing-{i % 3}">'
+            for i in range(20)
+        },
+    )
+    monkeypatch.chdir(tmp_path)
+    args = ["migrate-css", "--dry-run", "--no-manifest", "--report", "json"]
+
+    single = CliRunner().invoke(cli, args)
+    for index in (1, 2, 3):
+        result = CliRunner().invoke(cli, [*args, "--shard", f"{index}/3"])
+        assert result.exit_code == 0, result.output
+        assert json.loads(result.stdout)["summary"]["shard"] == f"{index}/3"
+        (tmp_path / f"shard{index}.json").write_text(result.stdout)
+    merged = CliRunner().invoke(
+        cli,
+        ["migrate-css", "--merge-reports", "--report", "json"]
+        + [f"shard{index}.json" for index in (1, 2, 3)],
+    )
+
+    assert merged.exit_code == 0, merged.output
+    expected = json.loads(single.stdout)
+    report = json.loads(merged.stdout)
+    assert report["summary"] == expected["summary"]
+    assert sorted(report["files"], key=lambda r: r["path"]) == sorted(
+        expected["files"], key=lambda r: r["path"]
+    )
+
+    text = CliRunner().invoke(
+        cli, ["migrate-css", "--merge-reports", "shard1.json", "shard3.json"]
+    )
+    assert text.exit_code == 1
+    assert "Missing reports for shards 2/3" in text.output
+
+
+def test_migrate_css_invalid_shard(tmp_path, monkeypatch):
+    write_project(tmp_path, {})
+    monkeypatch.chdir(tmp_path)
+
+    result = CliRunner().invoke(cli, ["migrate-css", "--shard", "4/3"])
+
+    assert result.exit_code == 2
+    assert "'4/3' is not a valid shard" in result.output
+
+
+def test_migrate_css_rollback(tmp_path, monkeypatch):
+    write_project(tmp_path, {"templates/page.html": '<a class="pg-button">'})
+    monkeypatch.chdir(tmp_path)
+    page = tmp_path / "templates" / "page.html"
+
+    result = CliRunner().invoke(cli, ["migrate-css", "--rollback"])
+    assert result.exit_code == 1
+    assert "There is no migration to roll back" in result.output
+
+    result = CliRunner().invoke(cli, ["migrate-css"])
+    assert result.exit_code == 0, result.output
+    assert page.read_text() == '<a class="btn">'
+    assert os.listdir(page.parent) == ["page.html"]
+
+    # A run that changes nothing doesn't replace the journal
+    result = CliRunner().invoke(cli, ["migrate-css", "--no-manifest"])
+    assert result.exit_code == 0, result.output
+
+    result = CliRunner().invoke(cli, ["migrate-css", "--rollback"])
+    assert result.exit_code == 0, result.output
+    assert "Restored 1 file." in result.output
+    assert page.read_text() == '<a class="pg-button">'
+
+
+def test_migrate_css_rules(tmp_path, monkeypatch):
+    write_project(
+        tmp_path,
+        {
+            "templates/page.html": (
+                '<a class="pg-button btn-ghost input-bordered hover:shadow-sm">'
+            ),
+        },
+    )
+    (tmp_path / "daisyui.yaml").write_text(
+        "name: daisyui-5\nrenames:\n  btn-ghost: btn-soft\n  input-bordered: null\n"
+    )
+    (tmp_path / "tailwind4.json").write_text('{"shadow-sm": "shadow-xs"}')
+    monkeypatch.chdir(tmp_path)
+
+    result = CliRunner().invoke(
+        cli,
+        ["migrate-css", "--rules", "daisyui.yaml", "--rules", "tailwind4.json"],
+    )
+
+    assert result.exit_code == 0, result.output
+    assert "Loaded 2 class mappings from daisyui.yaml" in result.output
+    assert "Updated 4 class references in 1 files" in result.output
+    assert "  pegasus: 1\n  daisyui-5: 2\n  tailwind4: 1\n" in result.output
+    assert (tmp_path / "templates" / "page.html").read_text() == (
+        '<a class="btn btn-soft  hover:shadow-xs">'
+    )
+
+    result = CliRunner().invoke(
+        cli,
+        ["migrate-css", "--report", "json", "--rules", "tailwind4.json"],
+    )
+    assert json.loads(result.stdout)["summary"]["replacements_by_ruleset"] == {
+        "pegasus": 0,
+        "tailwind4": 0,
+    }
+
+
+def test_migrate_css_rules_only_report(tmp_path, monkeypatch):
+    css_file = write_project(tmp_path, {"templates/page.html": '<a class="pg-card">'})
+    css_file.unlink()
+    (tmp_path / "tailwind4.json").write_text('{"shadow-sm": "shadow-xs"}')
+    monkeypatch.chdir(tmp_path)
+    args = ["migrate-css", "--dry-run", "--no-manifest", "--rules", "tailwind4.json"]
+
+    result = CliRunner().invoke(cli, args)
+    shard = CliRunner().invoke(cli, [*args, "--report", "json", "--shard", "1/1"])
+    (tmp_path / "shard.json").write_text(shard.stdout)
+    merged = CliRunner().invoke(cli, ["migrate-css", "--merge-reports", "shard.json"])
+
+    assert result.exit_code == 0, result.output
+    assert "No classes from tailwind4.json found to migrate." in result.output
+    assert "with no mapping in tailwind4.json." in result.output
+    assert "pg- CSS classes" not in result.output
+    assert "tailwind.css" not in result.output
+    assert merged.exit_code == 0, merged.output
+    assert result.output.endswith(merged.output)
+
+
+def test_migrate_css_rules_conflict(tmp_path, monkeypatch):
+    write_project(tmp_path, {})
+    (tmp_path / "rules.json").write_text('{"pg-button": "btn-primary"}')
+    monkeypatch.chdir(tmp_path)
+
+    result = CliRunner().invoke(cli, ["migrate-css", "--rules", "rules.json"])
+
+    assert result.exit_code == 1
+    assert "Conflicting rules: 'pg-button' is renamed to 'btn'" in result.output
+
+
+@pytest.mark.skipif(shutil.which("git") is None, reason="needs git")
+def test_migrate_css_diff_applies_with_git(tmp_path, monkeypatch):
+    files = {
+        "templates/page.html": "<div>\n" * 10 + '<a class="pg-button">\n',
+        "apps/web/page.js": 'x = "pg-text-muted";\r\ny = "caf\xe9";',
+        "templates/clean.html": '<a class="btn">',
+    }
+    write_project(tmp_path, {})
+    for name, content in files.items():
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(content.encode("latin-1"))
+    monkeypatch.chdir(tmp_path)
+
+    result = CliRunner().invoke(cli, ["migrate-css", "--diff", "--report", "summary"])
+    file_result = CliRunner().invoke(cli, ["migrate-css", "--diff", "changes.patch"])
+
+    assert result.exit_code == 0, result.output
+    assert "Would update 2 class references in 2 files" in result.stderr
+    assert result.stdout_bytes.startswith(b"diff --git a/templates/page.html")
+    assert "[dry run] templates/page.html" in file_result.output
+    assert (tmp_path / "changes.patch").read_bytes() == result.stdout_bytes
+    for name, content in files.items():
+        assert (tmp_path / name).read_bytes() == content.encode("latin-1")
+
+    subprocess.run(["git", "init", "-q"], check=True)
+    subprocess.run(["git", "apply", "changes.patch"], check=True)
+    assert (
+        (tmp_path / "templates" / "page.html").read_text().endswith('<a class="btn">\n')
+    )
+    assert (tmp_path / "apps" / "web" / "page.js").read_bytes() == (
+        'x = "text-base-content/70";\r\ny = "caf\xe9";'.encode("latin-1")
+    )
+
+
+def test_migrate_css_explicit_paths(tmp_path, monkeypatch):
+    write_project(
+        tmp_path,
+        {
+            "templates/page.html": '<a class="pg-button">',
+            "templates/other.html": '<a class="pg-button">',
+            "templates/node_modules/lib.js": '"pg-button"',
+            "docs/page.html": '<a class="pg-button">',
+        },
+    )
+    monkeypatch.chdir(tmp_path)
+
+    result = CliRunner().invoke(
+        cli,
+        [
+            "migrate-css",
+            "--dry-run",
+            "templates/page.html",
+            "templates/node_modules/lib.js",
+            "docs/page.html",
+            "assets/styles/pegasus/tailwind.css",
+        ],
+    )
+
+    assert result.exit_code == 0, result.output
+    assert "Would update 1 class references in 1 files" in result.output
+    assert "[dry run] templates/page.html" in result.output
+
+
+@pytest.mark.skipif(shutil.which("git") is None, reason="git is not installed")
+def test_migrate_css_since(tmp_path, monkeypatch):
+    write_project(
+        tmp_path,
+        {
+            "templates/committed.html": '<a class="pg-button">',
+            "templates/changed.html": '<a class="btn">',
+        },
+    )
+    monkeypatch.chdir(tmp_path)
+    git = ["git", "-c", "user.name=Test", "-c", "user.email=test@example.com"]
+    subprocess.run([*git, "init", "-q"], check=True)
+    subprocess.run([*git, "add", "."], check=True)
+    subprocess.run([*git, "commit", "-q", "-m", "Initial"], check=True)
+    (tmp_path / "templates" / "changed.html").write_text('<a class="pg-button">')
+    (tmp_path / "templates" / "new.html").write_text('<a class="pg-button">')
+
+    result = CliRunner().invoke(cli, ["migrate-css", "--dry-run", "--since", "HEAD"])
+    bad_ref = CliRunner().invoke(cli, ["migrate-css", "--since", "no-such-ref"])
+    option_ref = CliRunner().invoke(cli, ["migrate-css", "--since=--output=out.txt"])
+
+    assert result.exit_code == 0, result.output
+    assert "Would update 2 class references in 2 files" in result.output
+    assert "committed.html" not in result.output
+    assert bad_ref.exit_code == 1
+    assert "'no-such-ref' is not a commit in this repository" in bad_ref.output
+    assert option_ref.exit_code == 1
+    assert "'--output=out.txt' is not a commit" in option_ref.output
+    assert not (tmp_path / "out.txt").exists()
+
+
+def test_migrate_css_diff_and_watch_are_exclusive(tmp_path, monkeypatch):
+    write_project(tmp_path, {})
+    monkeypatch.chdir(tmp_path)
+
+    result = CliRunner().invoke(cli, ["migrate-css", "--diff", "--watch"])
+
+    assert result.exit_code == 2
+    assert "--diff can't be used with --watch" in result.output
+
+
+REPORT_FILES = {
+    "templates/page.html": '<a class="pg-button pg-button pg-unknown">',
+    "templates/other.html": '<a class="pg-unknown">',
+}
+
+
+def test_migrate_css_text_report_aggregates_classes(tmp_path, monkeypatch):
+    write_project(tmp_path, REPORT_FILES)
+    monkeypatch.chdir(tmp_path)
+
+    result = CliRunner().invoke(cli, ["migrate-css", "--dry-run", "-j", "1"])
+    verbose = CliRunner().invoke(cli, ["migrate-css", "--dry-run", "-j", "1", "-v"])
+
+    assert "    pg-button -> btn (x2)\n" in result.output
+    assert verbose.output.count("    pg-button -> btn\n") == 2
+
+
+def test_migrate_css_unmigrated_examples(tmp_path, monkeypatch):
+    write_project(
+        tmp_path,
+        {f"templates/page{i}.html": '<a class="pg-unknown">' for i in range(5)},
+    )
+    monkeypatch.chdir(tmp_path)
+
+    result = CliRunner().invoke(
+        cli,
+        ["migrate-css", "--dry-run", "-v", "--unmigrated-paths", "unmigrated.tsv"],
+    )
+
+    assert result.exit_code == 0, result.output
+    assert (
+        "  pg-unknown (5 files)\n"
+        "    templates/page0.html\n"
+        "    templates/page1.html\n"
+        "    templates/page2.html\n"
+        "    ... and 2 more\n"
+    ) in result.output
+    assert (tmp_path / "unmigrated.tsv").read_text().splitlines() == [
+        f"pg-unknown\ttemplates/page{i}.html" for i in range(5)
+    ]
+
+
+def test_migrate_css_profile(tmp_path, monkeypatch):
+    write_project(tmp_path, REPORT_FILES)
+    monkeypatch.chdir(tmp_path)
+
+    result = CliRunner().invoke(cli, ["migrate-css", "--profile", "-j", "1"])
+    json_result = CliRunner().invoke(
+        cli, ["migrate-css", "--dry-run", "--profile", "--report", "json"]
+    )
+
+    assert result.exit_code == 0, result.output
+    assert "Profile (" in result.stderr
+    for phase in ("css parse", "pattern build", "walk", "read", "match", "write"):
+        assert f"  {phase} " in result.stderr
+    assert "Slowest files:" in result.stderr
+    profile = json.loads(json_result.stderr.splitlines()[-1])["profile"]
+    assert profile["bytes_read"] > 0
+    assert profile["bytes_written"] == 0
+    assert {entry["path"] for entry in profile["slowest_files"]} <= {
+        "templates/page.html",
+        "templates/other.html",
+    }
+
+
+def test_migrate_css_json_report(tmp_path, monkeypatch):
+    write_project(tmp_path, REPORT_FILES)
+    monkeypatch.chdir(tmp_path)
+
+    result = CliRunner().invoke(cli, ["migrate-css", "--dry-run", "--report", "json"])
+
+    assert result.exit_code == 0, result.output
+    report = json.loads(result.stdout)
+    assert report["files"] == [
+        {
+            "path": "templates/other.html",
+            "replacements": 0,
+            "classes": {},
+            "unmigrated": ["pg-unknown"],
+        },
+        {
+            "path": "templates/page.html",
+            "replacements": 2,
+            "classes": {"pg-button": {"to": "btn", "count": 2}},
+            "unmigrated": ["pg-unknown"],
+        },
+    ]
+    assert report["summary"] == {
+        "css_file": "assets/styles/pegasus/tailwind.css",
+        "dry_run": True,
+        "total_files": 1,
+        "total_replacements": 2,
+        "unmigrated_by_class": {"pg-unknown": 2},
+    }
+
+
+def test_migrate_css_ndjson_and_summary_reports(tmp_path, monkeypatch):
+    write_project(tmp_path, REPORT_FILES)
+    monkeypatch.chdir(tmp_path)
+
+    ndjson = CliRunner().invoke(cli, ["migrate-css", "--dry-run", "--report", "ndjson"])
+    summary = CliRunner().invoke(
+        cli, ["migrate-css", "--dry-run", "--report", "summary"]
+    )
+
+    records = [json.loads(line) for line in ndjson.stdout.splitlines()]
+    assert [record["type"] for record in records] == ["file", "file", "summary"]
+    assert records[-1]["total_replacements"] == 2
+    assert "templates/page.html" not in summary.output
+    assert "Would update 2 class references in 1 files" in summary.output
+
+
+class FakeWatcher:
+    def __init__(self, batches):
+        self.batches = list(batches)
+        self.closed = False
+
+    def wait_for_changes(self):
+        if not self.batches:
+            raise KeyboardInterrupt
+        return self.batches.pop(0)()
+
+    def ignore_writes(self, paths):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+def test_migrate_css_watch(tmp_path, monkeypatch):
+    css_file = write_project(tmp_path, {"templates/page.html": "<p>"})
+    monkeypatch.chdir(tmp_path)
+    page = Path("templates/page.html")
+
+    def edit_page():
+        page.write_text('<a class="pg-button pg-new">')
+        return {page}
+
+    def edit_css():
+        css_file.write_text(TAILWIND_CSS + ".pg-new {\n  @apply badge;\n}\n")
+        return {Path("assets/styles/pegasus/tailwind.css")}
+
+    watcher = FakeWatcher([edit_page, edit_css])
+    monkeypatch.setattr(migrate_css, "create_watcher", lambda *a, **kw: watcher)
+
+    result = CliRunner().invoke(cli, ["migrate-css", "--watch", "-j", "1"])
+
+    assert result.exit_code == 0, result.output
+    assert "pg-button -> btn" in result.output
+    assert "Loaded 4 class mappings" in result.output
+    assert "pg-new -> badge" in result.output
+    assert page.read_text() == '<a class="btn badge">'
+    assert watcher.closed
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="needs inotify")
+def test_migrate_css_watch_ignores_its_own_writes(tmp_path, monkeypatch):
+    write_project(tmp_path, {"templates/page.html": "<p>"})
+    monkeypatch.chdir(tmp_path)
+    page = Path("templates/page.html")
+    waits = []
+
+    class EditingWatcher(InotifyWatcher):
+        def wait_for_changes(self):
+            if not waits:
+                waits.append(None)
+                page.write_text('<a class="pg-button">')
+                return super().wait_for_changes(debounce=0.05, timeout=5)
+            # Only the command's own write has happened since the last run
+            waits.append(super().wait_for_changes(debounce=0.05, timeout=0.5))
+            raise KeyboardInterrupt
+
+    monkeypatch.setattr(migrate_css, "create_watcher", EditingWatcher)
+
+    result = CliRunner().invoke(cli, ["migrate-css", "--watch", "-j", "1"])
+
+    assert result.exit_code == 0, result.output
+    assert page.read_text() == '<a class="btn">'
+    assert waits == [None, set()]
+    assert "Updated 1 class references in 1 files" in result.output
+    # Only the first run, before the edit, finds nothing
+    assert result.output.count("No pg- CSS classes found to migrate.") == 1
@@ -0,0 +1,28 @@
+from pathlib import Path
+
+from pegasus_cli.profiling import Profile, new_file_stats
+
+
+def test_profile_keeps_slowest_files():
+    profile = Profile(slowest=2)
+    for i, seconds in enumerate([0.3, 0.1, 0.5, 0.2]):
+        stats = new_file_stats()
+        stats["read"] = seconds
+        stats["bytes_read"] = 100
+        if i == 0:
+            stats["match"] = 0.1
+        profile.add_file(Path(f"page{i}.html"), stats)
+    with profile.phase("walk"):
+        pass
+
+    data = profile.to_dict()
+
+    assert list(data["phases"]) == ["walk", "read", "match"]
+    assert data["phases"]["read"]["count"] == 4
+    assert data["phases"]["match"]["count"] == 1
+    assert data["bytes_read"] == 400
+    assert [entry["path"] for entry in data["slowest_files"]] == [
+        "page2.html",
+        "page0.html",
+    ]
+    assert "  Read 400 B, wrote 0 B" in profile.format()
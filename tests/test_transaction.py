@@ -0,0 +1,76 @@
+import os
+
+import pytest
+
+from pegasus_cli.transaction import Transaction, TransactionError, rollback
+
+
+def _stage(path, content):
+    staged = path.with_name(f".{path.name}.tmp")
+    staged.write_text(content)
+    return str(staged)
+
+
+def test_transaction_swaps_files_in_batches_and_rolls_back(tmp_path):
+    paths = [tmp_path / f"file{i}.html" for i in range(5)]
+    for path in paths:
+        path.write_text("old")
+    journal_dir = tmp_path / "journal"
+
+    with Transaction(journal_dir, batch_size=2) as transaction:
+        for path in paths:
+            transaction.add(path, _stage(path, "new"))
+        transaction.flush()
+        assert all(path.read_text() == "new" for path in paths)
+        # The same file can be changed twice in one transaction
+        transaction.add(paths[0], _stage(paths[0], "newer"))
+
+    assert paths[0].read_text() == "newer"
+    assert transaction.files_written == 6
+    assert sorted(os.listdir(tmp_path)) == sorted(
+        ["journal"] + [path.name for path in paths]
+    )
+
+    assert rollback(journal_dir) == 6
+    assert all(path.read_text() == "old" for path in paths)
+    assert not journal_dir.exists()
+    with pytest.raises(FileNotFoundError):
+        rollback(journal_dir)
+
+
+def test_transaction_discards_staged_files_on_error(tmp_path):
+    path = tmp_path / "page.html"
+    path.write_text("old")
+    journal_dir = tmp_path / "journal"
+
+    with pytest.raises(RuntimeError), Transaction(journal_dir) as transaction:
+        transaction.add(path, _stage(path, "new"))
+        raise RuntimeError
+
+    assert path.read_text() == "old"
+    assert sorted(os.listdir(tmp_path)) == ["page.html"]
+
+
+def test_transaction_without_changes_keeps_previous_journal(tmp_path):
+    path = tmp_path / "page.html"
+    path.write_text("old")
+    journal_dir = tmp_path / "journal"
+    with Transaction(journal_dir) as transaction:
+        transaction.add(path, _stage(path, "new"))
+
+    with Transaction(journal_dir) as transaction:
+        transaction.flush()
+
+    assert rollback(journal_dir) == 1
+    assert path.read_text() == "old"
+
+
+def test_transaction_reports_write_errors(tmp_path):
+    missing = tmp_path / "missing" / "page.html"
+    transaction = Transaction(tmp_path / "journal")
+    transaction.begin()
+    transaction.add(missing, str(tmp_path / "staged.tmp"))
+
+    with pytest.raises(TransactionError):
+        transaction.flush()
+    transaction.close(discard=True)
@@ -0,0 +1,29 @@
+from pegasus_cli.unidiff import unified_diff
+
+
+def diff(old, new, context=1):
+    pairs = zip(old.encode().splitlines(True), new.encode().splitlines(True))
+    return b"".join(unified_diff("f.txt", pairs, context=context)).decode()
+
+
+def test_unified_diff_groups_hunks():
+    old = "a\nb\nc\nd\ne\nf\ng\n"
+    new = "A\nb\nC\nd\ne\nf\nG\n"
+
+    assert diff(old, new) == (
+        "diff --git a/f.txt b/f.txt\n"
+        "--- a/f.txt\n"
+        "+++ b/f.txt\n"
+        "@@ -1,4 +1,4 @@\n"
+        "-a\n+A\n b\n-c\n+C\n d\n"
+        "@@ -6,2 +6,2 @@\n"
+        " f\n-g\n+G\n"
+    )
+
+
+def test_unified_diff_without_changes_or_final_newline():
+    assert diff("a\nb", "a\nb") == ""
+    assert diff("a\nb", "a\nB").endswith(
+        "@@ -1,2 +1,2 @@\n a\n-b\n\\ No newline at end of file\n"
+        "+B\n\\ No newline at end of file\n"
+    )
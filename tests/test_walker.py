@@ -0,0 +1,92 @@
+from pathlib import Path
+
+from pegasus_cli.walker import IgnoreRules, walk_files
+
+EXTENSIONS = {".html", ".js"}
+
+
+def make_tree(root, names):
+    for name in names:
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("")
+
+
+def test_walk_files_filters_and_prunes(tmp_path):
+    make_tree(
+        tmp_path,
+        [
+            "b.html",
+            "a.js",
+            "notes.txt",
+            "sub/c.html",
+            "node_modules/pkg/index.js",
+            ".git/hooks/x.js",
+            "static/app.js",
+        ],
+    )
+
+    files = list(walk_files(tmp_path, EXTENSIONS))
+
+    assert files == [
+        tmp_path / "a.js",
+        tmp_path / "b.html",
+        tmp_path / "sub" / "c.html",
+    ]
+
+
+def test_walk_files_custom_excludes(tmp_path):
+    make_tree(tmp_path, ["keep.html", "vendor/lib.js", "skip.min.js"])
+
+    files = list(walk_files(tmp_path, EXTENSIONS, excludes=("vendor", "*.min.js")))
+
+    assert files == [tmp_path / "keep.html"]
+
+
+def test_walk_files_honours_gitignore(tmp_path):
+    make_tree(
+        tmp_path,
+        [
+            "generated/out.js",
+            "keep.js",
+            "debug.js",
+            "sub/build.js",
+            "sub/local/only.html",
+            "sub/local/keep.html",
+        ],
+    )
+    (tmp_path / ".gitignore").write_text("generated/\n# comment\ndebug.js\n")
+    (tmp_path / "sub" / ".gitignore").write_text(
+        "/build.js\nlocal/*\n!local/keep.html\n"
+    )
+
+    files = list(walk_files(tmp_path, EXTENSIONS))
+
+    assert files == [
+        tmp_path / "keep.js",
+        tmp_path / "sub" / "local" / "keep.html",
+    ]
+    assert len(list(walk_files(tmp_path, EXTENSIONS, use_gitignore=False))) == 6
+
+
+def test_walk_files_uses_gitignore_above_search_dir(tmp_path, monkeypatch):
+    make_tree(tmp_path, ["templates/page.html", "templates/generated/page.html"])
+    (tmp_path / ".gitignore").write_text("templates/generated\n")
+    monkeypatch.chdir(tmp_path)
+
+    files = list(walk_files(Path("templates"), EXTENSIONS))
+
+    assert files == [Path("templates/page.html")]
+
+
+def test_ignore_rules_patterns():
+    rules = IgnoreRules("/repo", ["*.log", "/root.js", "docs/**/draft.html", "out/"])
+
+    assert rules.match("/repo/a/b/debug.log", False) is True
+    assert rules.match("/repo/root.js", False) is True
+    assert rules.match("/repo/sub/root.js", False) is None
+    assert rules.match("/repo/docs/a/b/draft.html", False) is True
+    assert rules.match("/repo/docs/draft.html", False) is True
+    assert rules.match("/repo/out", True) is True
+    assert rules.match("/repo/out", False) is None
+    assert rules.match("/elsewhere/debug.log", False) is None
@@ -0,0 +1,102 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+from pegasus_cli.watch import InotifyWatcher, PollingWatcher, create_watcher
+
+EXTENSIONS = {".html"}
+
+
+def make_tree(root):
+    (root / "templates" / "sub").mkdir(parents=True)
+    (root / "templates" / "page.html").write_text("one")
+    (root / "templates" / "sub" / "other.html").write_text("one")
+    (root / "templates" / "notes.txt").write_text("one")
+    (root / "tailwind.css").write_text(".pg-a { @apply a; }")
+
+
+def watcher_classes():
+    classes = [PollingWatcher]
+    if sys.platform.startswith("linux"):
+        classes.append(InotifyWatcher)
+    return classes
+
+
+@pytest.mark.parametrize("watcher_class", watcher_classes())
+def test_watcher_reports_changed_files(tmp_path, watcher_class):
+    make_tree(tmp_path)
+    kwargs = {"interval": 0.01} if watcher_class is PollingWatcher else {}
+    watcher = watcher_class(
+        [tmp_path / "templates"],
+        EXTENSIONS,
+        extra_files=[tmp_path / "tailwind.css"],
+        **kwargs,
+    )
+    try:
+        assert watcher.wait_for_changes(debounce=0.05, timeout=0.05) == set()
+
+        (tmp_path / "templates" / "sub" / "other.html").write_text("two")
+        (tmp_path / "templates" / "notes.txt").write_text("two")
+        (tmp_path / "tailwind.css").write_text(".pg-b { @apply b; }")
+
+        changed = watcher.wait_for_changes(debounce=0.2, timeout=5)
+    finally:
+        watcher.close()
+
+    assert changed == {
+        tmp_path / "templates" / "sub" / "other.html",
+        tmp_path / "tailwind.css",
+    }
+
+
+@pytest.mark.parametrize("watcher_class", watcher_classes())
+def test_watcher_ignores_own_writes(tmp_path, watcher_class):
+    make_tree(tmp_path)
+    kwargs = {"interval": 0.01} if watcher_class is PollingWatcher else {}
+    watcher = watcher_class([tmp_path / "templates"], EXTENSIONS, **kwargs)
+    page = tmp_path / "templates" / "page.html"
+    try:
+        staged = tmp_path / "templates" / ".page.html.tmp"
+        staged.write_text("migrated")
+        os.replace(staged, page)
+        watcher.ignore_writes([page])
+        assert watcher.wait_for_changes(debounce=0.05, timeout=0.3) == set()
+
+        page.write_text("edited")
+        changed = watcher.wait_for_changes(debounce=0.05, timeout=5)
+    finally:
+        watcher.close()
+
+    assert changed == {page}
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="needs inotify")
+def test_inotify_watcher_picks_up_new_directories(tmp_path):
+    make_tree(tmp_path)
+    watcher = InotifyWatcher([tmp_path / "templates"], EXTENSIONS)
+    try:
+        new_dir = tmp_path / "templates" / "new"
+        new_dir.mkdir()
+        watcher.wait_for_changes(debounce=0.05, timeout=5)
+        (new_dir / "page.html").write_text("new")
+
+        changed = watcher.wait_for_changes(debounce=0.05, timeout=5)
+    finally:
+        watcher.close()
+
+    assert changed == {Path(new_dir / "page.html")}
+
+
+def test_create_watcher_falls_back_to_polling(tmp_path, monkeypatch):
+    make_tree(tmp_path)
+
+    def unavailable(*args, **kwargs):
+        raise OSError("no inotify")
+
+    monkeypatch.setattr(InotifyWatcher, "__init__", unavailable)
+
+    watcher = create_watcher([tmp_path / "templates"], EXTENSIONS)
+
+    assert isinstance(watcher, PollingWatcher)